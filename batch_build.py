@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+batch_build.py — Build many voice packs in one run from a manifest.
+
+Every prompt of every pack goes through one shared worker pool, so cores
+stay busy until the last pack is done instead of idling at the end of
+each build. Work is ordered by voice model: each worker loads a model
+when it first needs it and keeps it until it moves on to the next one,
+so a model is loaded at most once per worker. A text that appears in
+several packs with the same model (e.g. the same prompts built as 501
+and 502) is synthesized once; with --sentence-gap-ms so is every
+sentence shared by prompts of the same model. Each ZIP is written as soon
+as its last prompt is ready, and an index.json lists every ZIP with its
+MD5 and size.
+
+Manifest (JSON; relative paths are resolved against the manifest's folder):
+
+    {
+      "defaults": {"chime_src": "stock/en_us_female.zip", "pack_version": 17},
+      "packs": [
+        {"name": "data-male", "voice_model": "models/en_US-data.onnx",
+         "prompts": "examples/prompts/data_star_trek.json", "pack_id": 502},
+        {"name": "data-female", "voice_model": "models/en_US-data.onnx",
+         "prompts": "examples/prompts/data_star_trek.json", "pack_id": 501}
+      ]
+    }
+
+Each pack needs `name` and `voice_model`; `prompts`, `pack_id`,
+`pack_version` and `chime_src` fall back to "defaults" and then to the
+build_voice_pack.py defaults. `chime_src` is an official voice pack ZIP or
+a directory of chime MP3s, as with --chime-src. ZIPs are written to
+<out-dir>/<name>/<voice folder>.zip.
+
+Usage:
+    python3 batch_build.py release.json --out-dir /srv/voice --jobs 0 \\
+        --base-url http://192.168.1.100
+
+Requirements:
+    pip install piper-tts
+    apt install ffmpeg  (or brew install ffmpeg)
+"""
+
+import argparse
+import collections
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import tracing
+from build_voice_pack import (
+    DEFAULT_CACHE_DIR, ENCODERS, MP3_BITRATE_KBPS, VOICE_PACK_NAMES, AudioPost,
+    ChimeSource, DedupStats, SynthesisCache, add_ort_arguments, add_postprocess_arguments,
+    check_chimes, import_piper, lameenc, load_prompts, np, session_settings, synthesize_unique,
+    trim_saving, trim_summary, write_pack_zip,
+)
+
+# Anchored to this script, not the working directory, like the manifest's own paths
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'examples', 'prompts', 'data_star_trek.json')
+PACK_NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+# ---------------------------------------------------------------------------
+# Manifest
+# ---------------------------------------------------------------------------
+
+def load_manifest(path: str) -> list[dict]:
+    """Load and validate a batch manifest. Raises ValueError on bad entries."""
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', {})
+
+    def resolve(p):
+        return os.path.normpath(os.path.join(base, p)) if p else None
+
+    packs = []
+    names = set()
+    for n, entry in enumerate(manifest.get('packs', []), 1):
+        row = {**defaults, **entry}
+        missing = [k for k in ('name', 'voice_model') if not row.get(k)]
+        if missing:
+            raise ValueError(f"{path}: pack {n} is missing {', '.join(missing)}")
+        name = str(row['name'])
+        if not PACK_NAME_RE.match(name):
+            raise ValueError(f"{path}: pack {n} name {name!r} is not a valid folder name")
+        if name in names:
+            raise ValueError(f"{path}: pack name {name!r} is used twice")
+        names.add(name)
+        pack_id = int(row.get('pack_id', 502))
+        packs.append({
+            'name':         name,
+            'voice_model':  resolve(row['voice_model']),
+            'prompts':      resolve(row.get('prompts')) or DEFAULT_PROMPTS,
+            'chime_src':    resolve(row.get('chime_src')),
+            'pack_id':      pack_id,
+            'pack_version': int(row.get('pack_version', 16)),
+            'voice_name':   VOICE_PACK_NAMES.get(pack_id, f'custom_{pack_id}'),
+        })
+    if not packs:
+        raise ValueError(f"{path}: no packs listed")
+    return packs
+
+
+# ---------------------------------------------------------------------------
+# Batch build
+# ---------------------------------------------------------------------------
+
+class BatchBuild:
+    """
+    Schedules the prompts of many packs and writes each ZIP once complete.
+
+    Synthesized audio is keyed on (model, text) and held in memory only
+    until every pack that uses it has been written. With `sentence_gap_ms`
+    set, each distinct sentence is synthesized once per model and prompts
+    are assembled from the fragments, as with build_voice_pack.py
+    --sentence-gap-ms.
+    """
+
+    def __init__(self, packs: list[dict], out_dir: str, encoder: str, cache_dir: str | None,
+                 cache_bytes: int, keep_files: bool = False, post: AudioPost | None = None,
+                 session: dict | None = None, sentence_gap_ms: float | None = None):
+        self.packs = packs
+        self.out_dir = out_dir
+        self.encoder = encoder
+        self.keep_files = keep_files
+        self.post = post
+        self.session = session
+        self.sentence_gap_ms = sentence_gap_ms
+        self.dedup = DedupStats()
+        self.trimmed = 0.0  # seconds removed by post-processing
+        self.caches = {}   # model -> SynthesisCache
+        self.audio = {}    # (model, text) -> mp3, for keys still needed by an unwritten pack
+        self.users = collections.defaultdict(set)  # (model, text) -> indexes of unwritten packs
+        self.waiting = {}  # pack index -> keys not yet synthesized
+        self.failed = {}   # pack index -> [(code, error)]
+        self.results = []  # index entries of written packs
+        self.tasks = []    # (model, code, text), grouped by model
+        self.uses = collections.Counter()  # (model, text) -> prompts using it
+
+        for pack in packs:
+            pack['prompts_map'] = load_prompts(pack['prompts'])
+            pack['chimes'] = None
+            if pack['chime_src']:
+                try:
+                    pack['chimes'] = ChimeSource.open(pack['chime_src'], cache_dir)
+                except (OSError, ValueError) as e:
+                    raise ValueError(f"pack {pack['name']}: chime_src: {e}") from None
+            error = check_chimes(pack['prompts_map'], pack['chimes'])
+            if error:
+                raise ValueError(f"pack {pack['name']}: {error}")
+            if cache_dir and pack['voice_model'] not in self.caches:
+                self.caches[pack['voice_model']] = SynthesisCache(
+                    cache_dir, pack['voice_model'], cache_bytes, encoder, post, sentence_gap_ms)
+
+        queued = set()
+        order = sorted(range(len(packs)), key=lambda i: packs[i]['voice_model'])
+        for i in order:
+            pack = packs[i]
+            model = pack['voice_model']
+            cache = self.caches.get(model)
+            self.waiting[i] = set()
+            for code, text in sorted(pack['prompts_map'].items()):
+                if text == '[CHIME]':
+                    continue
+                key = (model, text)
+                self.users[key].add(i)
+                self.uses[key] += 1
+                if key in queued:
+                    self.waiting[i].add(key)
+                elif cache is None or not cache.contains(text):
+                    queued.add(key)
+                    self.waiting[i].add(key)
+                    self.tasks.append((model, code, text))
+        self.shared = sum(len(p) - 1 for p in self.users.values())
+
+    def _fetch(self, pack_index: int, code: str) -> bytes | None:
+        pack = self.packs[pack_index]
+        key = (pack['voice_model'], pack['prompts_map'][code])
+        if key in self.audio:
+            return self.audio[key]
+        data = self.caches[key[0]].get(key[1]) if key[0] in self.caches else None
+        if data is None:
+            self.failed.setdefault(pack_index, []).append(
+                (code, RuntimeError('cache entry evicted during build')))
+        return data
+
+    def write_pack(self, i: int) -> None:
+        pack = self.packs[i]
+        pack_dir = os.path.join(self.out_dir, pack['name'])
+        os.makedirs(pack_dir, exist_ok=True)
+        zip_path = os.path.join(pack_dir, f"{pack['voice_name']}.zip")
+        config = f"id: {pack['pack_id']}\nversion: {pack['pack_version']}\n".encode()
+        written = None
+        if i not in self.failed:
+            with tracing.span('write_pack', pack=pack['name']):
+                written = write_pack_zip(
+                    zip_path, pack['voice_name'], config, pack['prompts_map'], pack['chimes'],
+                    lambda code: self._fetch(i, code),
+                    os.path.join(pack_dir, pack['voice_name']) if self.keep_files else None,
+                )
+        if written:
+            size, md5 = written
+            self.results.append({
+                'name': pack['name'], 'pack_id': pack['pack_id'], 'version': pack['pack_version'],
+                'voice_model': pack['voice_model'], 'prompts': pack['prompts'],
+                'zip': os.path.relpath(zip_path, self.out_dir), 'size': size, 'md5': md5,
+            })
+            print(f"  => {pack['name']}: {zip_path} ({size} bytes, md5 {md5})")
+        else:
+            print(f"  => {pack['name']}: FAILED, ZIP not written", file=sys.stderr)
+        for key in list(self.audio):
+            self.users[key].discard(i)
+            if not self.users[key]:
+                del self.audio[key]
+
+    def run(self, jobs: int) -> None:
+        # Packs served entirely from the cache can be written straight away
+        for i in sorted(self.waiting):
+            if not self.waiting[i]:
+                self.write_pack(i)
+
+        # Each task stands for every prompt using its text, so the dedup
+        # statistics count them all; only its first result is handled
+        tasks = [task for task in self.tasks for _ in range(self.uses[task[0], task[2]])]
+        results = synthesize_unique(tasks, jobs, self.encoder, post=self.post,
+                                    session=self.session, sentence_gap_ms=self.sentence_gap_ms,
+                                    stats=self.dedup)
+        handled = set()
+        for model, code, text, mp3, trimmed, error in results:
+            key = (model, text)
+            if key in handled:
+                continue
+            handled.add(key)
+            n = len(handled)
+            self.trimmed += trimmed
+            print(f'  [{n:3d}/{len(self.tasks)}] {os.path.basename(model)} {code}: {text[:60]}'
+                  f'{trim_summary(trimmed)}')
+            if error is not None:
+                print(f'      FAILED: {error}', file=sys.stderr)
+            else:
+                self.audio[key] = mp3
+                if model in self.caches:
+                    self.caches[model].put(text, mp3)
+            for i in sorted(self.users[key]):
+                if key not in self.waiting[i]:
+                    continue
+                if error is not None:
+                    self.failed.setdefault(i, []).append((code, error))
+                self.waiting[i].discard(key)
+                if not self.waiting[i]:
+                    self.write_pack(i)
+
+    def index(self, base_url: str | None = None) -> dict:
+        packs = sorted(self.results, key=lambda r: r['name'])
+        if base_url:
+            for entry in packs:
+                entry['url'] = f"{base_url.rstrip('/')}/{entry['zip']}"
+        return {
+            'generated': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'packs': packs,
+            'failed': {
+                self.packs[i]['name']: {code: str(error) for code, error in errors}
+                for i, errors in sorted(self.failed.items())
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build many Eufy L50 voice packs from a manifest with one shared worker pool.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('manifest', help='Batch manifest JSON (see below)')
+    parser.add_argument('--out-dir', default='/tmp/custom_voice_packs',
+                        help='Output directory; each pack gets a <name>/ folder '
+                             '(default: /tmp/custom_voice_packs)')
+    parser.add_argument('--index', default=None,
+                        help='Where to write the index JSON (default: <out-dir>/index.json)')
+    parser.add_argument('--base-url', default=None,
+                        help='Add a download URL to each index entry, e.g. http://192.168.1.100 '
+                             'when serving <out-dir> with serve_voice_pack.py')
+    parser.add_argument('--jobs', type=int, default=0,
+                        help='Number of synthesis workers shared by all packs (0 = one per CPU core, '
+                             'default: 0)')
+    parser.add_argument('--encoder', choices=sorted(ENCODERS), default='ffmpeg',
+                        help='MP3 encoding backend (default: ffmpeg)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Synthesis cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-size-mb', type=int, default=512,
+                        help='Evict least recently used cache entries beyond this size (default: 512)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-synthesize every prompt without reading or writing the cache')
+    parser.add_argument('--keep-files', action='store_true',
+                        help='Also write each unpacked voice folder next to its ZIP')
+    parser.add_argument('--trace', metavar='OUT_JSON', default=None,
+                        help='Record a timeline of the build (Chrome trace-event JSON)')
+    parser.add_argument('--sentence-gap-ms', type=float, default=None, metavar='MS',
+                        help='Synthesize each distinct sentence once per voice model and assemble '
+                             'prompts from the shared fragments, with MS of silence between '
+                             'sentences (0 joins them like Piper does)')
+    add_ort_arguments(parser)
+    add_postprocess_arguments(parser)
+    args = parser.parse_args()
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    if args.encoder == 'lame' and lameenc is None:
+        sys.exit("lameenc not installed. Run: pip install lameenc")
+    post = AudioPost.from_args(args)
+    if post and np is None:
+        sys.exit("numpy not installed. Run: pip install numpy")
+    if args.trace:
+        tracing.enable('batch_build')
+
+    try:
+        packs = load_manifest(args.manifest)
+        batch = BatchBuild(packs, args.out_dir, args.encoder,
+                           None if args.no_cache else args.cache_dir, args.cache_size_mb << 20,
+                           args.keep_files, post, session_settings(args, args.jobs),
+                           args.sentence_gap_ms)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: {e}")
+
+    models = {p['voice_model'] for p in packs}
+    cached = sum(c.hits for c in batch.caches.values())
+    print(f'{len(packs)} packs, {len(models)} voice models, {args.jobs} workers')
+    print(f'Generating {len(batch.tasks)} speech files '
+          f'({cached} cached, {batch.shared} reused across packs)')
+    if batch.tasks:
+        import_piper()  # fail here, not inside every pool worker
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    t0 = time.monotonic()
+    batch.run(args.jobs)
+    elapsed = time.monotonic() - t0
+
+    for cache in batch.caches.values():
+        cache.evict()
+    if batch.dedup.texts < batch.dedup.prompts or batch.dedup.sentences:
+        print(f'\nDeduplication: {batch.dedup.summary()}')
+    if post and batch.tasks:
+        print(f'\nPost-processing trimmed {batch.trimmed:.1f}s of audio from {len(batch.tasks)} '
+              f'prompts, an estimated {trim_saving(batch.trimmed)} bytes of MP3 at '
+              f'{MP3_BITRATE_KBPS} kbps')
+
+    index = batch.index(args.base_url)
+    index_path = args.index or os.path.join(args.out_dir, 'index.json')
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=2)
+        f.write('\n')
+    os.replace(tmp, index_path)
+
+    if args.trace:
+        print(f'Trace: {tracing.write(args.trace)} spans written to {args.trace}')
+
+    print(f'\n{len(index["packs"])} of {len(packs)} packs built in {elapsed:.1f}s. '
+          f'Index: {index_path}')
+    for entry in index['packs']:
+        print(f"  {entry['name']:<20} {entry['zip']:<34} {entry['size']:>9}  {entry['md5']}")
+    if index['failed']:
+        print(f'\nERROR: {len(index["failed"])} packs failed:', file=sys.stderr)
+        for name, errors in index['failed'].items():
+            for code, error in errors.items():
+                print(f'  {name} {code}: {error}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
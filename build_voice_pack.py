@@ -4,7 +4,8 @@ build_voice_pack.py — Build a custom Eufy L50 voice pack ZIP using Piper TTS.
 
 Reads a JSON prompt map (filename → text or "[CHIME]"), synthesizes each text
 prompt as a 16kHz mono 16kbps MP3 using Piper, copies chime files from a
-stock voice pack, writes config.yaml, and packages everything into a ZIP.
+stock voice pack (its ZIP or extracted main/ folder), writes config.yaml,
+and packages everything into a ZIP.
 
 The output ZIP is ready to be served over HTTP and pushed to the vacuum via
 send_voice_pack.py.
@@ -17,31 +18,54 @@ Usage:
     python3 build_voice_pack.py \\
         --voice-model /path/to/en_US-voice.onnx \\
         --prompts examples/prompts/data_star_trek.json \\
-        --chime-src /path/to/stock_pack/en_us_female/main \\
+        --chime-src /path/to/stock/en_us_female.zip \\
         --out-dir /tmp/my_voice \\
         --pack-id 502 \\
-        --pack-version 16
+        --pack-version 16 \\
+        --jobs 4
 
 Requirements:
     pip install piper-tts
     apt install ffmpeg  (or brew install ffmpeg)
+    pip install lameenc  (optional, for --encoder lame)
+    pip install numpy    (for --trim-silence / --normalize / --fade-*; installed with piper-tts)
 """
 
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import hashlib
+import importlib.util
 import io
+import itertools
 import json
 import os
-import shutil
+import re
+import socket
+import struct
 import subprocess
 import sys
+import tempfile
+import time
+import unicodedata
 import wave
 import zipfile
+import zlib
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
 
 try:
-    from piper import PiperVoice
+    import lameenc
 except ImportError:
-    sys.exit("piper-tts not installed. Run: pip install piper-tts")
+    lameenc = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import tracing
 
 
 VOICE_PACK_NAMES = {
@@ -49,28 +73,1644 @@ VOICE_PACK_NAMES = {
     502: 'en_us_male',
 }
 
+# Output format the vacuum expects (see docs/voice_pack_format.md).
+MP3_SAMPLE_RATE = 16000
+MP3_BITRATE_KBPS = 16
+
+# ffmpeg output options for the 16kHz mono 16kbps format.
+MP3_ENCODE_ARGS = ['-ar', str(MP3_SAMPLE_RATE), '-ac', '1', '-b:a', f'{MP3_BITRATE_KBPS}k']
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'eufy-voice-pack',
+)
+
+# Where synth_daemon.py listens by default
+DEFAULT_DAEMON_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f'eufy-synth-{os.getuid()}.sock',
+)
+
+
+def import_piper():
+    """
+    Import Piper on first use rather than at module load, so the cache,
+    encoders and ZIP writer work (and can be benchmarked) without it.
+    """
+    try:
+        from piper import PiperVoice
+    except ImportError:
+        sys.exit("piper-tts not installed. Run: pip install piper-tts")
+    return PiperVoice
+
+
+def load_voice(model_path: str, session: dict | None = None, alignments: bool = False):
+    """
+    Load a Piper voice. `session` holds ONNX Runtime settings from
+    session_settings(); `alignments` exposes the model's per-phoneme
+    durations, which synthesize_pcm_batch() needs. Without either, Piper
+    loads the model with its own defaults.
+    """
+    PiperVoice = import_piper()
+    with tracing.span('load_model', model=os.path.basename(model_path)):
+        if not session and not alignments:
+            return PiperVoice.load(model_path)
+        return _load_voice_tuned(PiperVoice, model_path, session or {}, alignments)
+
+
+def _load_voice_tuned(PiperVoice, model_path: str, session: dict, alignments: bool):
+    """PiperVoice.load() with our own onnxruntime.SessionOptions."""
+    import onnxruntime
+    from piper.config import PiperConfig
+
+    opts = onnxruntime.SessionOptions()
+    if session.get('intra_threads'):
+        opts.intra_op_num_threads = session['intra_threads']
+    if session.get('inter_threads'):
+        opts.inter_op_num_threads = session['inter_threads']
+        opts.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    if session.get('opt_level'):
+        opts.graph_optimization_level = getattr(
+            onnxruntime.GraphOptimizationLevel, ORT_OPT_LEVELS[session['opt_level']])
+    if session.get('mem_arena') is False:
+        opts.enable_cpu_mem_arena = False
+
+    model = model_path
+    if alignments:
+        import onnx
+        from piper.patch_voice_with_alignment import add_alignment_output
+
+        proto = onnx.load(model_path)
+        try:
+            add_alignment_output(proto)
+        except ValueError:
+            pass  # model file already patched
+        model = proto.SerializeToString()
+
+    with open(f'{model_path}.json', encoding='utf-8') as f:
+        config = PiperConfig.from_dict(json.load(f))
+    return PiperVoice(
+        config=config,
+        session=onnxruntime.InferenceSession(model, sess_options=opts,
+                                             providers=['CPUExecutionProvider']),
+    )
+
+
+# --ort-opt-level choices and their onnxruntime.GraphOptimizationLevel names
+ORT_OPT_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+
+
+def add_ort_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('ONNX Runtime session (in-process synthesis)')
+    group.add_argument(
+        '--ort-intra-threads', type=int, default=None, metavar='N',
+        help='Threads inside each inference op (default: onnxruntime picks one per core; '
+             'with --jobs, the cores are divided between the workers)',
+    )
+    group.add_argument(
+        '--ort-inter-threads', type=int, default=None, metavar='N',
+        help='Run independent graph branches on N threads (parallel execution mode)',
+    )
+    group.add_argument(
+        '--ort-opt-level', choices=list(ORT_OPT_LEVELS), default=None,
+        help='Graph optimization level (onnxruntime default: all)',
+    )
+    group.add_argument(
+        '--ort-no-mem-arena', action='store_true',
+        help='Disable the CPU memory arena (less memory held between prompts, slower allocation)',
+    )
+
+
+def session_settings(args, jobs: int = 1) -> dict | None:
+    """ONNX Runtime settings from the add_ort_arguments() options, or None for Piper's defaults."""
+    intra = args.ort_intra_threads
+    if intra is None and jobs > 1:
+        intra = max(1, (os.cpu_count() or 1) // jobs)  # don't oversubscribe the cores
+    settings = {
+        'intra_threads': intra,
+        'inter_threads': args.ort_inter_threads,
+        'opt_level': args.ort_opt_level,
+        'mem_arena': False if args.ort_no_mem_arena else None,
+    }
+    return {k: v for k, v in settings.items() if v is not None} or None
+
 
-def synthesize_mp3(voice, text: str, out_path: str) -> None:
-    """Synthesize text with Piper and save as 16kHz mono 16kbps MP3."""
+def synthesize_pcm(voice, text: str) -> tuple[bytes, int]:
+    """Synthesize text with Piper. Returns (mono int16 PCM bytes, sample rate)."""
     chunks = list(voice.synthesize(text))
     if not chunks:
         raise RuntimeError(f"Piper produced no audio for: {text!r}")
+    return b''.join(chunk.audio_int16_bytes for chunk in chunks), chunks[0].sample_rate
+
+
+def synthesize_pcm_batch(voice, texts: list[str], batch: int) -> list[bytes]:
+    """
+    Like synthesize_pcm() for several texts, running up to `batch` sentences
+    per inference call. Returns the PCM for each text (at
+    voice.config.sample_rate), empty if Piper produced no audio for it.
 
+    Sentences are sorted by length so each call pads as little as possible.
+    The voice must be loaded with alignments=True: the per-phoneme durations
+    tell how much of each padded output row is real audio. Each sentence is
+    scaled to full range, as PiperVoice.synthesize() does.
+    """
+    cfg = voice.config
+    sentences = []  # (text index, sentence index, phoneme ids)
+    for i, text in enumerate(texts):
+        phonemes = [p for p in voice.phonemize(text) if p]
+        sentences.extend((i, j, voice.phonemes_to_ids(p)) for j, p in enumerate(phonemes))
+    sentences.sort(key=lambda s: len(s[2]))
+
+    scales = np.array([cfg.noise_scale, cfg.length_scale, cfg.noise_w_scale], dtype=np.float32)
+    pieces = {}
+    for start in range(0, len(sentences), batch):
+        group = sentences[start:start + batch]
+        ids = np.zeros((len(group), len(group[-1][2])), dtype=np.int64)
+        for row, (_, _, seq) in enumerate(group):
+            ids[row, :len(seq)] = seq
+        inputs = {
+            'input': ids,
+            'input_lengths': np.array([len(seq) for _, _, seq in group], dtype=np.int64),
+            'scales': scales,
+        }
+        if cfg.num_speakers > 1:
+            inputs['sid'] = np.full(len(group), cfg.default_speaker_id, dtype=np.int64)
+        with tracing.span('inference', sentences=len(group), width=ids.shape[1]):
+            outputs = voice.session.run(None, inputs)
+        if len(outputs) < 2:
+            raise RuntimeError('voice model has no duration output (load it with alignments=True)')
+        audio, durations = outputs[0].reshape(len(group), -1), outputs[1].reshape(len(group), -1)
+        for row, (i, j, _) in enumerate(group):
+            a = audio[row, :int(durations[row].sum()) * cfg.hop_length]
+            peak = float(np.abs(a).max()) if a.size else 0.0
+            a = a / peak if peak >= 1e-8 else np.zeros_like(a)
+            pieces[i, j] = np.clip(a * 32767.0, -32767.0, 32767.0).astype(np.int16).tobytes()
+    return [b''.join(pieces[key] for key in sorted(k for k in pieces if k[0] == i))
+            for i in range(len(texts))]
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap mono int16 PCM in a WAV container."""
     buf = io.BytesIO()
     with wave.open(buf, 'wb') as wf:
-        wf.setnchannels(chunks[0].sample_channels)
-        wf.setsampwidth(chunks[0].sample_width)
-        wf.setframerate(chunks[0].sample_rate)
-        for chunk in chunks:
-            wf.writeframes(chunk.audio_int16_bytes)
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
 
+def ffmpeg_wav_to_mp3(wav: bytes) -> bytes:
+    """Encode WAV bytes to 16kHz mono 16kbps MP3 with an ffmpeg process."""
     result = subprocess.run(
-        ['ffmpeg', '-y', '-i', 'pipe:0', '-ar', '16000', '-ac', '1', '-b:a', '16k', out_path],
-        input=buf.getvalue(),
+        ['ffmpeg', '-y', '-i', 'pipe:0', *MP3_ENCODE_ARGS, '-f', 'mp3', 'pipe:1'],
+        input=wav,
         capture_output=True,
     )
     if result.returncode != 0:
-        raise RuntimeError(f'ffmpeg failed for {out_path}:\n{result.stderr.decode()}')
+        raise RuntimeError(f'ffmpeg failed:\n{result.stderr.decode()}')
+    return result.stdout
+
+
+def encode_mp3_ffmpeg(pcm: bytes, sample_rate: int) -> bytes:
+    """Encode mono int16 PCM to MP3 by piping a WAV through an ffmpeg process."""
+    return ffmpeg_wav_to_mp3(pcm_to_wav(pcm, sample_rate))
+
+
+def encode_mp3_lame(pcm: bytes, sample_rate: int) -> bytes:
+    """Encode mono int16 PCM to MP3 in-process with LAME (lameenc), resampling as needed."""
+    encoder = lameenc.Encoder()
+    encoder.set_in_sample_rate(sample_rate)
+    encoder.set_out_sample_rate(MP3_SAMPLE_RATE)
+    encoder.set_channels(1)
+    encoder.set_bit_rate(MP3_BITRATE_KBPS)
+    encoder.set_quality(2)
+    return bytes(encoder.encode(pcm) + encoder.flush())
+
+
+# Encoding backends for --encoder. Each takes mono int16 PCM and its sample
+# rate and returns 16kHz mono 16kbps CBR MP3 bytes.
+ENCODERS = {
+    'ffmpeg': encode_mp3_ffmpeg,
+    'lame': encode_mp3_lame,
+}
+
+
+# MP3 bytes per second of audio at the pack's constant bit rate
+MP3_BYTES_PER_SECOND = MP3_BITRATE_KBPS * 1000 // 8
+
+
+def synthesize_mp3(voice, text: str, encoder: str = 'ffmpeg',
+                   post: 'AudioPost | None' = None) -> tuple[bytes, float]:
+    """
+    Synthesize text with Piper and return it as 16kHz mono 16kbps MP3 bytes,
+    with the seconds of audio removed by `post` (0.0 without post-processing).
+    """
+    with tracing.span('synthesize'):
+        pcm, sample_rate = synthesize_pcm(voice, text)
+    return encode_prompt(pcm, sample_rate, encoder, post)
+
+
+def encode_prompt(pcm: bytes, sample_rate: int, encoder: str | None = 'ffmpeg',
+                  post: 'AudioPost | None' = None) -> tuple[bytes, float]:
+    """
+    Post-process and encode synthesized PCM. Returns (mp3, seconds trimmed).
+    With encoder=None the PCM is returned as is, for sentence fragments that
+    are assembled into prompts later (see synthesize_unique()).
+    """
+    if encoder is None:
+        return pcm, 0.0
+    trimmed = 0.0
+    if post is not None:
+        with tracing.span('postprocess'):
+            pcm, removed = post.apply(pcm, sample_rate)
+        trimmed = removed / sample_rate
+    with tracing.span('encode', encoder=encoder):
+        return ENCODERS[encoder](pcm, sample_rate), trimmed
+
+
+_batch_failed = False  # synthesize_group() has reported a batched inference failure
+
+
+def synthesize_group(voice, tasks: list[tuple[str, str]], encoder: str = 'ffmpeg',
+                     post: 'AudioPost | None' = None, batch: int = 1) -> list[tuple]:
+    """
+    Synthesize (code, text) tasks, returning (mp3, trimmed, error) for each.
+
+    With batch > 1 the sentences of all tasks go through batched inference
+    (synthesize_pcm_batch()); if that fails, each task is retried on its own
+    so one bad prompt does not fail the others. The first such failure in
+    a process is reported on stderr.
+    """
+    global _batch_failed
+    if batch > 1 and len(tasks) > 1:
+        try:
+            with tracing.span('synthesize', prompts=len(tasks), batch=batch):
+                pcms = synthesize_pcm_batch(voice, [text for _, text in tasks], batch)
+        except Exception as e:
+            # The 'synthesize' span records the error; mark the fallback too
+            error = f'{type(e).__name__}: {e}'
+            with tracing.span('batch_fallback', prompts=len(tasks), error=error):
+                pass
+            if not _batch_failed:
+                _batch_failed = True
+                print(f'\nBatched inference failed for a group of {len(tasks)} prompts '
+                      f'({error}); synthesizing them one at a time (further failures in '
+                      f'this process are not reported)', file=sys.stderr)
+        else:
+            results = []
+            for (code, text), pcm in zip(tasks, pcms):
+                try:
+                    with tracing.span('prompt', code=code):
+                        if not pcm:
+                            raise RuntimeError(f"Piper produced no audio for: {text!r}")
+                        results.append((*encode_prompt(pcm, voice.config.sample_rate, encoder,
+                                                       post), None))
+                except Exception as e:
+                    results.append((None, 0.0, e))
+            return results
+
+    results = []
+    for code, text in tasks:
+        try:
+            with tracing.span('prompt', code=code):
+                results.append((*synthesize_mp3(voice, text, encoder, post), None))
+        except Exception as e:
+            results.append((None, 0.0, e))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Audio post-processing
+# ---------------------------------------------------------------------------
+
+class AudioPost:
+    """
+    Clean up synthesized int16 PCM before it is encoded, using NumPy.
+
+    - trim_db:   cut leading and trailing audio quieter than this (dBFS),
+                 keeping pad_ms of it on each side
+    - normalize: 'peak' scales the loudest sample to level_db (default -1
+                 dBFS); 'rms' scales the average loudness to level_db
+                 (default -20 dBFS) without letting peaks pass -1 dBFS
+    - fade_in_ms / fade_out_ms: linear fades, which also hide the click a
+                 trim can leave at the cut
+    """
+
+    FRAME_MS = 10      # silence is detected per frame, not per sample
+    PEAK_CEILING_DB = -1.0
+
+    def __init__(self, trim_db: float | None = None, pad_ms: float = 60,
+                 normalize: str | None = None, level_db: float | None = None,
+                 fade_in_ms: float = 0, fade_out_ms: float = 0):
+        if normalize not in (None, 'peak', 'rms'):
+            raise ValueError(f'unknown normalization {normalize!r}')
+        self.trim_db = trim_db
+        self.pad_ms = pad_ms
+        self.normalize = normalize
+        if level_db is None and normalize:
+            level_db = self.PEAK_CEILING_DB if normalize == 'peak' else -20.0
+        self.level_db = level_db
+        self.fade_in_ms = fade_in_ms
+        self.fade_out_ms = fade_out_ms
+
+    @classmethod
+    def from_args(cls, args) -> 'AudioPost | None':
+        """Build from the add_postprocess_arguments() options, or None if all are off."""
+        if args.trim_silence is None and not args.normalize \
+                and not args.fade_in_ms and not args.fade_out_ms:
+            return None
+        return cls(args.trim_silence, args.trim_pad_ms, args.normalize, args.normalize_db,
+                   args.fade_in_ms, args.fade_out_ms)
+
+    def to_dict(self) -> dict:
+        """Settings as a dict, for cache keys and synth_daemon.py requests."""
+        return {'trim_db': self.trim_db, 'pad_ms': self.pad_ms, 'normalize': self.normalize,
+                'level_db': self.level_db, 'fade_in_ms': self.fade_in_ms,
+                'fade_out_ms': self.fade_out_ms}
+
+    def apply(self, pcm: bytes, sample_rate: int) -> tuple[bytes, int]:
+        """Return the processed PCM and the number of samples trimmed."""
+        a = np.frombuffer(pcm, dtype='<i2')
+        n = len(a)
+        if self.trim_db is not None and n:
+            frame = max(1, sample_rate * self.FRAME_MS // 1000)
+            frames = np.abs(np.pad(a, (0, -n % frame)).astype(np.int32)).reshape(-1, frame)
+            loud = np.flatnonzero(frames.max(axis=1) >= 32768 * 10 ** (self.trim_db / 20))
+            if loud.size:  # leave all-quiet prompts alone rather than emptying them
+                pad = int(sample_rate * self.pad_ms / 1000)
+                a = a[max(0, loud[0] * frame - pad):min(n, (loud[-1] + 1) * frame + pad)]
+        removed = n - len(a)
+        if not (self.normalize or self.fade_in_ms or self.fade_out_ms) or not len(a):
+            return a.tobytes(), removed
+
+        x = a.astype(np.float32)
+        if self.normalize:
+            peak = float(np.abs(x).max())
+            if peak > 0:
+                ceiling = 32767 * 10 ** (self.PEAK_CEILING_DB / 20)
+                target = 32767 * 10 ** (self.level_db / 20)
+                if self.normalize == 'peak':
+                    gain = target / peak
+                else:
+                    gain = min(target / float(np.sqrt(np.mean(x * x))), ceiling / peak)
+                x *= gain
+        for ms, ramp in ((self.fade_in_ms, (0, 1)), (self.fade_out_ms, (1, 0))):
+            k = min(len(x), int(sample_rate * ms / 1000))
+            if k:
+                window = np.linspace(*ramp, k, dtype=np.float32)
+                if ramp[0] == 0:
+                    x[:k] *= window
+                else:
+                    x[-k:] *= window
+        return np.clip(np.rint(x), -32768, 32767).astype('<i2').tobytes(), removed
+
+
+def add_postprocess_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('audio post-processing (needs numpy)')
+    group.add_argument(
+        '--trim-silence', nargs='?', type=float, const=-45.0, default=None, metavar='DBFS',
+        help='Trim leading/trailing audio quieter than DBFS (default when given: -45)',
+    )
+    group.add_argument(
+        '--trim-pad-ms', type=float, default=60,
+        help='Silence kept before and after the speech when trimming (default: 60)',
+    )
+    group.add_argument(
+        '--normalize', choices=('peak', 'rms'), default=None,
+        help='Normalize each prompt to a peak or RMS level (see --normalize-db)',
+    )
+    group.add_argument(
+        '--normalize-db', type=float, default=None,
+        help='Target level in dBFS (default: -1 for peak, -20 for rms; peaks never exceed -1)',
+    )
+    group.add_argument('--fade-in-ms', type=float, default=0, help='Linear fade-in length (default: 0)')
+    group.add_argument('--fade-out-ms', type=float, default=0, help='Linear fade-out length (default: 0)')
+
+
+def trim_saving(trimmed: float) -> int:
+    """
+    Estimated MP3 bytes saved by trimming `trimmed` seconds, from the pack's
+    constant bit rate. The encoder adds or drops at most a frame either way.
+    """
+    return round(trimmed * MP3_BYTES_PER_SECOND)
+
+
+def trim_summary(trimmed: float) -> str:
+    """' (-0.42s, est. 840 bytes)' for a progress line, or '' if nothing was trimmed."""
+    if trimmed <= 0:
+        return ''
+    return f' (-{trimmed:.2f}s, est. {trim_saving(trimmed)} bytes)'
+
+
+# ---------------------------------------------------------------------------
+# Synthesis cache
+# ---------------------------------------------------------------------------
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SynthesisCache:
+    """
+    Content-addressed on-disk cache of encoded prompt MP3s.
+
+    Entries are keyed on the voice model (and its .onnx.json config), the
+    prompt text, the encoder backend, the encoding parameters, any
+    post-processing settings and the sentence gap when prompts are assembled
+    from sentence fragments. A hit
+    refreshes the entry's mtime; `evict()` removes least recently used
+    entries until the cache fits within `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, model_path: str, max_bytes: int, encoder: str = 'ffmpeg',
+                 post: AudioPost | None = None, sentence_gap_ms: float | None = None):
+        self.cache_dir = cache_dir
+        self.encoder = encoder
+        self.post = post.to_dict() if post else None
+        self.sentence_gap_ms = sentence_gap_ms
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        config_path = f'{model_path}.json'
+        self._model_key = file_sha256(model_path) + (
+            file_sha256(config_path) if os.path.exists(config_path) else ''
+        )
+
+    def key(self, text: str) -> str:
+        material = [self._model_key, text, self.encoder, MP3_ENCODE_ARGS]
+        if self.post:
+            material.append(self.post)
+        if self.sentence_gap_ms is not None:
+            material.append({'sentence_gap_ms': self.sentence_gap_ms})
+        material = json.dumps(material)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.mp3')
+
+    def contains(self, text: str) -> bool:
+        """Check for a cached MP3 for `text`, counting the hit or miss."""
+        if os.path.exists(self._path(self.key(text))):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def get(self, text: str) -> bytes | None:
+        """Return the cached MP3 for `text` and mark it recently used, or None."""
+        path = self._path(self.key(text))
+        try:
+            with tracing.span('cache_get'), open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, text: str, data: bytes) -> None:
+        path = self._path(self.key(text))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tracing.span('cache_put'):
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def evict(self) -> int:
+        """Drop least recently used entries beyond max_bytes. Returns entries removed."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.mp3'):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+
+# ---------------------------------------------------------------------------
+# Streaming ZIP writer
+# ---------------------------------------------------------------------------
+
+class _ZipEntry(NamedTuple):
+    fname: bytes
+    flags: int
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    csize: int
+    usize: int
+    offset: int
+
+
+def _local_header(e: _ZipEntry) -> bytes:
+    return struct.pack(
+        '<IHHHHHIIIHH', 0x04034B50, 20, e.flags, e.method, e.dos_time, e.dos_date,
+        e.crc, e.csize, e.usize, len(e.fname), 0,
+    ) + e.fname
+
+
+def _zip_payload(data: bytes, compress: bool) -> tuple[bytes, int]:
+    """Entry data in its stored form and the ZIP method, deflating it if `compress` is set."""
+    if compress:
+        co = zlib.compressobj(6, zlib.DEFLATED, -15)
+        return co.compress(data) + co.flush(), zipfile.ZIP_DEFLATED
+    return data, zipfile.ZIP_STORED
+
+
+def _central_directory(entries: list[_ZipEntry], cd_offset: int) -> bytes:
+    """Central directory and end record for `entries`, to be written at `cd_offset`."""
+    cd = b''.join(struct.pack(
+        '<IHHHHHHIIIHHHHHII', 0x02014B50, (3 << 8) | 20, 20, e.flags, e.method,
+        e.dos_time, e.dos_date, e.crc, e.csize, e.usize, len(e.fname), 0, 0, 0, 0,
+        0o100644 << 16, e.offset,
+    ) + e.fname for e in entries)
+    return cd + struct.pack(
+        '<IHHHHIIH', 0x06054B50, 0, 0, len(entries), len(entries), len(cd), cd_offset, 0,
+    )
+
+
+class StreamingZipWriter:
+    """
+    Write a ZIP archive front to back in a single pass.
+
+    Each entry's data is passed in whole, so its CRC and sizes are known
+    before the local header is written and the writer never seeks back.
+    The MD5 and size of the archive are accumulated while writing, so the
+    finished file does not need to be read again. MP3 audio is stored
+    uncompressed by default since deflate gains almost nothing on it.
+    Memory use is bounded by the largest single entry.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self._f = open(path, 'wb')
+        self._md5 = hashlib.md5()
+        self._central = []
+        t = time.localtime()
+        self._dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        self._dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    def _write(self, data: bytes) -> None:
+        self._f.write(data)
+        with tracing.span('md5'):
+            self._md5.update(data)
+        self.size += len(data)
+
+    def writestr(self, name: str, data: bytes, compress: bool = False) -> None:
+        """Add an entry, deflating it if `compress` is set."""
+        payload, method = _zip_payload(data, compress)
+        self.write_raw(name, payload, method, zlib.crc32(data), len(data))
+
+    def write_raw(self, name: str, payload: bytes, method: int, crc: int, file_size: int) -> None:
+        """Add an entry whose data is already in its final (stored or deflated) form."""
+        if self.size + len(payload) > 0xFFFFFFFF:
+            raise ValueError('voice pack ZIP would exceed 4 GiB')
+        entry = _ZipEntry(name.encode(), 0x800 if not name.isascii() else 0,  # UTF-8 file name
+                          method, self._dos_time, self._dos_date, crc, len(payload), file_size,
+                          self.size)
+        with tracing.span('zip_write', entry=name, bytes=len(payload)):
+            self._write(_local_header(entry))
+            self._write(payload)
+        self._central.append(entry)
+
+    def close(self) -> None:
+        with tracing.span('zip_close', entries=len(self._central)):
+            self._close()
+
+    def _close(self) -> None:
+        self._write(_central_directory(self._central, self.size))
+        self._f.close()
+
+
+class ZipPatcher:
+    """
+    Replace, add or remove entries of an existing ZIP without rebuilding it.
+
+    A commit copies the entries up to the old central directory into a
+    temporary file, appends the new entry data and a new central directory,
+    and renames it over the ZIP, so a download in progress keeps reading
+    the old file and an interrupted commit leaves it untouched. The MD5 of
+    the unchanged prefix is kept between commits and only the appended bytes
+    are hashed. Superseded entries stay in the file as unreferenced bytes
+    (see `dead`) until compact() rewrites it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dead = 0
+        self._pending = {}  # name -> (payload, method, crc, file_size), or None to remove
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            f.seek(max(0, end - 0xFFFF - 22))
+            tail = f.read()
+            pos = tail.rfind(b'PK\x05\x06')
+            if pos < 0 or len(tail) - pos < 22:
+                raise ValueError(f'{path}: not a ZIP file (no end of central directory)')
+            count, cd_size, self._cd_offset = struct.unpack_from('<10xHII', tail, pos)
+            f.seek(self._cd_offset)
+            cd = f.read(cd_size)
+            self._entries = {}
+            p = 0
+            for _ in range(count):
+                (sig, _, _, flags, method, dos_time, dos_date, crc, csize, usize,
+                 name_len, extra_len, comment_len, _, _, _, offset) = \
+                    struct.unpack_from('<IHHHHHHIIIHHHHHII', cd, p)
+                if sig != 0x02014B50:
+                    raise ValueError(f'{path}: corrupt central directory')
+                fname = cd[p + 46:p + 46 + name_len]
+                self._entries[fname.decode()] = _ZipEntry(
+                    fname, flags, method, dos_time, dos_date, crc, csize, usize, offset)
+                p += 46 + name_len + extra_len + comment_len
+            f.seek(0)
+            self._md5 = hashlib.md5()
+            remaining = self._cd_offset
+            while remaining:
+                block = f.read(min(remaining, 1 << 20))
+                self._md5.update(block)
+                remaining -= len(block)
+        self.size = end
+        self.md5 = None
+
+    def names(self) -> list[str]:
+        return sorted(self._entries)
+
+    def writestr(self, name: str, data: bytes, compress: bool = False) -> None:
+        """Stage a new or replacement entry."""
+        payload, method = _zip_payload(data, compress)
+        self._pending[name] = (payload, method, zlib.crc32(data), len(data))
+
+    def remove(self, name: str) -> None:
+        """Stage the removal of an entry."""
+        self._pending[name] = None
+
+    def commit(self) -> tuple[int, str]:
+        """Write the staged changes and return the new (size, md5)."""
+        t = time.localtime()
+        dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        entries = dict(self._entries)
+        dead = self.dead
+        blocks = []
+        offset = self._cd_offset
+        for name, change in sorted(self._pending.items()):
+            old = entries.pop(name, None)
+            if old:
+                dead += 30 + len(old.fname) + old.csize
+            if change is None:
+                continue
+            payload, method, crc, usize = change
+            fname = name.encode()
+            entry = _ZipEntry(fname, 0x800 if not name.isascii() else 0, method,
+                              dos_time, dos_date, crc, len(payload), usize, offset)
+            header = _local_header(entry)
+            blocks += [header, payload]
+            offset += len(header) + len(payload)
+            entries[name] = entry
+        if offset > 0xFFFFFFFF:
+            raise ValueError('voice pack ZIP would exceed 4 GiB')
+        cd = _central_directory([entries[n] for n in sorted(entries)], offset)
+
+        tmp_path = self.path + '.tmp'
+        md5 = self._md5.copy()
+        try:
+            with open(self.path, 'rb') as src, open(tmp_path, 'wb') as f:
+                remaining = self._cd_offset
+                while remaining:
+                    block = src.read(min(remaining, 1 << 20))
+                    if not block:
+                        raise ValueError(f'{self.path}: changed while patching')
+                    f.write(block)
+                    remaining -= len(block)
+                for block in blocks:
+                    f.write(block)
+                    md5.update(block)
+                f.write(cd)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._entries, self.dead, self._cd_offset, self._md5 = entries, dead, offset, md5
+        self._pending.clear()
+        self.size = offset + len(cd)
+        md5 = md5.copy()
+        md5.update(cd)
+        self.md5 = md5.hexdigest()
+        return self.size, self.md5
+
+    def compact(self) -> tuple[int, str]:
+        """Rewrite the ZIP without superseded data. Returns the new (size, md5)."""
+        tmp_path = self.path + '.tmp'
+        with open(self.path, 'rb') as f, StreamingZipWriter(tmp_path) as zw:
+            for name in sorted(self._entries):
+                e = self._entries[name]
+                f.seek(e.offset + 26)
+                name_len, extra_len = struct.unpack('<HH', f.read(4))
+                f.seek(name_len + extra_len, os.SEEK_CUR)
+                zw.write_raw(name, f.read(e.csize), e.method, e.crc, e.usize)
+        os.replace(tmp_path, self.path)
+        self.__init__(self.path)
+        self.md5 = zw.md5
+        return zw.size, zw.md5
+
+
+# ---------------------------------------------------------------------------
+# Synthesis daemon client
+# ---------------------------------------------------------------------------
+
+# Frames on the synth_daemon.py socket: two big-endian uint32 lengths, then a
+# JSON header and a binary payload of those lengths.
+_FRAME_HEAD = struct.Struct('>II')
+
+
+def send_frame(sock: socket.socket, header: dict, payload: bytes = b'') -> None:
+    head = json.dumps(header).encode()
+    sock.sendall(_FRAME_HEAD.pack(len(head), len(payload)) + head + payload)
+
+
+def recv_frame(f) -> tuple[dict, bytes]:
+    """Read one frame from a socket file (sock.makefile('rb')). Raises ConnectionError at EOF."""
+    lengths = f.read(_FRAME_HEAD.size)
+    if len(lengths) < _FRAME_HEAD.size:
+        raise ConnectionError('synthesis daemon closed the connection')
+    head_len, payload_len = _FRAME_HEAD.unpack(lengths)
+    head, payload = f.read(head_len), f.read(payload_len)
+    if len(head) < head_len or len(payload) < payload_len:
+        raise ConnectionError('synthesis daemon closed the connection')
+    return json.loads(head), payload
+
+
+class SynthDaemonClient:
+    """
+    Client for a running synth_daemon.py, which keeps Piper models loaded
+    between builds. Texts are sent in batches; the daemon streams back one
+    result frame per text, in order.
+    """
+
+    def __init__(self, sock: socket.socket, path: str):
+        self.path = path
+        self._sock = sock
+        self._f = sock.makefile('rb')
+
+    @classmethod
+    def connect(cls, path: str) -> 'SynthDaemonClient | None':
+        """Connect to the daemon at `path`, or return None if it is not running."""
+        if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock, path)
+
+    def request(self, header: dict) -> dict:
+        send_frame(self._sock, header)
+        reply, _ = recv_frame(self._f)
+        return reply
+
+    def synthesize(self, model_path: str, tasks: list[tuple[str, str]], encoder: str = 'ffmpeg',
+                   fmt: str = 'mp3', batch: int = 32, post: AudioPost | None = None):
+        """Like synthesize_all(): yields (code, text, data, trimmed, error) in task order."""
+        model_path = os.path.abspath(model_path)
+        for start in range(0, len(tasks), batch):
+            chunk = tasks[start:start + batch]
+            send_frame(self._sock, {'op': 'synthesize', 'model': model_path, 'encoder': encoder,
+                                    'format': fmt, 'texts': [text for _, text in chunk],
+                                    'post': post.to_dict() if post else None})
+            for code, text in chunk:
+                with tracing.span('prompt', code=code, daemon=True):
+                    header, data = recv_frame(self._f)
+                if header.get('error'):
+                    yield code, text, None, 0.0, RuntimeError(header['error'])
+                else:
+                    yield code, text, data, header.get('trimmed', 0.0), None
+            header, _ = recv_frame(self._f)  # end-of-batch frame
+            if header.get('error'):
+                raise RuntimeError(f"synthesis daemon: {header['error']}")
+
+    def close(self) -> None:
+        self._f.close()
+        self._sock.close()
+
+
+# ---------------------------------------------------------------------------
+# Parallel synthesis
+# ---------------------------------------------------------------------------
+
+_worker_model = (None, None)      # (path, voice) of the model this process has loaded
+_worker_settings = (None, False)  # (ONNX Runtime session settings, alignments) for load_voice()
+
+
+def _init_worker(trace: bool = False, session: dict | None = None,
+                 alignments: bool = False, model_path: str | None = None) -> None:
+    """
+    Pool initializer: remember how to load models. Each is loaded on first
+    use, or `model_path` right away.
+    """
+    global _worker_model, _worker_settings
+    if trace:
+        tracing.enable(f'synthesis worker {os.getpid()}')
+    if (session, alignments) != _worker_settings:
+        _worker_model = (None, None)  # loaded with other settings
+    _worker_settings = (session, alignments)
+    if model_path:
+        _worker_voice(model_path)
+
+
+def _worker_voice(model_path: str):
+    """The voice for `model_path`, loading it in place of this process's previous model."""
+    global _worker_model
+    if _worker_model[0] != model_path:
+        _worker_model = (None, None)  # drop the old model before loading the next
+        _worker_model = (model_path, load_voice(model_path, *_worker_settings))
+    return _worker_model[1]
+
+
+def preload_voice(model_path: str, session: dict | None = None, alignments: bool = False) -> None:
+    """Load a model for in-process synthesize_all() calls ahead of time."""
+    _init_worker(False, session, alignments)
+    _worker_voice(model_path)
+
+
+def _synthesize_task(model_path: str, tasks: list[tuple[str, str]], encoder: str | None,
+                     post: AudioPost | None, batch: int) -> tuple[list[tuple], list]:
+    """Returns synthesize_group()'s results and the trace events recorded since the last task."""
+    return synthesize_group(_worker_voice(model_path), tasks, encoder, post, batch), tracing.drain()
+
+
+def synthesis_pool(jobs: int, session: dict | None = None, batch: int = 1,
+                   model_path: str | None = None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    A worker pool for synthesize_all(pool=...) that outlives one call, so
+    its workers keep their models loaded. Each worker loads `model_path` as
+    it starts, and all of them are started before this returns.
+    """
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker,
+        initargs=(tracing.enabled(), session, batch > 1, model_path))
+    if model_path:
+        # Workers start on demand; start them all now and wait for the model
+        for future in [pool.submit(os.getpid) for _ in range(jobs)]:
+            future.result()
+    return pool
+
+
+_END = object()
+
+
+def bounded(items, submit, window: int):
+    """
+    Yield (item, future) in item order, where future = submit(item), with at
+    most `window` futures submitted but not yet yielded.
+    """
+    pending = collections.deque()
+    it = iter(items)
+    while True:
+        while len(pending) < window:
+            item = next(it, _END)
+            if item is _END:
+                break
+            pending.append((item, submit(item)))
+        if not pending:
+            return
+        yield pending.popleft()
+
+
+def synthesize_all(tasks: list[tuple[str, str, str]], jobs: int = 1,
+                   encoder: str | None = 'ffmpeg', daemon: SynthDaemonClient | None = None,
+                   post: AudioPost | None = None, session: dict | None = None, batch: int = 1,
+                   pool: concurrent.futures.ProcessPoolExecutor | None = None):
+    """
+    Synthesize (model, code, text) tasks, yielding (model, code, text, mp3,
+    trimmed, error) in task order, where `trimmed` is the seconds removed by
+    `post`. With encoder=None raw PCM is yielded instead of MP3.
+
+    With a `daemon` the work is sent to synth_daemon.py; if the connection
+    drops, the remaining tasks continue in-process. With jobs > 1 the work
+    runs in a process pool where each worker loads a model when it first
+    needs it (with the ONNX Runtime `session` settings) and keeps it until it
+    moves on to the next, so tasks should be grouped by model. Tasks are
+    handed out in groups of `batch` prompts of one model, whose sentences
+    share inference calls when batch > 1. At most 2 * jobs groups are in
+    flight, so memory stays flat no matter how many prompts there are. A
+    failing prompt is reported through `error` instead of aborting the
+    remaining tasks. In-process synthesis reuses a model loaded by an
+    earlier call or preload_voice(). A `pool` from synthesis_pool() is used
+    instead of a new one (its own session settings apply) and left running.
+    """
+    if daemon is not None:
+        done = 0
+        try:
+            for model, group in itertools.groupby(tasks, key=lambda task: task[0]):
+                for result in daemon.synthesize(model, [(code, text) for _, code, text in group],
+                                                encoder or 'ffmpeg', 'mp3' if encoder else 'pcm',
+                                                post=post):
+                    done += 1
+                    yield model, *result
+            return
+        except (OSError, RuntimeError) as e:
+            print(f'\nSynthesis daemon failed ({e}); continuing in-process', file=sys.stderr)
+            tasks = tasks[done:]
+            import_piper()
+        finally:
+            daemon.close()
+
+    batch = max(1, batch)
+    groups = []
+    for model, group in itertools.groupby(tasks, key=lambda task: task[0]):
+        group = [(code, text) for _, code, text in group]
+        groups.extend((model, group[i:i + batch]) for i in range(0, len(group), batch))
+    if jobs <= 1 and pool is None:
+        _init_worker(False, session, batch > 1)
+        for model, group in groups:
+            try:
+                results = synthesize_group(_worker_voice(model), group, encoder, post, batch)
+            except Exception as e:  # the model failed to load
+                results = [(None, 0.0, e)] * len(group)
+            for (code, text), result in zip(group, results):
+                yield model, code, text, *result
+        return
+
+    with contextlib.nullcontext(pool) if pool else synthesis_pool(jobs, session, batch) as pool:
+        for (model, group), future in bounded(
+                groups, lambda g: pool.submit(_synthesize_task, *g, encoder, post, batch), 2 * jobs):
+            error = future.exception()
+            if error is None:
+                results, events = future.result()
+                tracing.add_events(events)
+            else:  # the model failed to load or the worker itself died
+                results = [(None, 0.0, error)] * len(group)
+            for (code, text), result in zip(group, results):
+                yield model, code, text, *result
+
+
+# ---------------------------------------------------------------------------
+# Deduplication and sentence fragments
+# ---------------------------------------------------------------------------
+
+# A sentence ends at . ! or ? followed by whitespace
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split a prompt into sentences, normalized (NFKC, whitespace collapsed) so repeats match."""
+    text = ' '.join(unicodedata.normalize('NFKC', text).split())
+    return [sentence for sentence in SENTENCE_END_RE.split(text) if sentence]
+
+
+def model_sample_rate(model_path: str) -> int:
+    """Output sample rate of a Piper model, from its .onnx.json config."""
+    with open(f'{model_path}.json') as f:
+        return json.load(f)['audio']['sample_rate']
+
+
+class FragmentPlan:
+    """
+    Prompt texts split into sentences. Each distinct sentence is synthesized
+    once and every prompt is assembled from the shared PCM fragments.
+    """
+
+    def __init__(self, texts: list[str]):
+        self.sentences = {}                   # text -> its sentences
+        self.uses = collections.Counter()     # sentence -> prompts using it
+        for text in texts:
+            if text not in self.sentences:
+                self.sentences[text] = split_sentences(text)
+            self.uses.update(self.sentences[text])
+
+    @property
+    def fragments(self) -> list[str]:
+        """Distinct sentences, in first-use order."""
+        return list(self.uses)
+
+    def assemble(self, text: str, pcm: dict[str, bytes], sample_rate: int, gap_ms: float) -> bytes:
+        """Join the fragments of `text` with gap_ms of silence between sentences."""
+        gap = b'\0\0' * int(sample_rate * gap_ms / 1000)
+        return gap.join(pcm[sentence] for sentence in self.sentences[text])
+
+    def encode(self, text: str, pcm: dict[str, bytes], errors: dict[str, Exception],
+               sample_rate: int, gap_ms: float, encoder: str = 'ffmpeg',
+               post: AudioPost | None = None) -> tuple:
+        """Assemble, post-process and encode one prompt. Returns (mp3, trimmed, error)."""
+        sentences = self.sentences[text]
+        error = next((errors[s] for s in sentences if s in errors), None)
+        if error is None and not sentences:
+            error = RuntimeError(f"no text to synthesize in {text!r}")
+        if error is not None:
+            return None, 0.0, error
+        try:
+            return (*encode_prompt(self.assemble(text, pcm, sample_rate, gap_ms), sample_rate,
+                                   encoder, post), None)
+        except Exception as e:
+            return None, 0.0, e
+
+    def reuse(self, pcm: dict[str, bytes]) -> tuple[int, int]:
+        """(bytes synthesized, bytes served again by reusing fragments)."""
+        made = sum(len(pcm[s]) for s in self.uses if s in pcm)
+        reused = sum(len(pcm[s]) * (n - 1) for s, n in self.uses.items() if s in pcm)
+        return made, reused
+
+
+class DedupStats:
+    """
+    What synthesize_unique() avoided, for the build report. The time saved
+    is estimated from the share of audio that was reused rather than made.
+    """
+
+    def __init__(self):
+        self.prompts = 0        # prompts requested
+        self.texts = 0          # distinct prompt texts
+        self.sentences = 0      # sentences in the requested prompts (sentence mode only)
+        self.fragments = 0      # distinct sentences synthesized
+        self.seconds = 0.0      # time spent synthesizing (and encoding, for whole prompts)
+        self.made = 0           # bytes of audio synthesized
+        self.reused = 0         # bytes of audio reused instead
+
+    @property
+    def saved(self) -> float:
+        """Estimated seconds of synthesis avoided."""
+        return self.seconds * self.reused / self.made if self.made else 0.0
+
+    def summary(self) -> str:
+        parts = [f'{self.prompts} prompts, {self.texts} distinct']
+        if self.sentences:
+            parts.append(f'{self.sentences} sentences, {self.fragments} synthesized')
+        share = self.saved / (self.seconds + self.saved) if self.seconds + self.saved else 0.0
+        return (f"{'; '.join(parts)}; saved about {self.saved:.1f}s of synthesis "
+                f"({share:.0%} of {self.seconds + self.saved:.1f}s)")
+
+
+def synthesize_unique(tasks: list[tuple[str, str, str]], jobs: int = 1, encoder: str = 'ffmpeg',
+                      daemon: SynthDaemonClient | None = None, post: AudioPost | None = None,
+                      session: dict | None = None, batch: int = 1,
+                      sentence_gap_ms: float | None = None, stats: DedupStats | None = None,
+                      pool: concurrent.futures.ProcessPoolExecutor | None = None):
+    """
+    Like synthesize_all(), but prompts with the same model and text are
+    synthesized and encoded once.
+
+    With `sentence_gap_ms` set, prompts are split into sentences, each
+    distinct sentence is synthesized once per model (as raw PCM, through
+    synthesize_all()) and every prompt is assembled from the fragments with
+    sentence_gap_ms of silence between sentences, then post-processed and
+    encoded on `jobs` threads. `stats` receives the counts and an estimate
+    of the synthesis time saved, from the share of audio that was reused.
+    `pool` is passed on to synthesize_all().
+    """
+    stats = stats or DedupStats()
+    stats.prompts += len(tasks)
+    pending = collections.Counter((model, text) for model, _, text in tasks)
+    unique = {}
+    for model, code, text in tasks:
+        unique.setdefault((model, text), (model, code, text))
+    unique = list(unique.values())
+    stats.texts += len(unique)
+    if sentence_gap_ms is None:
+        results = timed_results(synthesize_all(unique, jobs, encoder, daemon, post, session, batch,
+                                               pool), stats)
+    else:
+        results = _assemble_fragments(unique, tasks, jobs, encoder, daemon, post, session, batch,
+                                      sentence_gap_ms, stats, pool)
+
+    done = {}  # (model, text) -> result, while other tasks still need it
+    for model, code, text in tasks:
+        key = (model, text)
+        if key in done:
+            result = done[key]
+        else:
+            _, _, _, *result = next(results)
+            if sentence_gap_ms is None:
+                stats.made += len(result[0] or b'')
+        pending[key] -= 1
+        if pending[key]:
+            done[key] = result
+            if sentence_gap_ms is None:
+                stats.reused += len(result[0] or b'') * pending[key]
+        else:
+            done.pop(key, None)
+        yield model, code, text, *result
+
+
+def timed_results(results, stats: DedupStats):
+    """Pass results through, adding the time spent waiting for them to stats.seconds."""
+    while True:
+        t0 = time.monotonic()
+        result = next(results, None)
+        stats.seconds += time.monotonic() - t0
+        if result is None:
+            return
+        yield result
+
+
+def _assemble_fragments(unique, tasks, jobs, encoder, daemon, post, session, batch, gap_ms, stats,
+                        pool=None):
+    """
+    synthesize_unique() in sentence mode: synthesize the fragments of the
+    `unique` tasks, then assemble and encode them. `tasks` (every prompt,
+    duplicates included) only weighs the reuse statistics.
+    """
+    texts = collections.defaultdict(list)
+    for model, _, text in tasks:
+        texts[model].append(text)
+    plans = {model: FragmentPlan(model_texts) for model, model_texts in texts.items()}
+    fragments = [(model, 'sentence', s) for model, plan in plans.items() for s in plan.fragments]
+    stats.sentences += sum(sum(plan.uses.values()) for plan in plans.values())
+    stats.fragments += len(fragments)
+    print(f'  {len(fragments)} distinct sentences in {len(unique)} prompts')
+
+    pcm = collections.defaultdict(dict)     # model -> sentence -> PCM
+    errors = collections.defaultdict(dict)  # model -> sentence -> error
+    t0 = time.monotonic()
+    for n, (model, _, sentence, data, _, error) in enumerate(synthesize_all(
+            fragments, jobs, None, daemon, None, session, batch, pool), 1):
+        if error is None and not data:
+            error = RuntimeError(f"Piper produced no audio for: {sentence!r}")
+        if error is not None:
+            errors[model][sentence] = error
+        else:
+            pcm[model][sentence] = data
+        if n % 10 == 0 or n == len(fragments):
+            print(f'    sentences: {n}/{len(fragments)}')
+    stats.seconds += time.monotonic() - t0
+    for model, plan in plans.items():
+        made, reused = plan.reuse(pcm[model])
+        stats.made += made
+        stats.reused += reused
+
+    # Encode with the same bounded window as synthesize_all(), and drop each
+    # fragment once the last prompt using it is encoded
+    rates = {model: model_sample_rate(model) for model in plans}
+    left = collections.Counter((model, s) for model, _, text in unique
+                               for s in plans[model].sentences[text])
+    jobs = max(1, jobs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for (model, code, text), future in bounded(
+                unique, lambda t: pool.submit(plans[t[0]].encode, t[2], pcm[t[0]], errors[t[0]],
+                                              rates[t[0]], gap_ms, encoder, post), 2 * jobs):
+            result = future.result()
+            for sentence in plans[model].sentences[text]:
+                left[model, sentence] -= 1
+                if not left[model, sentence]:
+                    pcm[model].pop(sentence, None)
+            yield model, code, text, *result
+
+
+# ---------------------------------------------------------------------------
+# Pack assembly
+# ---------------------------------------------------------------------------
+
+def load_prompts(path: str) -> dict[str, str]:
+    """Read a JSON prompt map, dropping `_comment*` keys."""
+    with open(path) as f:
+        return {k: v for k, v in json.load(f).items() if not k.startswith('_comment')}
+
+
+# Chime entries in an official voice pack ZIP: <voice folder>/main/<code>.mp3
+CHIME_ENTRY_RE = re.compile(r'(?:^|/)main/([^/]+)\.mp3$')
+
+# Chime sources opened in this process, by (real path, size, mtime)
+_CHIME_SOURCES = {}
+
+
+class ChimeSource:
+    """
+    Stock [CHIME] MP3s, from an official voice pack ZIP or a directory
+    holding its extracted main/ folder.
+
+    A ZIP is never extracted. Its main/*.mp3 entries are indexed once (data
+    offset, sizes, CRC) and each chime is read straight from the archive:
+    stored entries are copied as they are, deflated ones are inflated.
+    open() keeps the index for the rest of the run, and with a cache
+    directory also on disk (see _chime_index()), so later builds of an
+    unchanged ZIP skip both the scan and hashing it.
+    """
+
+    def __init__(self, path: str, index: dict[str, tuple] | None = None):
+        self.path = path
+        self._index = index  # code -> (data offset, csize, usize, crc, method); None for a directory
+
+    @classmethod
+    def open(cls, path: str, cache_dir: str | None = None) -> 'ChimeSource':
+        """Open a directory or ZIP. Raises OSError or ValueError if it cannot be used."""
+        if os.path.isdir(path):
+            return cls(path)
+        st = os.stat(path)
+        key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+        source = _CHIME_SOURCES.get(key)
+        if source is None:
+            source = _CHIME_SOURCES[key] = cls(path, _chime_index(path, key, cache_dir))
+        return source
+
+    def location(self, code: str) -> str:
+        if self._index is None:
+            return os.path.join(self.path, f'{code}.mp3')
+        return f'{self.path}: main/{code}.mp3'
+
+    def has(self, code: str) -> bool:
+        if self._index is None:
+            return os.path.exists(self.location(code))
+        return code in self._index
+
+    def read(self, code: str) -> tuple[bytes, int]:
+        """The MP3 for `code` and its CRC-32."""
+        if self._index is None:
+            with open(self.location(code), 'rb') as f:
+                data = f.read()
+            return data, zlib.crc32(data)
+        offset, csize, usize, crc, method = self._index[code]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(csize)
+        if len(data) != csize:
+            raise ValueError(f'{self.location(code)}: truncated')
+        if method == zipfile.ZIP_DEFLATED:
+            try:
+                data = zlib.decompress(data, -15)
+            except zlib.error as e:
+                raise ValueError(f'{self.location(code)}: {e}') from None
+        if len(data) != usize:
+            raise ValueError(f'{self.location(code)}: size does not match the archive')
+        return data, crc
+
+
+def _chime_index(zip_path: str, key: tuple, cache_dir: str | None) -> dict[str, tuple]:
+    """
+    The chime index of `zip_path`, whose (realpath, size, mtime_ns) is `key`.
+
+    With a cache directory, chimes/paths/ maps each key to the ZIP's SHA-256
+    and chimes/<sha256>.json holds the index. The ZIP is only hashed when
+    its key is new, e.g. after it was replaced or copied, and only scanned
+    when its content is new.
+    """
+    if not cache_dir:
+        with tracing.span('chime_index', zip=os.path.basename(zip_path)):
+            return _scan_chime_zip(zip_path)
+
+    key = list(key)
+    key_path = os.path.join(cache_dir, 'chimes', 'paths',
+                            f'{hashlib.sha256(json.dumps(key).encode()).hexdigest()}.json')
+    digest = None
+    try:
+        with open(key_path) as f:
+            entry = json.load(f)
+        if entry['key'] == key:
+            digest = entry['sha256']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    new_key = digest is None
+    if new_key:
+        digest = file_sha256(zip_path)
+
+    index_path = os.path.join(cache_dir, 'chimes', f'{digest}.json')
+    try:
+        with open(index_path) as f:
+            index = {code: tuple(e) for code, e in json.load(f).items()}
+    except (OSError, ValueError, AttributeError, TypeError):
+        with tracing.span('chime_index', zip=os.path.basename(zip_path)):
+            index = _scan_chime_zip(zip_path)
+        _write_json(index_path, index)
+    if new_key:
+        _write_json(key_path, {'key': key, 'sha256': digest})
+    return index
+
+
+def _write_json(path: str, obj) -> None:
+    """Write `obj` to `path` atomically, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _scan_chime_zip(zip_path: str) -> dict[str, tuple]:
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f'{zip_path}: {e}') from None
+    index = {}
+    with zf, open(zip_path, 'rb') as f:
+        for info in zf.infolist():
+            m = CHIME_ENTRY_RE.search(info.filename)
+            if not m:
+                continue
+            code = m.group(1)
+            if code in index:
+                raise ValueError(f'{zip_path}: more than one main/{code}.mp3')
+            if info.flag_bits & 1:
+                raise ValueError(f'{zip_path}: {info.filename} is encrypted')
+            if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                raise ValueError(f'{zip_path}: {info.filename} uses unsupported '
+                                 f'compression method {info.compress_type}')
+            # The data starts after the local header, whose extra field can
+            # differ in length from the central directory's
+            f.seek(info.header_offset)
+            header = f.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                raise ValueError(f'{zip_path}: corrupt local header for {info.filename}')
+            name_len, extra_len = struct.unpack_from('<HH', header, 26)
+            index[code] = (info.header_offset + 30 + name_len + extra_len, info.compress_size,
+                           info.file_size, info.CRC, info.compress_type)
+    if not index:
+        raise ValueError(f'{zip_path}: no main/*.mp3 entries, not a voice pack ZIP')
+    return index
+
+
+def check_chimes(prompts: dict[str, str], chimes: ChimeSource | None) -> str | None:
+    """Return an error message if a [CHIME] prompt has no source file, else None."""
+    codes = sorted(k for k, v in prompts.items() if v == '[CHIME]')
+    if codes and not chimes:
+        return (
+            f"{len(codes)} prompts are marked [CHIME] but --chime-src was not provided.\n"
+            f"Pass an official voice pack ZIP, or the main/ directory extracted from one, "
+            f"as --chime-src.\n"
+            f"Chime files: {', '.join(codes)}"
+        )
+    for code in codes:
+        if not chimes.has(code):
+            return f"Chime file not found: {chimes.location(code)}"
+    return None
+
+
+def open_chimes(path: str | None, cache_dir: str | None = None) -> ChimeSource | None:
+    """ChimeSource.open() for a --chime-src value, exiting with a message if it is unusable."""
+    if not path:
+        return None
+    try:
+        return ChimeSource.open(path, cache_dir)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: --chime-src: {e}")
+
+
+def write_pack_zip(zip_path: str, voice_name: str, config: bytes, prompts: dict[str, str],
+                   chimes: ChimeSource | None, audio, keep_dir: str | None = None) -> tuple[int, str] | None:
+    """
+    Stream config.yaml, chimes and speech into `zip_path`, in name order.
+
+    `audio(code)` returns the MP3 for a speech prompt, or None if it failed.
+    The ZIP is written to a .tmp file and only moved into place (with an
+    md5sum-compatible .md5 sidecar) if every prompt succeeded; the .tmp file
+    is removed if one failed or an exception escapes. Returns (size, md5),
+    or None if any prompt failed. With `keep_dir`, the unpacked files are
+    also written there.
+    """
+    if keep_dir:
+        os.makedirs(os.path.join(keep_dir, 'main'), exist_ok=True)
+    tmp_path = zip_path + '.tmp'
+    failed = False
+    try:
+        with StreamingZipWriter(tmp_path) as zw:
+            zw.writestr(f'{voice_name}/config.yaml', config, compress=True)
+            if keep_dir:
+                with open(os.path.join(keep_dir, 'config.yaml'), 'wb') as f:
+                    f.write(config)
+
+            for code in sorted(prompts):
+                name = f'{voice_name}/main/{code}.mp3'
+                if prompts[code] == '[CHIME]':
+                    with tracing.span('chime_read', code=code):
+                        data, crc = chimes.read(code)
+                    print(f'  [CHIME] {code}')
+                    zw.write_raw(name, data, zipfile.ZIP_STORED, crc, len(data))
+                else:
+                    data = audio(code)
+                    if data is None:
+                        failed = True
+                        continue
+                    zw.writestr(name, data)
+                if keep_dir:
+                    with open(os.path.join(keep_dir, 'main', f'{code}.mp3'), 'wb') as f:
+                        f.write(data)
+    except BaseException:
+        # A chime, the audio callback or the disk failed mid-write
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if failed:
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, zip_path)
+    write_md5_sidecar(zip_path, zw.md5)
+    return zw.size, zw.md5
+
+
+def check_pack(zip_path: str, pack_id: int, version: int) -> bool:
+    """Run validate_voice_pack.py's checks on a built pack and print any problems."""
+    import validate_voice_pack
+
+    with tracing.span('validate'):
+        report = validate_voice_pack.validate_pack(zip_path, pack_id, version)
+    if report.ok and not report.warnings and not any(f['warnings'] for f in report.files.values()):
+        print(f'Validated {len(report.files)} MP3s in {report.seconds * 1000:.0f} ms')
+    else:
+        validate_voice_pack.print_report(report)
+    return report.ok
+
+
+def write_md5_sidecar(zip_path: str, md5: str) -> None:
+    """md5sum-compatible sidecar, used by serve_voice_pack.py for ETag/Content-MD5."""
+    with open(zip_path + '.md5', 'w') as f:
+        f.write(f'{md5}  {os.path.basename(zip_path)}\n')
+
+
+# ---------------------------------------------------------------------------
+# Watch mode
+# ---------------------------------------------------------------------------
+
+WATCH_INTERVAL = 0.3  # seconds between checks of the prompts file
+
+# Compact a patched ZIP once superseded data exceeds this fraction of the file
+WATCH_COMPACT_RATIO = 0.5
+
+
+def push_pack(devices: list[dict], url: str, pack_id: int, version: int, size: int,
+              md5: str) -> None:
+    """Push DPS 162 for a freshly built pack to every device (see send_voice_pack.py)."""
+    import send_voice_pack
+
+    payload = send_voice_pack.build_dps162(pack_id, url, md5, version, size)
+    print(f'Pushing version {version} to {len(devices)} device(s) ...')
+    for r in send_voice_pack.push_fleet(devices, payload, retries=1):
+        state = r['fields'].get(5) if r['fields'] else None
+        print(f"  {r['device']['name'] or r['device']['device_id']}: "
+              f"{r['error'] or (f'state {state}' if r['fields'] else 'no response')}")
+
+
+def watch_prompts(args, voice_name: str, zip_path: str, prompts: dict[str, str],
+                  chimes: ChimeSource | None, cache: SynthesisCache | None, devices: list[dict] | None, url: str,
+                  post: AudioPost | None = None) -> None:
+    """
+    Patch `zip_path` whenever the prompts file changes, until interrupted.
+
+    Only prompts whose text changed are synthesized, and only their entries
+    and config.yaml are replaced in the ZIP (see ZipPatcher). Each patch
+    bumps the pack version so the vacuum accepts it, and is pushed to
+    `devices` if given.
+    """
+    patcher = ZipPatcher(zip_path)
+    keep_dir = os.path.join(args.out_dir, voice_name) if args.keep_files else None
+    version = args.pack_version
+    session = session_settings(args, args.jobs)
+    # Without the daemon the model stays loaded for the whole session: in
+    # this process with --jobs 1, else in one worker pool shared by every patch
+    pool = None
+    loaded = False
+
+    def load_model():
+        nonlocal pool, loaded
+        import_piper()
+        print(f'\nLoading Piper voice model: {args.voice_model}')
+        if args.jobs <= 1:
+            preload_voice(args.voice_model, session, args.batch > 1)
+        else:
+            pool = synthesis_pool(args.jobs, session, args.batch, args.voice_model)
+        loaded = True
+
+    if args.no_daemon or not os.path.exists(args.daemon_socket):
+        load_model()
+
+    def stamp():
+        st = os.stat(args.prompts)
+        return st.st_mtime_ns, st.st_size
+
+    try:
+        last = stamp()
+        print(f'\nWatching {args.prompts} for changes (Ctrl+C to stop) ...')
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            try:
+                current = stamp()
+            except FileNotFoundError:
+                continue  # editor is replacing the file
+            if current == last:
+                continue
+            last = current
+            t0 = time.monotonic()
+            try:
+                new = load_prompts(args.prompts)
+            except (OSError, ValueError) as e:
+                print(f'  Cannot read {args.prompts}: {e}', file=sys.stderr)
+                continue
+            changed = sorted(code for code in new if prompts.get(code) != new[code])
+            removed = sorted(set(prompts) - set(new))
+            if not changed and not removed:
+                continue
+            error = check_chimes(new, chimes)
+            if error:
+                print(f'  ERROR: {error}', file=sys.stderr)
+                continue
+
+            print(f'\n{len(changed)} changed, {len(removed)} removed: {", ".join(changed + removed)}')
+            audio = {}
+            tasks = []
+            for code in changed:
+                if new[code] == '[CHIME]':
+                    audio[code] = chimes.read(code)[0]
+                elif cache and cache.contains(new[code]):
+                    audio[code] = cache.get(new[code])
+                else:
+                    tasks.append((args.voice_model, code, new[code]))
+            daemon = None if args.no_daemon else SynthDaemonClient.connect(args.daemon_socket)
+            if daemon is None and tasks and not loaded:
+                load_model()
+            failed = broken = False
+            try:
+                for _, code, text, data, trimmed, error in synthesize_unique(
+                        tasks, args.jobs, args.encoder, daemon, post, session, args.batch,
+                        args.sentence_gap_ms, pool=pool):
+                    print(f'  {code}: {text[:70]}{trim_summary(trimmed)}')
+                    if error is not None:
+                        print(f'      FAILED: {error}', file=sys.stderr)
+                        failed = True
+                        broken = broken or isinstance(error, BrokenProcessPool)
+                        continue
+                    if cache:
+                        cache.put(text, data)
+                    audio[code] = data
+            except BrokenProcessPool as e:
+                print(f'  FAILED: {e}', file=sys.stderr)
+                failed = broken = True
+            if broken and pool is not None:
+                pool.shutdown(cancel_futures=True)  # a worker died; the next save starts new ones
+                pool, loaded = None, False
+            if failed or None in audio.values():
+                print('  ZIP not updated; fix the prompts and save again.', file=sys.stderr)
+                continue
+
+            version += 1
+            config = f'id: {args.pack_id}\nversion: {version}\n'.encode()
+            patcher.writestr(f'{voice_name}/config.yaml', config, compress=True)
+            for code in removed:
+                patcher.remove(f'{voice_name}/main/{code}.mp3')
+            for code in changed:
+                patcher.writestr(f'{voice_name}/main/{code}.mp3', audio[code])
+            size, md5 = patcher.commit()
+            if patcher.dead > patcher.size * WATCH_COMPACT_RATIO:
+                size, md5 = patcher.compact()
+            write_md5_sidecar(zip_path, md5)
+            prompts = new
+
+            if keep_dir:
+                with open(os.path.join(keep_dir, 'config.yaml'), 'wb') as f:
+                    f.write(config)
+                for code in removed:
+                    try:
+                        os.remove(os.path.join(keep_dir, 'main', f'{code}.mp3'))
+                    except FileNotFoundError:
+                        pass
+                for code in changed:
+                    with open(os.path.join(keep_dir, 'main', f'{code}.mp3'), 'wb') as f:
+                        f.write(audio[code])
+
+            print(f'Patched {zip_path} in {time.monotonic() - t0:.1f}s: '
+                  f'version {version}, {size} bytes, MD5 {md5}')
+            if not check_pack(zip_path, args.pack_id, version):
+                print('  Not pushing: the pack failed validation.', file=sys.stderr)
+            elif devices:
+                push_pack(devices, url, args.pack_id, version, size, md5)
+
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
 
 def main():
@@ -89,12 +1729,17 @@ def main():
     )
     parser.add_argument(
         '--chime-src', default=None,
-        help='Directory containing stock chime MP3s (e.g. en_us_female/main from an official ZIP). '
-             'Required if any prompts are marked [CHIME].',
+        help='Official voice pack ZIP to take the stock chime MP3s from, or a directory holding '
+             'them (e.g. en_us_female/main extracted from one). Required if any prompts are '
+             'marked [CHIME].',
     )
     parser.add_argument(
         '--out-dir', default='/tmp/custom_voice_pack',
-        help='Output directory for extracted files and ZIP (default: /tmp/custom_voice_pack)',
+        help='Output directory for the ZIP (default: /tmp/custom_voice_pack)',
+    )
+    parser.add_argument(
+        '--keep-files', action='store_true',
+        help='Also write the unpacked <voice_name>/ directory next to the ZIP',
     )
     parser.add_argument(
         '--pack-id', type=int, default=502,
@@ -104,69 +1749,190 @@ def main():
         '--pack-version', type=int, default=16,
         help='Version number. Must be higher than currently installed (502=v15, 501=v13). (default: 16)',
     )
+    parser.add_argument(
+        '--jobs', type=int, default=1,
+        help='Number of parallel synthesis workers, each loading its own copy of the model '
+             '(0 = one per CPU core, default: 1)',
+    )
+    parser.add_argument(
+        '--encoder', choices=sorted(ENCODERS), default='ffmpeg',
+        help='MP3 encoding backend: ffmpeg spawns one process per prompt, lame encodes '
+             'in-process with lameenc (default: ffmpeg)',
+    )
+    parser.add_argument(
+        '--cache-dir', default=DEFAULT_CACHE_DIR,
+        help=f'Synthesis cache directory (default: {DEFAULT_CACHE_DIR})',
+    )
+    parser.add_argument(
+        '--cache-size-mb', type=int, default=512,
+        help='Evict least recently used cache entries beyond this size (default: 512)',
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='Re-synthesize every prompt without reading or writing the cache',
+    )
+    parser.add_argument(
+        '--daemon-socket', default=DEFAULT_DAEMON_SOCKET,
+        help='Use the synth_daemon.py listening here if it is running, instead of loading '
+             f'the model in-process (default: {DEFAULT_DAEMON_SOCKET})',
+    )
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        help='Always load the model in-process, even if synth_daemon.py is running',
+    )
+    parser.add_argument(
+        '--trace', metavar='OUT_JSON', default=None,
+        help='Record a timeline of the build (Chrome trace-event JSON, open in ui.perfetto.dev)',
+    )
     parser.add_argument(
         '--server-ip', default=None,
         help='Your server IP for the printed URL hint (optional, e.g. 192.168.1.100)',
     )
+    parser.add_argument(
+        '--batch', type=int, default=1, metavar='N',
+        help='Run up to N sentences per inference call (needs: pip install onnx; default: 1)',
+    )
+    parser.add_argument(
+        '--sentence-gap-ms', type=float, default=None, metavar='MS',
+        help='Synthesize each distinct sentence once and assemble prompts from the shared '
+             'fragments, with MS of silence between sentences (0 joins them like Piper does)',
+    )
+    add_ort_arguments(parser)
+    add_postprocess_arguments(parser)
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='After building, keep watching --prompts and patch the ZIP with each saved '
+             'change, bumping the pack version every time',
+    )
+    parser.add_argument(
+        '--push', metavar='INVENTORY', default=None,
+        help='Push DPS 162 to the devices in this CSV/JSON inventory (see send_voice_pack.py) '
+             'after the build and after every --watch update. Requires --server-ip.',
+    )
     args = parser.parse_args()
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    if args.encoder == 'lame' and lameenc is None:
+        sys.exit("lameenc not installed. Run: pip install lameenc")
+    post = AudioPost.from_args(args)
+    if (post or args.batch > 1) and np is None:
+        sys.exit("numpy not installed. Run: pip install numpy")
+    if args.batch > 1 and importlib.util.find_spec('onnx') is None:
+        sys.exit("onnx not installed (needed for --batch). Run: pip install onnx")
+    session = session_settings(args, args.jobs)
+    if args.trace:
+        tracing.enable('build_voice_pack')
+    devices = None
+    if args.push:
+        if not args.server_ip:
+            parser.error('--push needs --server-ip for the download URL')
+        from send_voice_pack import load_inventory
+        try:
+            devices = load_inventory(args.push)
+        except (OSError, ValueError) as e:
+            sys.exit(f"ERROR: {e}")
 
     # Determine voice/folder name
     voice_name = VOICE_PACK_NAMES.get(args.pack_id, f'custom_{args.pack_id}')
 
-    # Validate chime source
-    with open(args.prompts) as f:
-        prompts = {k: v for k, v in json.load(f).items() if not k.startswith('_comment')}
-
-    chimes = {k for k, v in prompts.items() if v == '[CHIME]'}
+    # Load prompts and validate chime source
+    prompts = load_prompts(args.prompts)
     speech = {k: v for k, v in prompts.items() if v != '[CHIME]'}
+    chimes = open_chimes(args.chime_src, None if args.no_cache else args.cache_dir)
+    error = check_chimes(prompts, chimes)
+    if error:
+        sys.exit(f"ERROR: {error}")
 
-    if chimes and not args.chime_src:
-        sys.exit(
-            f"ERROR: {len(chimes)} prompts are marked [CHIME] but --chime-src was not provided.\n"
-            f"Extract an official voice pack ZIP and pass its main/ directory as --chime-src.\n"
-            f"Chime files: {', '.join(sorted(chimes))}"
-        )
+    os.makedirs(args.out_dir, exist_ok=True)
 
-    out_voice_dir = os.path.join(args.out_dir, voice_name)
-    os.makedirs(os.path.join(out_voice_dir, 'main'), exist_ok=True)
-
-    # Copy chime files
-    if chimes:
-        print(f'Copying {len(chimes)} chime files from {args.chime_src}...')
-        for code in sorted(chimes):
-            src = os.path.join(args.chime_src, f'{code}.mp3')
-            dst = os.path.join(out_voice_dir, 'main', f'{code}.mp3')
-            if not os.path.exists(src):
-                sys.exit(f"ERROR: Chime file not found: {src}")
-            shutil.copy2(src, dst)
-            print(f'  [CHIME] {code}')
-
-    # Synthesize speech files
-    print(f'\nLoading Piper voice model: {args.voice_model}')
-    voice = PiperVoice.load(args.voice_model)
-
-    print(f'Generating {len(speech)} speech files...')
-    for i, (code, text) in enumerate(sorted(speech.items()), 1):
-        dst = os.path.join(out_voice_dir, 'main', f'{code}.mp3')
-        print(f'  [{i:2d}/{len(speech)}] {code}: {text[:70]}')
-        synthesize_mp3(voice, text, dst)
-
-    # Write config.yaml
-    config_path = os.path.join(out_voice_dir, 'config.yaml')
-    with open(config_path, 'w') as f:
-        f.write(f'id: {args.pack_id}\nversion: {args.pack_version}\n')
-    print(f'\nWrote config.yaml  (id={args.pack_id}, version={args.pack_version})')
+    # Work out which speech prompts need synthesizing
+    cache = None
+    if not args.no_cache:
+        cache = SynthesisCache(args.cache_dir, args.voice_model, args.cache_size_mb << 20,
+                               args.encoder, post, args.sentence_gap_ms)
+    tasks = [
+        (args.voice_model, code, text) for code, text in sorted(speech.items())
+        if cache is None or not cache.contains(text)
+    ]
+    missing = {code for _, code, _ in tasks}
 
-    # Build ZIP
+    daemon = None
+    if tasks:
+        if not args.no_daemon:
+            daemon = SynthDaemonClient.connect(args.daemon_socket)
+        if daemon:
+            print(f'\nUsing synthesis daemon at {args.daemon_socket}'
+                  + (' (--batch and --ort-* apply to in-process synthesis only)'
+                     if session or args.batch > 1 else ''))
+        else:
+            import_piper()  # fail here, not inside every pool worker
+            print(f'\nLoading Piper voice model: {args.voice_model}'
+                  + (f' ({args.jobs} workers)' if args.jobs > 1 else ''))
+            if session or args.batch > 1:
+                print(f'  ONNX Runtime: {session or "defaults"}'
+                      + (f', {args.batch} sentences per inference' if args.batch > 1 else ''))
+        print(f'Generating {len(tasks)} speech files...')
+
+    # Stream config.yaml, chimes and speech straight into the ZIP, in name order
+    config = f'id: {args.pack_id}\nversion: {args.pack_version}\n'.encode()
     zip_path = os.path.join(args.out_dir, f'{voice_name}.zip')
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        zf.write(config_path, f'{voice_name}/config.yaml')
-        main_dir = os.path.join(out_voice_dir, 'main')
-        for fname in sorted(os.listdir(main_dir)):
-            zf.write(os.path.join(main_dir, fname), f'{voice_name}/main/{fname}')
+    dedup = DedupStats()
+    results = synthesize_unique(tasks, args.jobs, args.encoder, daemon, post, session, args.batch,
+                                args.sentence_gap_ms, dedup)
+    errors = []
+    done = 0
+    total_trimmed = 0.0
+    synthesized_bytes = 0
+
+    def audio(code):
+        nonlocal done, total_trimmed, synthesized_bytes
+        if code in missing:
+            _, _, text, data, trimmed, error = next(results)
+            done += 1
+            print(f'  [{done:2d}/{len(tasks)}] {code}: {text[:70]}{trim_summary(trimmed)}')
+            if error is not None:
+                print(f'      FAILED: {error}', file=sys.stderr)
+                errors.append((code, error))
+                return None
+            if cache:
+                cache.put(text, data)
+            total_trimmed += trimmed
+            synthesized_bytes += len(data)
+            return data
+        data = cache.get(speech[code])
+        if data is None:
+            errors.append((code, RuntimeError('cache entry evicted during build')))
+        return data
 
-    size = os.path.getsize(zip_path)
-    md5  = hashlib.md5(open(zip_path, 'rb').read()).hexdigest()
+    written = write_pack_zip(zip_path, voice_name, config, prompts, chimes, audio,
+                             os.path.join(args.out_dir, voice_name) if args.keep_files else None)
+
+    if cache:
+        evicted = cache.evict()
+        print(f'\nSynthesis cache ({args.cache_dir}): {cache.hits} hits, {cache.misses} misses'
+              + (f', {evicted} entries evicted' if evicted else ''))
+
+    if dedup.texts < dedup.prompts or dedup.sentences:
+        print(f'\nDeduplication: {dedup.summary()}')
+
+    if post and tasks:
+        saved = trim_saving(total_trimmed)
+        print(f'\nPost-processing trimmed {total_trimmed:.1f}s of audio from {len(tasks)} prompts, '
+              f'an estimated {saved} bytes at {MP3_BITRATE_KBPS} kbps '
+              f'({saved / max(1, saved + synthesized_bytes):.0%} of their MP3 size)')
+
+    if args.trace:
+        print(f'Trace: {tracing.write(args.trace)} spans written to {args.trace}')
+
+    if written is None:
+        print(f'\nERROR: {len(errors)} of {len(speech)} prompts failed:', file=sys.stderr)
+        for code, error in errors:
+            print(f'  {code}: {error}', file=sys.stderr)
+        sys.exit(1)
+
+    size, md5 = written
+    print(f'\nWrote config.yaml  (id={args.pack_id}, version={args.pack_version})')
+    valid = check_pack(zip_path, args.pack_id, args.pack_version)
 
     zip_name = os.path.basename(zip_path)
     url_hint = f'http://{args.server_ip}/{zip_name}' if args.server_ip else f'http://YOUR_SERVER_IP/{zip_name}'
@@ -175,7 +1941,7 @@ def main():
     print(f'  Size : {size} bytes')
     print(f'  MD5  : {md5}')
     print(f'\nRun the HTTP server:')
-    print(f'  cd {args.out_dir} && python3 -m http.server 80')
+    print(f'  sudo python3 serve_voice_pack.py --dir {args.out_dir}')
     print(f'\nThen push to the vacuum:')
     print(f'  python3 send_voice_pack.py \\')
     print(f'    --device-id YOUR_DEVICE_ID \\')
@@ -187,6 +1953,18 @@ def main():
     print(f'    --set-id {args.pack_id} \\')
     print(f'    --version {args.pack_version}')
 
+    if devices and valid:
+        print()
+        push_pack(devices, url_hint, args.pack_id, args.pack_version, size, md5)
+    elif devices:
+        print('\nNot pushing: the pack failed validation.', file=sys.stderr)
+    if args.watch:
+        try:
+            watch_prompts(args, voice_name, zip_path, prompts, chimes, cache, devices, url_hint,
+                          post)
+        except KeyboardInterrupt:
+            print('\nStopped watching.')
+
 
 if __name__ == '__main__':
     main()
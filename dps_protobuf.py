@@ -0,0 +1,490 @@
+"""
+dps_protobuf.py — Schema-driven protobuf codec for Tuya DPS values.
+
+Eufy sends some datapoints (DPS 162 among them) as base64 of a varint
+length prefix followed by a protobuf message. This module decodes and
+encodes those messages from a small schema:
+
+    PACK = Message('pack', [
+        Field(1, 'set_id', 'uint32'),
+        Field(2, 'url', 'string'),
+    ])
+    PACK.encode({'set_id': 502, 'url': 'http://...'})  ->  bytes
+    decode_dps(value, PACK)                            ->  {'set_id': 502, 'url': ...}
+
+  - Every wire type: varint, 64-bit, length-delimited, groups, 32-bit
+  - Nested messages and groups are parsed in place over one memoryview of
+    the payload; `bytes` fields come back as memoryview slices of it, so
+    nothing is copied until a field is turned into a str or bytes
+  - Repeated fields (packed or not); fields that are not in the schema, or
+    arrive with a different wire type, are kept in `_unknown` and written
+    back by encode(), so decode/encode round-trips byte for byte
+  - decode_dps_batch() decodes thousands of captured values at once,
+    decoding each distinct value only once (devices repeat the same
+    status over and over)
+
+Malformed input raises DecodeError (a ValueError) and nothing else.
+decode_fields() decodes without a schema, for exploring unknown DPS.
+"""
+
+import binascii
+import struct
+from typing import Iterable, NamedTuple
+
+# Wire types
+VARINT, I64, LEN, SGROUP, EGROUP, I32 = 0, 1, 2, 3, 4, 5
+
+# Nested messages/groups deeper than this are rejected (guards against hostile input)
+MAX_DEPTH = 32
+
+_MISSING = object()
+_MASK32 = (1 << 32) - 1
+_MASK64 = (1 << 64) - 1
+
+
+class DecodeError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Varints
+# ---------------------------------------------------------------------------
+
+_SMALL_VARINTS = [bytes((i,)) for i in range(0x80)]
+
+
+def encode_varint(v: int) -> bytes:
+    if v < 0:
+        v &= _MASK64  # negative int32/int64: ten-byte two's complement
+    if v < 0x80:
+        return _SMALL_VARINTS[v]
+    out = bytearray()
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+    return bytes(out)
+
+
+def read_varint(buf, pos: int, end: int | None = None) -> tuple[int, int]:
+    """Read a varint from `buf` at `pos`. Returns (value, position after it)."""
+    if end is None:
+        end = len(buf)
+    if pos >= end:
+        raise DecodeError(f'truncated varint at offset {pos}')
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    result, shift = b & 0x7F, 7
+    pos += 1
+    while True:
+        if pos >= end:
+            raise DecodeError(f'truncated varint at offset {pos}')
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise DecodeError(f'varint longer than 10 bytes at offset {pos}')
+
+
+def _tag(number: int, wire_type: int) -> bytes:
+    return encode_varint((number << 3) | wire_type)
+
+
+# ---------------------------------------------------------------------------
+# Schema
+# ---------------------------------------------------------------------------
+
+def _signed(v: int, bits: int) -> int:
+    v &= (1 << bits) - 1
+    return v - (1 << bits) if v >> (bits - 1) else v
+
+
+# kind -> (wire type, decode raw value, encode to raw value)
+_KINDS = {
+    'uint32':   (VARINT, lambda v: v & _MASK32, int),
+    'uint64':   (VARINT, lambda v: v & _MASK64, int),
+    'int32':    (VARINT, lambda v: _signed(v, 32), int),
+    'int64':    (VARINT, lambda v: _signed(v, 64), int),
+    'sint32':   (VARINT, lambda v: (v >> 1) ^ -(v & 1), lambda v: ((v << 1) ^ (v >> 31)) & _MASK32),
+    'sint64':   (VARINT, lambda v: (v >> 1) ^ -(v & 1), lambda v: ((v << 1) ^ (v >> 63)) & _MASK64),
+    'bool':     (VARINT, bool, int),
+    'enum':     (VARINT, lambda v: _signed(v, 32), int),
+    'fixed32':  (I32, struct.Struct('<I'), None),
+    'sfixed32': (I32, struct.Struct('<i'), None),
+    'float':    (I32, struct.Struct('<f'), None),
+    'fixed64':  (I64, struct.Struct('<Q'), None),
+    'sfixed64': (I64, struct.Struct('<q'), None),
+    'double':   (I64, struct.Struct('<d'), None),
+    'string':   (LEN, None, None),
+    'bytes':    (LEN, None, None),
+    'message':  (LEN, None, None),
+    'group':    (SGROUP, None, None),
+}
+
+
+# Varint kinds whose decoded value is the raw varint whenever it fits in one byte
+_SMALL_IDENTITY = {'uint32', 'uint64', 'int32', 'int64', 'enum'}
+
+
+class Field(NamedTuple):
+    number: int
+    name: str
+    kind: str                          # a protobuf scalar type, 'message' or 'group'
+    message: 'Message | None' = None   # schema of a 'message' or 'group' field
+    repeated: bool = False
+
+
+class Message:
+    """
+    A protobuf message schema. decode() returns a dict keyed by field name
+    holding only the fields present; encode() writes the fields of a dict
+    in schema order, then anything in `_unknown`.
+    """
+
+    def __init__(self, name: str, fields: list[Field]):
+        self.name = name
+        self.fields = fields
+        # Decoding dispatches on the whole tag, so a field arriving with the
+        # wire type the schema expects costs one dict lookup; anything else
+        # (unknown fields, packed scalars, end of group) misses and takes
+        # the slow path.
+        self._by_tag = {}
+        self._packed = {}
+        self._encoders = []
+        for f in fields:
+            if f.kind not in _KINDS:
+                raise ValueError(f'{name}.{f.name}: unknown kind {f.kind!r}')
+            if (f.kind in ('message', 'group')) != (f.message is not None):
+                raise ValueError(f'{name}.{f.name}: only message/group fields take a message')
+            wire_type, conv, _ = _KINDS[f.kind]
+            self._by_tag[(f.number << 3) | wire_type] = (
+                f.name, wire_type, conv, f.kind, f.message, f.repeated, f.kind in _SMALL_IDENTITY)
+            if f.repeated and wire_type in (VARINT, I32, I64):
+                self._packed[f.number] = (f.name, wire_type, conv)
+            self._encoders.append((f.name, f.repeated, _field_encoder(f)))
+
+    def __repr__(self):
+        return f'Message({self.name!r}, {len(self.fields)} fields)'
+
+    # -- decoding ----------------------------------------------------------
+
+    def decode(self, data) -> dict:
+        """Decode a serialized message (bytes, bytearray or memoryview)."""
+        mv = memoryview(data)
+        return self._decode(mv, 0, len(mv), 0, None)[0]
+
+    def _decode(self, buf: memoryview, pos: int, end: int, depth: int,
+                group: int | None) -> tuple[dict, int]:
+        if depth > MAX_DEPTH:
+            raise DecodeError(f'nesting deeper than {MAX_DEPTH}')
+        out = {}
+        by_tag = self._by_tag
+        while pos < end:
+            tag = buf[pos]
+            if tag < 0x80:
+                pos += 1
+            else:
+                tag, pos = read_varint(buf, pos, end)
+            spec = by_tag.get(tag)
+            if spec is None:
+                number, wt = tag >> 3, tag & 7
+                if number == 0:
+                    raise DecodeError(f'field number 0 at offset {pos}')
+                if wt == EGROUP:
+                    if number != group:
+                        raise DecodeError(f'unexpected end of group {number} at offset {pos}')
+                    return out, pos
+                packed = self._packed.get(number) if wt == LEN else None
+                if packed is None:
+                    value, pos = _read_raw(buf, pos, end, wt, number, depth)
+                    out.setdefault('_unknown', []).append((number, wt, value))
+                    continue
+                n, pos = read_varint(buf, pos, end)
+                if pos + n > end:
+                    raise DecodeError(f'field {number} runs past the end of its message')
+                name, field_wt, conv = packed
+                out.setdefault(name, []).extend(_unpack(buf, pos, pos + n, field_wt, conv))
+                pos += n
+                continue
+
+            name, wt, conv, kind, message, repeated, small_identity = spec
+            if wt == VARINT:
+                if pos < end and buf[pos] < 0x80:
+                    value = buf[pos] if small_identity else conv(buf[pos])
+                    pos += 1
+                else:
+                    raw, pos = read_varint(buf, pos, end)
+                    value = conv(raw)
+            elif wt == LEN:
+                if pos < end and buf[pos] < 0x80:
+                    n = buf[pos]
+                    pos += 1
+                else:
+                    n, pos = read_varint(buf, pos, end)
+                if pos + n > end:
+                    raise DecodeError(f'field {tag >> 3} runs past the end of its message')
+                if kind == 'string':
+                    try:
+                        value = str(buf[pos:pos + n], 'utf-8')
+                    except UnicodeDecodeError as e:
+                        raise DecodeError(f'field {tag >> 3} is not valid UTF-8: {e}') from None
+                elif kind == 'message':
+                    value = message._decode(buf, pos, pos + n, depth + 1, None)[0]
+                else:
+                    value = buf[pos:pos + n]
+                pos += n
+            elif wt == SGROUP:
+                value, pos = message._decode(buf, pos, end, depth + 1, tag >> 3)
+            else:  # I32 / I64
+                size = conv.size
+                if pos + size > end:
+                    raise DecodeError(f'truncated fixed{size * 8} field {tag >> 3}')
+                value = conv.unpack_from(buf, pos)[0]
+                pos += size
+
+            if repeated:
+                out.setdefault(name, []).append(value)
+            else:
+                out[name] = value
+        if group is not None:
+            raise DecodeError(f'group {group} is not terminated')
+        return out, pos
+
+    # -- encoding ----------------------------------------------------------
+
+    def encode(self, values: dict) -> bytes:
+        parts = []
+        for name, repeated, encode in self._encoders:
+            value = values.get(name)
+            if value is None:
+                continue
+            if repeated:
+                parts.extend(encode(v) for v in value)
+            else:
+                parts.append(encode(value))
+        for number, wt, value in values.get('_unknown', ()):
+            parts.append(_encode_raw(number, wt, value))
+        return b''.join(parts)
+
+
+def _unpack(buf: memoryview, pos: int, end: int, wt: int, conv) -> list:
+    values = []
+    while pos < end:
+        if wt == VARINT:
+            raw, pos = read_varint(buf, pos, end)
+            values.append(conv(raw))
+        else:
+            size = conv.size
+            if pos + size > end:
+                raise DecodeError('truncated packed field')
+            values.append(conv.unpack_from(buf, pos)[0])
+            pos += size
+    return values
+
+
+def _field_encoder(field: Field):
+    """A function writing one value of `field`, tag included."""
+    wt, conv, to_raw = _KINDS[field.kind]
+    tag = _tag(field.number, wt)
+    if wt == VARINT:
+        if to_raw is int:
+            return lambda v: tag + encode_varint(int(v))
+        return lambda v: tag + encode_varint(to_raw(v))
+    if field.kind == 'message':
+        message = field.message
+        def encode(v):
+            data = message.encode(v)
+            return tag + encode_varint(len(data)) + data
+        return encode
+    if wt == LEN:
+        def encode(v):
+            if isinstance(v, str):
+                v = v.encode()
+            return tag + encode_varint(len(v)) + bytes(v)
+        return encode
+    if wt == SGROUP:
+        message, end_tag = field.message, _tag(field.number, EGROUP)
+        return lambda v: tag + message.encode(v) + end_tag
+    return lambda v: tag + conv.pack(v)
+
+
+# ---------------------------------------------------------------------------
+# Schemaless
+# ---------------------------------------------------------------------------
+
+def _read_raw(buf: memoryview, pos: int, end: int, wt: int, number: int, depth: int):
+    """One field value without a schema: int, memoryview, or a list for a group."""
+    if wt == VARINT:
+        return read_varint(buf, pos, end)
+    if wt == LEN:
+        n, pos = read_varint(buf, pos, end)
+        if pos + n > end:
+            raise DecodeError(f'field {number} runs past the end of its message')
+        return buf[pos:pos + n], pos + n
+    if wt in (I32, I64):
+        size = 4 if wt == I32 else 8
+        if pos + size > end:
+            raise DecodeError(f'truncated fixed{size * 8} field {number}')
+        return int.from_bytes(buf[pos:pos + size], 'little'), pos + size
+    if wt == SGROUP:
+        return _decode_fields(buf, pos, end, depth + 1, number)
+    raise DecodeError(f'invalid wire type {wt} for field {number}')
+
+
+def _decode_fields(buf: memoryview, pos: int, end: int, depth: int,
+                   group: int | None) -> tuple[list, int]:
+    if depth > MAX_DEPTH:
+        raise DecodeError(f'nesting deeper than {MAX_DEPTH}')
+    fields = []
+    while pos < end:
+        tag, pos = read_varint(buf, pos, end)
+        number, wt = tag >> 3, tag & 7
+        if number == 0:
+            raise DecodeError(f'field number 0 at offset {pos}')
+        if wt == EGROUP:
+            if number != group:
+                raise DecodeError(f'unexpected end of group {number} at offset {pos}')
+            return fields, pos
+        value, pos = _read_raw(buf, pos, end, wt, number, depth)
+        fields.append((number, wt, value))
+    if group is not None:
+        raise DecodeError(f'group {group} is not terminated')
+    return fields, pos
+
+
+def decode_fields(data) -> list[tuple[int, int, object]]:
+    """
+    Decode a message without a schema into (number, wire type, value)
+    tuples, in wire order. Varints and fixed-width values are unsigned ints,
+    length-delimited values are memoryviews, groups are nested lists.
+    """
+    mv = memoryview(data)
+    return _decode_fields(mv, 0, len(mv), 0, None)[0]
+
+
+def _encode_raw(number: int, wt: int, value) -> bytes:
+    if wt == VARINT:
+        return _tag(number, wt) + encode_varint(value)
+    if wt == LEN:
+        return _tag(number, wt) + encode_varint(len(value)) + bytes(value)
+    if wt in (I32, I64):
+        return _tag(number, wt) + value.to_bytes(4 if wt == I32 else 8, 'little')
+    if wt == SGROUP:
+        return (_tag(number, SGROUP) + b''.join(_encode_raw(*f) for f in value)
+                + _tag(number, EGROUP))
+    raise ValueError(f'invalid wire type {wt}')
+
+
+def encode_fields(fields: Iterable[tuple[int, int, object]]) -> bytes:
+    """Inverse of decode_fields()."""
+    return b''.join(_encode_raw(*f) for f in fields)
+
+
+# ---------------------------------------------------------------------------
+# DPS values: base64(varint(len) + message)
+# ---------------------------------------------------------------------------
+
+def _dps_span(value: str | bytes) -> tuple[memoryview, int, int]:
+    try:
+        data = binascii.a2b_base64(value)
+    except (binascii.Error, ValueError) as e:
+        raise DecodeError(f'bad base64: {e}') from None
+    mv = memoryview(data)
+    length, pos = read_varint(mv, 0)
+    if pos + length > len(mv):
+        raise DecodeError(f'length prefix {length} exceeds the {len(mv) - pos} bytes present')
+    return mv, pos, pos + length
+
+
+def dps_message(value: str | bytes) -> memoryview:
+    """The protobuf message inside a DPS value, as a view of the decoded base64."""
+    mv, pos, end = _dps_span(value)
+    return mv[pos:end]
+
+
+def decode_dps(value: str | bytes, message) -> dict:
+    """
+    Decode a base64 DPS value with `message`: a Message, or a function of
+    the protobuf message (a memoryview) returning the Message to use, such
+    as dps162_message for values that may be either direction.
+    """
+    mv, pos, end = _dps_span(value)
+    if not isinstance(message, Message):
+        message = message(mv[pos:end])
+    return message._decode(mv, pos, end, 0, None)[0]
+
+
+def encode_dps(message: Message, values: dict) -> str:
+    """Encode `values` as a base64 DPS value."""
+    data = message.encode(values)
+    return binascii.b2a_base64(encode_varint(len(data)) + data, newline=False).decode()
+
+
+def decode_dps_batch(values: Iterable[str | bytes], message,
+                     skip_errors: bool = False) -> list[dict | None]:
+    """
+    Decode many DPS values, e.g. every DPS 162 value in a capture log, with
+    `message` as in decode_dps(). Each distinct value is decoded once and
+    its dict reused for repeats, so treat the results as read-only. With
+    `skip_errors`, malformed values give None instead of raising DecodeError.
+    """
+    seen = {}
+    out = []
+    append = out.append
+    for value in values:
+        result = seen.get(value, _MISSING)
+        if result is _MISSING:
+            try:
+                result = decode_dps(value, message)
+            except DecodeError:
+                if not skip_errors:
+                    raise
+                result = None
+            seen[value] = result
+        append(result)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# DPS 162 (ecl_set_language), see docs/dps162_protocol.md
+# ---------------------------------------------------------------------------
+
+DPS162_VOICE_INFO = Message('voice_info', [
+    Field(1, 'set_id', 'uint32'),
+    Field(2, 'url', 'string'),
+    Field(3, 'md5', 'string'),
+    Field(4, 'version', 'uint32'),
+    Field(5, 'size', 'uint64'),
+])
+
+# App -> device: install request
+DPS162_REQUEST = Message('dps162_request', [
+    Field(1, 'voice_info', 'message', DPS162_VOICE_INFO),
+    Field(2, 'padding', 'bytes'),
+])
+
+# Device -> app: install status
+DPS162_STATUS = Message('dps162_status', [
+    Field(1, 'status', 'uint32'),
+    Field(2, 'installed_id', 'uint32'),
+    Field(3, 'installed_version', 'uint32'),
+    Field(4, 'target_id', 'uint32'),
+    Field(5, 'state', 'uint32'),
+])
+
+
+def dps162_message(message: bytes | memoryview) -> Message:
+    """
+    DPS162_REQUEST or DPS162_STATUS for a protobuf message (not the base64
+    value): requests wrap their fields in a nested message, field 1.
+    """
+    return DPS162_REQUEST if len(message) and message[0] & 7 == LEN else DPS162_STATUS
+
+
+def dps162_kind(value: str | bytes) -> str:
+    """'request' or 'status', for a base64 DPS 162 value."""
+    return 'request' if dps162_message(dps_message(value)) is DPS162_REQUEST else 'status'
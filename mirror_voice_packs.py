@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+mirror_voice_packs.py — Keep a local mirror of the official Eufy voice packs.
+
+Fetches the voicePackage list (see docs/eufy_api.md) and stores each
+official pack in a content-addressed store on this machine, so stock
+voices can be restored, and chimes taken, without every vacuum (or build)
+downloading the same ZIP from CloudFront:
+
+  - The list is fetched with a conditional GET (ETag / Last-Modified); when
+    it is unchanged nothing else happens
+  - A pack is only downloaded when its version or MD5 changes. Its MD5 and
+    size are verified once, when it is added to the store, and recorded in
+    a `<zip>.md5` sidecar that serve_voice_pack.py uses for ETags
+  - index.json maps each pack ID to its version, MD5, size and stored file;
+    send_voice_pack.py reads it for the current official versions
+  - --push sends a mirrored pack to vacuums with a DPS 162 URL on the LAN
+    pack server instead of CloudFront
+
+Store layout (<mirror-dir>, default ~/.local/share/eufy-voice-pack/mirror):
+
+    index.json
+    objects/<md5>.zip       one file per distinct pack, named by its MD5
+    objects/<md5>.zip.md5
+    .lock                   held while a refresh runs
+
+Usage:
+    # Refresh the mirror (the token can also come from $EUFY_API_TOKEN)
+    python3 mirror_voice_packs.py --device-id YOUR_DEVICE_ID --token YOUR_TOKEN
+
+    # List mirrored packs, or print one pack's ZIP path
+    python3 mirror_voice_packs.py --list
+    python3 build_voice_pack.py ... --chime-src "$(python3 mirror_voice_packs.py --path 501)"
+
+    # Restore the stock female voice on every vacuum from the LAN. The mirror
+    # must be served at --base-url, e.g. by keeping it inside the directory
+    # serve_voice_pack.py serves:
+    python3 mirror_voice_packs.py --mirror-dir /srv/voice/mirror --device-id ... --token ...
+    sudo python3 serve_voice_pack.py --dir /srv/voice
+    python3 mirror_voice_packs.py --mirror-dir /srv/voice/mirror --push 501 \\
+        --inventory fleet.csv --base-url http://192.168.1.100/mirror
+
+--api-url points the refresh at another server, e.g. a local stub serving
+/v1/resource/voicePackage and the ZIPs it lists.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes are not locked against each other
+    fcntl = None
+
+API_URL = 'https://api.eufylife.com'
+
+DEFAULT_MIRROR_DIR = os.path.join(
+    os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share'),
+    'eufy-voice-pack', 'mirror',
+)
+INDEX_NAME = 'index.json'
+LOCK_NAME = '.lock'
+
+
+# ---------------------------------------------------------------------------
+# voicePackage API
+# ---------------------------------------------------------------------------
+
+class VoicePackAPI:
+    """
+    The voicePackage endpoint. Mirror only calls list_packs() and
+    download(), so tests can pass any object with those two methods.
+    """
+
+    def __init__(self, token: str, device_id: str, base_url: str = API_URL, timeout: float = 30):
+        self.token = token
+        self.device_id = device_id
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def list_packs(self, validators: dict) -> tuple[list[dict] | None, dict]:
+        """
+        Return (packs, validators). `validators` holds the ETag and
+        Last-Modified of the previous response; packs is None if the list
+        has not changed since (HTTP 304).
+        """
+        query = urllib.parse.urlencode({'device_id': self.device_id})
+        req = urllib.request.Request(f'{self.base_url}/v1/resource/voicePackage?{query}',
+                                     headers={'Authorization': self.token})
+        if validators.get('etag'):
+            req.add_header('If-None-Match', validators['etag'])
+        if validators.get('last_modified'):
+            req.add_header('If-Modified-Since', validators['last_modified'])
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                body = resp.read()
+                headers = resp.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            raise OSError(f'voicePackage API: HTTP {e.code} {e.reason}') from None
+        try:
+            reply = json.loads(body)
+            packs = reply['data']['list']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f'voicePackage API: unexpected response {body[:200]!r}') from None
+        if reply.get('code') not in (0, None):
+            raise ValueError(f"voicePackage API: error {reply.get('code')}: {reply.get('msg')}")
+        new = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+        return packs, {k: v for k, v in new.items() if v}
+
+    def download(self, url: str, f) -> None:
+        """Write the file at `url` to the binary file object `f`."""
+        with urllib.request.urlopen(url, timeout=self.timeout) as resp:
+            for block in iter(lambda: resp.read(1 << 20), b''):
+                f.write(block)
+
+
+# ---------------------------------------------------------------------------
+# Mirror
+# ---------------------------------------------------------------------------
+
+def read_index(mirror_dir: str = DEFAULT_MIRROR_DIR) -> dict:
+    """
+    The mirror's index, or an empty one if there is none yet. Raises
+    ValueError if the index is corrupt.
+    """
+    path = os.path.join(mirror_dir, INDEX_NAME)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = {}
+    except ValueError as e:
+        raise ValueError(f'{path} is corrupt ({e}); delete it to rebuild the mirror') from None
+    if not isinstance(index, dict) or not all(
+            isinstance(index.get(k, {}), dict) for k in ('api', 'packs')):
+        raise ValueError(f'{path} is corrupt (not a mirror index); delete it to rebuild the mirror')
+    index.setdefault('api', {})
+    index.setdefault('packs', {})
+    return index
+
+
+def known_versions(mirror_dir: str = DEFAULT_MIRROR_DIR) -> dict[int, int]:
+    """Pack ID -> current official version, from the mirror's index ({} without one)."""
+    try:
+        packs = read_index(mirror_dir)['packs']
+        return {int(pack_id): int(p['version']) for pack_id, p in packs.items()}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+class Mirror:
+    """A content-addressed store of official voice packs and its index."""
+
+    def __init__(self, mirror_dir: str = DEFAULT_MIRROR_DIR):
+        self.dir = mirror_dir
+        self.index = read_index(mirror_dir)
+
+    @property
+    def packs(self) -> dict[str, dict]:
+        return self.index['packs']
+
+    def path(self, pack_id: int) -> str:
+        """Stored ZIP of a pack. Raises KeyError if it is not mirrored."""
+        return os.path.join(self.dir, self.packs[str(pack_id)]['file'])
+
+    def lan_url(self, pack_id: int, base_url: str) -> str:
+        """URL of a pack on a server that serves the mirror directory at `base_url`."""
+        return f"{base_url.rstrip('/')}/{self.packs[str(pack_id)]['file']}"
+
+    def refresh(self, api) -> list[tuple[int, str]]:
+        """
+        Bring the store up to date with `api`. Returns (pack ID, outcome) per
+        listed pack: 'unchanged', 'added', 'updated', 'reused' (content
+        already stored) or 'failed: ...'. Nothing is downloaded or
+        rewritten when the list has not changed.
+
+        A refresh holds a lock on the mirror directory and starts from the
+        index on disk, so refreshes in other processes wait their turn
+        instead of pruning each other's downloads or overwriting the index.
+        """
+        with self._lock():
+            self.index = read_index(self.dir)
+            return self._refresh(api)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        os.makedirs(self.dir, exist_ok=True)
+        with open(os.path.join(self.dir, LOCK_NAME), 'a') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+            yield
+
+    def _refresh(self, api) -> list[tuple[int, str]]:
+        packs, validators = api.list_packs(self.index['api'])
+        if packs is None:
+            return []
+        results = []
+        changed = validators != self.index['api']
+        for p in packs:
+            try:
+                pack_id, version = int(p['id']), int(p['version'])
+                md5, url = str(p['md5']).lower(), p['url']
+                size = int(p['size']) if p.get('size') is not None else None
+            except (KeyError, TypeError, ValueError):
+                results.append((p.get('id') if isinstance(p, dict) else None,
+                                f'failed: malformed entry {p!r}'))
+                continue
+            old = self.packs.get(str(pack_id))
+            if old and old['version'] == version and old['md5'] == md5:
+                results.append((pack_id, 'unchanged'))
+                continue
+            file = os.path.join('objects', f'{md5}.zip')
+            outcome = 'reused' if os.path.exists(os.path.join(self.dir, file)) else (
+                'updated' if old else 'added')
+            if outcome != 'reused':
+                try:
+                    size = self._ingest(api, url, md5, size)
+                except (OSError, ValueError) as e:
+                    results.append((pack_id, f'failed: {e}'))
+                    continue
+            else:
+                size = os.path.getsize(os.path.join(self.dir, file))
+            self.packs[str(pack_id)] = {
+                'id': pack_id, 'version': version, 'md5': md5, 'size': size,
+                'source_url': url, 'file': file, 'added': int(time.time()),
+            }
+            results.append((pack_id, outcome))
+            changed = True
+
+        if changed:
+            if all(not r.startswith('failed') for _, r in results):
+                self.index['api'] = validators  # otherwise retry the failed packs next time
+            self._prune()
+            self._write_index()
+        return results
+
+    def _ingest(self, api, url: str, md5: str, size: int | None) -> int:
+        """Download a pack into the store, verifying its MD5 and size. Returns its size."""
+        objects = os.path.join(self.dir, 'objects')
+        os.makedirs(objects, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=objects, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                hashing = _HashingWriter(f)
+                api.download(url, hashing)
+            if hashing.md5.hexdigest() != md5:
+                raise ValueError(f'MD5 mismatch: got {hashing.md5.hexdigest()}, API says {md5}')
+            if size is not None and hashing.size != size:
+                raise ValueError(f'size mismatch: got {hashing.size}, API says {size}')
+            path = os.path.join(objects, f'{md5}.zip')
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        with open(path + '.md5', 'w') as f:
+            f.write(f'{md5}  {os.path.basename(path)}\n')
+        return hashing.size
+
+    def _prune(self) -> None:
+        """Remove stored ZIPs no longer referenced by the index."""
+        objects = os.path.join(self.dir, 'objects')
+        if not os.path.isdir(objects):
+            return
+        keep = {os.path.basename(p['file']) for p in self.packs.values()}
+        for name in os.listdir(objects):
+            if name.split('.zip')[0] + '.zip' not in keep:
+                os.remove(os.path.join(objects, name))
+
+    def _write_index(self) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp, os.path.join(self.dir, INDEX_NAME))
+
+
+class _HashingWriter:
+    """File wrapper that hashes and counts what is written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.md5.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+
+# ---------------------------------------------------------------------------
+
+def print_packs(mirror: Mirror) -> None:
+    from build_voice_pack import VOICE_PACK_NAMES
+
+    if not mirror.packs:
+        print(f'No packs mirrored in {mirror.dir}')
+        return
+    print(f"{'id':>5}  {'folder':<14} {'version':>7} {'size':>10}  md5")
+    for pack_id, p in sorted(mirror.packs.items(), key=lambda kv: int(kv[0])):
+        print(f"{pack_id:>5}  {VOICE_PACK_NAMES.get(int(pack_id), '?'):<14} {p['version']:>7} "
+              f"{p['size']:>10,}  {p['md5']}")
+
+
+def push(mirror: Mirror, args) -> int:
+    """Push a mirrored pack to the --inventory devices from its LAN URL. Returns the exit code."""
+    from send_voice_pack import build_dps162, push_inventory
+
+    p = mirror.packs[str(args.push)]
+    url = mirror.lan_url(args.push, args.base_url)
+    print(f"Pack {args.push} v{p['version']} ({p['size']:,} bytes) from {url}")
+    payload = build_dps162(args.push, url, p['md5'], p['version'], p['size'])
+    return push_inventory(args.inventory, payload, concurrency=args.concurrency, wait=args.wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Mirror the official Eufy voice packs locally.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--mirror-dir', default=DEFAULT_MIRROR_DIR,
+                        help=f'Mirror directory (default: {DEFAULT_MIRROR_DIR})')
+    parser.add_argument('--device-id', help='Device ID for the voicePackage API')
+    parser.add_argument('--token', default=os.environ.get('EUFY_API_TOKEN'),
+                        help='API token (default: $EUFY_API_TOKEN)')
+    parser.add_argument('--api-url', default=API_URL,
+                        help=f'API base URL, e.g. a local stub for testing (default: {API_URL})')
+    parser.add_argument('--list', action='store_true', help='List mirrored packs and exit')
+    parser.add_argument('--path', type=int, metavar='ID',
+                        help="Print the stored ZIP of pack ID (e.g. for --chime-src) and exit")
+    parser.add_argument('--push', type=int, metavar='ID',
+                        help='Push mirrored pack ID to the --inventory devices from --base-url')
+    parser.add_argument('--base-url',
+                        help='--push: URL at which the LAN pack server serves --mirror-dir '
+                             '(e.g. http://192.168.1.100/mirror)')
+    parser.add_argument('--inventory', help='--push: CSV/JSON of devices, as for send_voice_pack.py')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='--push: devices pushed in parallel (default: 8)')
+    parser.add_argument('--wait', type=float, default=0.0, metavar='SECONDS',
+                        help='--push: wait up to SECONDS for install status (default: 0)')
+    args = parser.parse_args()
+
+    try:
+        mirror = Mirror(args.mirror_dir)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: {e}")
+    if args.list:
+        print_packs(mirror)
+        return
+    if args.path is not None:
+        try:
+            print(mirror.path(args.path))
+        except KeyError:
+            sys.exit(f"ERROR: pack {args.path} is not mirrored in {args.mirror_dir}")
+        return
+    if args.push is not None:
+        if not (args.base_url and args.inventory):
+            parser.error('--push needs --base-url and --inventory')
+        if str(args.push) not in mirror.packs:
+            sys.exit(f"ERROR: pack {args.push} is not mirrored in {args.mirror_dir}")
+        sys.exit(push(mirror, args))
+
+    if not (args.device_id and args.token):
+        parser.error('refreshing needs --device-id and --token (or $EUFY_API_TOKEN)')
+    api = VoicePackAPI(args.token, args.device_id, args.api_url)
+    t0 = time.monotonic()
+    try:
+        results = mirror.refresh(api)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: {e}")
+    if not results:
+        print(f'voicePackage list unchanged; mirror is up to date ({len(mirror.packs)} packs)')
+        return
+    for pack_id, outcome in results:
+        p = mirror.packs.get(str(pack_id))
+        detail = f" v{p['version']}, {p['size']:,} bytes" if outcome in ('added', 'updated', 'reused') else ''
+        print(f'  {pack_id}: {outcome}{detail}')
+    failed = sum(1 for _, r in results if r.startswith('failed'))
+    print(f'{len(results) - failed} of {len(results)} packs mirrored in {args.mirror_dir} '
+          f'({time.monotonic() - t0:.1f}s)')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
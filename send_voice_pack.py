@@ -17,12 +17,30 @@ Usage:
         --set-id 502 \\
         --version 16
 
+    # Push to many vacuums at once from an inventory (CSV or JSON)
+    python3 send_voice_pack.py \\
+        --inventory fleet.csv \\
+        --concurrency 16 \\
+        --url http://192.168.1.100/en_us_male.zip \\
+        --md5 c808f5460f6663f467af482bc94dc34f \\
+        --size 748473 \\
+        --set-id 502 \\
+        --version 16
+
+    fleet.csv:
+        name,device_id,ip,local_key
+        kitchen,ebb88d67eea31712ealsqy,192.168.1.80,0123456789abcdef
+
 See docs/dps162_protocol.md for the full protocol reference.
 See docs/getting_credentials.md for how to obtain device-id and local-key.
 """
 
 import argparse
-import base64
+import atexit
+import concurrent.futures
+import csv
+import json
+import random
 import sys
 import time
 
@@ -31,39 +49,30 @@ try:
 except ImportError:
     sys.exit("tinytuya not installed. Run: pip install tinytuya")
 
+import dps_protobuf
+import mirror_voice_packs
+import tracing
+
 
 # Known current versions for official voice packs.
 # Your --version must be higher than these to force a re-download.
-KNOWN_VERSIONS = {
+BUILTIN_VERSIONS = {
     501: 13,  # en_us_female
     502: 15,  # en_us_male
 }
+# The table's original name, kept for scripts that import it (it does not
+# include the mirror's versions; use known_versions() for those)
+KNOWN_VERSIONS = BUILTIN_VERSIONS
 
 
-# ---------------------------------------------------------------------------
-# DPS 162 protobuf encoder
-# ---------------------------------------------------------------------------
-
-def _encode_varint(v: int) -> bytes:
-    out = []
-    while True:
-        b = v & 0x7F
-        v >>= 7
-        out.append(b | 0x80 if v else b)
-        if not v:
-            break
-    return bytes(out)
-
-
-def _encode_field_varint(field_num: int, value: int) -> bytes:
-    return _encode_varint((field_num << 3) | 0) + _encode_varint(value)
-
+def known_versions() -> dict[int, int]:
+    """BUILTIN_VERSIONS, updated from the local mirror's index when there is one."""
+    return {**BUILTIN_VERSIONS, **mirror_voice_packs.known_versions()}
 
-def _encode_field_string(field_num: int, value: bytes | str) -> bytes:
-    if isinstance(value, str):
-        value = value.encode()
-    return _encode_varint((field_num << 3) | 2) + _encode_varint(len(value)) + value
 
+# ---------------------------------------------------------------------------
+# DPS 162 payloads (see dps_protobuf.py for the codec)
+# ---------------------------------------------------------------------------
 
 def build_dps162(set_id: int, url: str, md5: str, version: int, size: int) -> str:
     """
@@ -79,49 +88,291 @@ def build_dps162(set_id: int, url: str, md5: str, version: int, size: int) -> st
     Returns:
         Base64-encoded protobuf string suitable for DPS 162.
     """
-    inner  = _encode_field_varint(1, set_id)
-    inner += _encode_field_string(2, url)
-    inner += _encode_field_string(3, md5)
-    inner += _encode_field_varint(4, version)
-    inner += _encode_field_varint(5, size)
-    outer  = _encode_field_string(1, inner)
-    outer += _encode_field_string(2, b'')
-    return base64.b64encode(_encode_varint(len(outer)) + outer).decode()
+    return dps_protobuf.encode_dps(dps_protobuf.DPS162_REQUEST, {
+        'voice_info': {'set_id': set_id, 'url': url, 'md5': md5, 'version': version,
+                       'size': size},
+        'padding': b'',
+    })
+
+
+def decode_dps162_response(b64_value: str) -> dict:
+    """
+    Decode a DPS 162 payload from the vacuum into {field number: value}.
+    Length-delimited fields are returned as bytes, groups as lists of
+    (number, wire type, value). Raises dps_protobuf.DecodeError if malformed.
+    """
+    fields = {}
+    for number, wt, value in dps_protobuf.decode_fields(dps_protobuf.dps_message(b64_value)):
+        fields[number] = bytes(value) if wt == dps_protobuf.LEN else value
+    return fields
 
 
 # ---------------------------------------------------------------------------
-# DPS 162 response decoder
+# Install completion
 # ---------------------------------------------------------------------------
 
-def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
-    result, shift = 0, 0
-    while True:
-        b = data[pos]; pos += 1
-        result |= (b & 0x7F) << shift
-        if not (b & 0x80):
-            break
-        shift += 7
-    return result, pos
+# DPS 162 `state` values that end an install: 2 = installed, 3 = rejected
+FINAL_STATES = (2, 3)
 
 
-def decode_dps162_response(b64_value: str) -> dict:
-    """Decode a DPS 162 response payload from the vacuum."""
-    data = base64.b64decode(b64_value)
-    length, pos = _read_varint(data, 0)
-    inner = data[pos:]
-    fields = {}
-    pos2 = 0
-    while pos2 < len(inner):
-        tag, pos2 = _read_varint(inner, pos2)
-        fn, wt = tag >> 3, tag & 7
-        if wt == 0:
-            v, pos2 = _read_varint(inner, pos2)
-            fields[fn] = v
-        elif wt == 2:
-            l, pos2 = _read_varint(inner, pos2)
-            fields[fn] = inner[pos2:pos2+l]
-            pos2 += l
-    return fields
+def response_state(result) -> int | None:
+    """Return the DPS 162 `state` field from a tinytuya result dict, if present."""
+    if isinstance(result, dict) and '162' in (result.get('dps') or {}):
+        with tracing.span('decode_response'):
+            try:
+                return dps_protobuf.decode_dps(result['dps']['162'],
+                                               dps_protobuf.DPS162_STATUS).get('state')
+            except dps_protobuf.DecodeError:
+                return None
+    return None
+
+
+def _open_socket(d):
+    """
+    tinytuya's private _get_socket(): True or an error code. None if this
+    tinytuya version has no such method, or a different signature.
+    """
+    get_socket = getattr(d, '_get_socket', None)
+    if not callable(get_socket):
+        return None
+    try:
+        return get_socket(False)
+    except TypeError:
+        return None
+
+
+def connect(d) -> dict | None:
+    """
+    Open the device socket ahead of set_value(), which would otherwise
+    connect implicitly, so a trace shows connect time on its own. Returns
+    tinytuya's error dict if the device is unreachable.
+
+    tinytuya has no public connect call. Without a usable _get_socket()
+    this falls back to a status() query, which connects as a side effect
+    (and keeps the socket open on a persistent device).
+    """
+    with tracing.span('connect', ip=d.address, port=d.port):
+        result = _open_socket(d)
+        if result is None:
+            status = d.status()
+            return status if isinstance(status, dict) and 'Error' in status else None
+    return None if result is True else tinytuya.error_json(result or tinytuya.ERR_OFFLINE)
+
+
+def wait_for_install(d, deadline: float, poll_interval: float = 1.0, poll_max: float = 8.0):
+    """
+    Wait for the vacuum to report the outcome of a DPS 162 push.
+
+    `d` must be a persistent tinytuya device that just sent the payload.
+    Listens on its socket for the asynchronous DPS 162 status update and
+    returns that message as soon as it carries a final state. If the
+    vacuum stays quiet, falls back to polling `d.status()` with an interval
+    that doubles up to `poll_max`. Returns the last message seen that held
+    DPS 162, or None if none arrived before `deadline` (time.monotonic()).
+    """
+    last = None
+    next_poll = time.monotonic() + poll_interval
+    socket_timeout = d.connection_timeout
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return last
+            d.set_socketTimeout(max(0.05, min(deadline, next_poll) - now))
+            with tracing.span('receive'):
+                msg = d.receive()
+            if response_state(msg) is not None:
+                last = msg
+                if response_state(msg) in FINAL_STATES:
+                    return msg
+
+            if time.monotonic() >= next_poll:
+                d.set_socketTimeout(socket_timeout)
+                with tracing.span('status'):
+                    msg = d.status()
+                if response_state(msg) is not None:
+                    last = msg
+                    if response_state(msg) in FINAL_STATES:
+                        return msg
+                poll_interval = min(poll_interval * 2, poll_max)
+                next_poll = time.monotonic() + poll_interval
+    finally:
+        d.set_socketTimeout(socket_timeout)
+
+
+# ---------------------------------------------------------------------------
+# Fleet push
+# ---------------------------------------------------------------------------
+
+def load_inventory(path: str) -> list[dict]:
+    """
+    Load a device inventory from CSV or JSON.
+
+    CSV files need a header row with `device_id`, `ip` and `local_key`
+    columns; JSON files hold a list of objects with the same keys. An
+    optional `port` column/key overrides the default Tuya port and an
+    optional `name` is shown in the summary.
+    """
+    with open(path, newline='') as f:
+        if path.lower().endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    devices = []
+    for n, row in enumerate(rows, 1):
+        missing = [k for k in ('device_id', 'ip', 'local_key') if not row.get(k)]
+        if missing:
+            raise ValueError(f"{path}: entry {n} is missing {', '.join(missing)}")
+        devices.append({
+            'device_id': str(row['device_id']).strip(),
+            'ip':        str(row['ip']).strip(),
+            'local_key': str(row['local_key']).strip(),
+            'port':      int(row['port']) if row.get('port') else None,
+            'name':      str(row.get('name') or '').strip(),
+        })
+    return devices
+
+
+def push_dps162(device_id: str, ip: str, local_key: str, payload: str,
+                port: int = 6668, timeout: float = 5.0, wait: float = 0.0) -> dict:
+    """
+    Send one DPS 162 payload and return tinytuya's raw result.
+
+    With `wait` > 0 the socket stays open and, unless the immediate reply
+    already carries a final state, the vacuum's install status update is
+    awaited for up to `wait` seconds (see wait_for_install()).
+
+    The device is connected once and the payload is sent exactly once:
+    tinytuya would otherwise reconnect and send it again after a socket
+    timeout. The caller decides how often, and how fast, to retry.
+    """
+    d = tinytuya.Device(device_id, ip, local_key, version='3.3', port=port,
+                        connection_timeout=timeout, connection_retry_limit=1,
+                        connection_retry_delay=0)
+    d.set_socketPersistent(True)  # keep the socket connect() opens for set_value()
+    try:
+        deadline = time.monotonic() + wait
+        error = connect(d)
+        if error:
+            return error
+        # With a retry limit of 0 a timeout or error while sending returns an
+        # error instead of reopening the socket (as tinytuya's Monitor does)
+        d.set_socketRetryLimit(0)
+        with tracing.span('set_value', dps=162):
+            result = d.set_value(162, payload, nowait=False)
+        if result is None:
+            # Only the null ACK came back; at limit 0 tinytuya no longer reads
+            # the reply that follows it, so do that here (this never sends)
+            with tracing.span('receive'):
+                result = d.receive()
+        if wait > 0 and not (isinstance(result, dict) and 'Error' in result) \
+                and response_state(result) not in FINAL_STATES:
+            result = wait_for_install(d, deadline) or result
+        return result
+    finally:
+        d.close()
+
+
+def push_with_retries(device: dict, payload: str, default_port: int, timeout: float,
+                      retries: int, backoff: float, wait: float = 0.0) -> dict:
+    """
+    Push to one inventory device, retrying connection errors with exponential backoff.
+
+    Returns a summary dict with the decoded DPS 162 fields (if the vacuum
+    answered), the number of attempts, elapsed seconds and any error.
+    """
+    t0 = time.monotonic()
+    port = device['port'] or default_port
+    error = None
+    attempt = 0
+    for attempt in range(1, retries + 2):
+        try:
+            with tracing.span('push', device=device['name'] or device['device_id'],
+                              attempt=attempt):
+                result = push_dps162(device['device_id'], device['ip'], device['local_key'],
+                                     payload, port, timeout, wait)
+        except Exception as e:
+            result, error = None, f'{type(e).__name__}: {e}'
+        else:
+            error = result.get('Error') if isinstance(result, dict) else None
+        if not error:
+            break
+        if attempt <= retries:
+            time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.8, 1.2))
+
+    fields = None
+    if not error and result and '162' in result.get('dps', {}):
+        with tracing.span('decode_response'):
+            try:
+                fields = decode_dps162_response(result['dps']['162'])
+            except dps_protobuf.DecodeError as e:
+                error = f'malformed DPS 162 response: {e}'
+    return {
+        'device': device,
+        'fields': fields,
+        'attempts': attempt,
+        'elapsed': time.monotonic() - t0,
+        'error': error,
+    }
+
+
+def push_fleet(devices: list[dict], payload: str, default_port: int = 6668,
+               concurrency: int = 8, timeout: float = 5.0, retries: int = 2,
+               backoff: float = 1.0, wait: float = 0.0):
+    """Push `payload` to every device, at most `concurrency` at a time. Yields results as they finish."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(push_with_retries, device, payload, default_port, timeout, retries,
+                        backoff, wait)
+            for device in devices
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def _state_label(state) -> str:
+    return {2: 'SUCCESS', 3: 'FAILED'}.get(state, '')
+
+
+def print_fleet_summary(results: list[dict]) -> None:
+    print(f"\n{'device':<24} {'ip':<15} {'tries':>5} {'secs':>6}  "
+          f"{'inst_id':>7} {'inst_ver':>8} {'target':>6}  state")
+    for r in results:
+        dev, fields = r['device'], r['fields']
+        label = dev['name'] or dev['device_id']
+        if fields:
+            state = fields.get(5)
+            outcome = f"{state} {_state_label(state)}".strip()
+            cols = f"{fields.get(2, ''):>7} {fields.get(3, ''):>8} {fields.get(4, ''):>6}"
+        else:
+            outcome = f"ERROR {r['error']}" if r['error'] else 'no DPS 162 response'
+            cols = f"{'':>7} {'':>8} {'':>6}"
+        print(f"{label:<24} {dev['ip']:<15} {r['attempts']:>5} {r['elapsed']:>6.1f}  {cols}  {outcome}")
+
+    ok = sum(1 for r in results if r['fields'] and r['fields'].get(5) == 2)
+    print(f"\n{ok}/{len(results)} devices reported success.")
+
+
+def push_inventory(inventory: str, payload: str, default_port: int = 6668,
+                   concurrency: int = 8, timeout: float = 5.0, retries: int = 2,
+                   backoff: float = 1.0, wait: float = 0.0) -> int:
+    """Push `payload` to every device in an inventory file, printing progress and a summary. Returns the exit code."""
+    try:
+        devices = load_inventory(inventory)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: {e}")
+    print(f"\nPushing to {len(devices)} devices ({concurrency} at a time) ...")
+    results = []
+    for r in push_fleet(devices, payload, default_port, concurrency, timeout, retries, backoff, wait):
+        state = r['fields'].get(5) if r['fields'] else None
+        print(f"  {r['device']['name'] or r['device']['device_id']}: "
+              f"{r['error'] or (f'state {state}' if r['fields'] else 'no response')}")
+        results.append(r)
+    order = {id(d): n for n, d in enumerate(devices)}
+    results.sort(key=lambda r: order[id(r['device'])])
+    print_fleet_summary(results)
+    return 0 if all(r['fields'] and r['fields'].get(5) == 2 for r in results) else 1
 
 
 # ---------------------------------------------------------------------------
@@ -134,21 +385,44 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=__doc__,
     )
-    parser.add_argument('--device-id',  required=True, help='Tuya device ID')
-    parser.add_argument('--local-key',  required=True, help='Tuya local key (16 bytes)')
-    parser.add_argument('--ip',         required=True, help='Vacuum IP address')
+    parser.add_argument('--device-id',  help='Tuya device ID')
+    parser.add_argument('--local-key',  help='Tuya local key (16 bytes)')
+    parser.add_argument('--ip',         help='Vacuum IP address')
     parser.add_argument('--url',        required=True, help='HTTP URL to download the ZIP from')
     parser.add_argument('--md5',        required=True, help='Hex MD5 of the ZIP file')
     parser.add_argument('--size',       required=True, type=int, help='ZIP file size in bytes')
     parser.add_argument('--set-id',     required=True, type=int, help='Voice pack ID (e.g. 502 for male)')
     parser.add_argument('--version',    required=True, type=int, help='Version number (must exceed current)')
     parser.add_argument('--port',       default=6668,  type=int, help='Tuya local port (default: 6668)')
+    parser.add_argument('--inventory',  help='CSV/JSON file of device_id, ip, local_key to push to '
+                                             'instead of a single --device-id/--ip/--local-key')
+    parser.add_argument('--concurrency', default=8, type=int,
+                        help='Fleet mode: devices pushed in parallel (default: 8)')
+    parser.add_argument('--timeout',    default=5.0, type=float,
+                        help='Fleet mode: per-device socket timeout in seconds (default: 5)')
+    parser.add_argument('--retries',    default=2, type=int,
+                        help='Fleet mode: retries per device after a connection error (default: 2)')
+    parser.add_argument('--backoff',    default=1.0, type=float,
+                        help='Fleet mode: initial retry delay in seconds, doubled per retry (default: 1)')
+    parser.add_argument('--wait',       default=0.0, type=float, metavar='SECONDS',
+                        help='Keep the connection open and wait up to SECONDS for the vacuum to '
+                             'report install success/failure (default: 0, do not wait)')
+    parser.add_argument('--trace',      metavar='OUT_JSON',
+                        help='Record a timeline of the push (Chrome trace-event JSON, '
+                             'open in ui.perfetto.dev)')
     args = parser.parse_args()
 
+    if not args.inventory and not (args.device_id and args.local_key and args.ip):
+        parser.error('either --inventory or all of --device-id, --local-key and --ip are required')
+    if args.trace:
+        tracing.enable('send_voice_pack')
+        atexit.register(lambda: print(f"Trace: {tracing.write(args.trace)} spans written to {args.trace}"))
+
     # Warn if version is not high enough
-    if args.set_id in KNOWN_VERSIONS and args.version <= KNOWN_VERSIONS[args.set_id]:
+    known = known_versions()
+    if args.set_id in known and args.version <= known[args.set_id]:
         print(f"WARNING: --version {args.version} is not higher than known current version "
-              f"{KNOWN_VERSIONS[args.set_id]} for pack ID {args.set_id}. "
+              f"{known[args.set_id]} for pack ID {args.set_id}. "
               f"The vacuum may ignore this command.", file=sys.stderr)
 
     payload = build_dps162(args.set_id, args.url, args.md5, args.version, args.size)
@@ -159,17 +433,43 @@ def main():
     print(f"  md5           : {args.md5}")
     print(f"  version       : {args.version}")
     print(f"  size          : {args.size}")
+
+    if args.inventory:
+        sys.exit(push_inventory(args.inventory, payload, args.port, args.concurrency,
+                                args.timeout, args.retries, args.backoff, args.wait))
+
     print(f"\nConnecting to {args.ip}:{args.port} ...")
 
-    d = tinytuya.Device(args.device_id, args.ip, args.local_key, version='3.3')
-    d.set_socketPersistent(False)
+    d = tinytuya.Device(args.device_id, args.ip, args.local_key, version='3.3', port=args.port)
+    d.set_socketPersistent(args.wait > 0)
 
     print("Sending DPS 162 ...")
-    result = d.set_value(162, payload, nowait=False)
+    t0 = time.monotonic()
+    result = connect(d) if tracing.enabled() else None
+    if result is None:
+        with tracing.span('set_value', dps=162):
+            result = d.set_value(162, payload, nowait=False)
     print(f"Raw result      : {result}")
 
+    if args.wait > 0 and response_state(result) not in FINAL_STATES:
+        print(f"Waiting up to {args.wait:.0f}s for the vacuum to report install status ...")
+        update = wait_for_install(d, t0 + args.wait)
+        if update:
+            result = update
+            print(f"Status update   : {result}")
+    elapsed = time.monotonic() - t0
+
+    fields = bad = None
     if result and 'dps' in result and '162' in result['dps']:
-        fields = decode_dps162_response(result['dps']['162'])
+        with tracing.span('decode_response'):
+            try:
+                fields = decode_dps162_response(result['dps']['162'])
+            except dps_protobuf.DecodeError as e:
+                bad = e
+
+    if bad is not None:
+        print(f"\nMalformed DPS 162 response: {bad}", file=sys.stderr)
+    elif fields is not None:
         state = fields.get(5)
         installed_id = fields.get(2)
         installed_ver = fields.get(3)
@@ -181,19 +481,27 @@ def main():
         print(f"  target_id         : {target_id}")
         print(f"  state             : {state}  {'(SUCCESS)' if state == 2 else '(FAILED — unknown pack ID?)' if state == 3 else ''}")
 
+        if args.wait > 0 and state in FINAL_STATES:
+            print(f"  completed in      : {elapsed:.1f}s")
+
         if state == 2:
             print("\nSuccess! The vacuum has downloaded and installed the voice pack.")
             print("Press Start/Pause on the vacuum to hear the new voice.")
         elif state == 3:
             print("\nFailed. The vacuum rejected the pack ID.", file=sys.stderr)
             print("Ensure --set-id is a known Eufy voice pack ID (501=female, 502=male).", file=sys.stderr)
+    elif args.wait > 0:
+        print(f"\nNo DPS 162 status received within {args.wait:.0f}s.")
+        print("The vacuum may still be downloading — check network traffic if needed.")
     else:
         print("\nNo DPS 162 response received.")
         print("The vacuum may still be downloading — check network traffic if needed.")
 
-    # Brief pause then read status to confirm volume change
-    time.sleep(1)
-    status = d.status()
+    # Read status to confirm volume change (after a brief pause unless we already waited)
+    if args.wait <= 0:
+        time.sleep(1)
+    with tracing.span('status'):
+        status = d.status()
     if status and 'dps' in status:
         dps158 = status['dps'].get('158')
         if dps158:
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+serve_voice_pack.py — Serve built voice pack ZIPs to the vacuum over HTTP.
+
+A drop-in replacement for `python3 -m http.server` tuned for voice packs:
+
+  - Concurrent downloads (one thread per connection, HTTP/1.1 keep-alive)
+  - Zero-copy file transfer with sendfile(2)
+  - HTTP Range requests, so interrupted downloads can resume
+  - ETag and Content-MD5 taken from the MD5 computed at build time
+    (the `<zip>.md5` file written by build_voice_pack.py)
+  - One log line per download with bytes sent, duration and throughput,
+    so slow or aborted vacuum downloads are easy to spot
+
+Usage:
+    sudo python3 serve_voice_pack.py --dir /tmp/my_voice
+
+    # Non-default port / bind address
+    python3 serve_voice_pack.py --dir /tmp/my_voice --port 8080 --bind 192.168.1.100
+
+The vacuum only connects to port 80, so use the default port when serving
+packs to a real device.
+"""
+
+import argparse
+import base64
+import hashlib
+import http.server
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class DigestIndex:
+    """
+    MD5 digests of served files, keyed on (path, size, mtime).
+
+    Reads the `<file>.md5` sidecar written by build_voice_pack.py when it is
+    at least as new as the file, and otherwise hashes the file once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._digests = {}
+
+    def md5(self, path: str, st: os.stat_result) -> str:
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest:
+            return digest
+
+        digest = read_md5_sidecar(path, st)
+        if digest is None:
+            h = hashlib.md5()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+        with self._lock:
+            self._digests[key] = digest
+        return digest
+
+
+def read_md5_sidecar(path: str, st: os.stat_result) -> str | None:
+    """Return the hex MD5 from `<path>.md5` (md5sum format) if it is current."""
+    try:
+        sidecar_mtime = os.stat(path + '.md5').st_mtime_ns
+        with open(path + '.md5') as f:
+            digest = f.read().split()[0].lower()
+    except (OSError, IndexError):
+        return None
+    if sidecar_mtime < st.st_mtime_ns or not re.fullmatch(r'[0-9a-f]{32}', digest):
+        return None
+    return digest
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single-range `Range: bytes=...` header into (start, end inclusive).
+
+    Returns None if the header is not a single byte range we can satisfy.
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if not m.group(1):
+        length = int(m.group(2))
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class VoicePackHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'VoicePackServer/1.0'
+
+    # Set by make_server()
+    root = '.'
+    digests: DigestIndex = None
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _resolve(self) -> str | None:
+        rel = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip('/')
+        path = os.path.realpath(os.path.join(self.root, rel))
+        if os.path.commonpath([path, self.root]) != self.root or not os.path.isfile(path):
+            return None
+        return path
+
+    def _serve(self, send_body: bool):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404, 'File not found')
+            return
+
+        f = open(path, 'rb')
+        try:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            md5 = self.digests.md5(path, st)
+            etag = f'"{md5}"'
+
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            start, end = 0, size - 1
+            status = 200
+            range_header = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if range_header and (if_range is None or if_range == etag):
+                parsed = parse_range(range_header, size)
+                if parsed is None:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                start, end = parsed
+                status = 206
+
+            count = end - start + 1 if size else 0
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/zip' if path.endswith('.zip')
+                             else 'application/octet-stream')
+            self.send_header('Content-Length', str(count))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', self.date_time_string(int(st.st_mtime)))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            else:
+                self.send_header('Content-MD5', base64.b64encode(bytes.fromhex(md5)).decode())
+            self.end_headers()
+            if not send_body:
+                return
+
+            t0 = time.monotonic()
+            sent = 0
+            outcome = 'complete'
+            try:
+                # socket.sendfile() uses os.sendfile() (zero-copy) where available
+                sent = self.connection.sendfile(f, offset=start, count=count)
+            except (BrokenPipeError, ConnectionResetError, TimeoutError):
+                sent = f.tell() - start
+                outcome = 'aborted'
+                self.close_connection = True
+            elapsed = time.monotonic() - t0
+            rate = sent / elapsed / 1024 if elapsed > 0 else 0.0
+            span = f'bytes {start}-{end}/{size}' if status == 206 else f'{size} bytes'
+            self.log_message('download %s %s: %s, sent %d in %.2fs (%.1f KiB/s)',
+                             os.path.relpath(path, self.root), outcome, span, sent, elapsed, rate)
+        finally:
+            f.close()
+
+    def log_request(self, code='-', size='-'):
+        # Quieter than the default: downloads get their own summary line.
+        if self.command != 'GET' or not str(code).startswith('2'):
+            super().log_request(code, size)
+
+
+def make_server(root: str, bind: str = '', port: int = 80) -> http.server.ThreadingHTTPServer:
+    root = os.path.realpath(root)
+    handler = type('Handler', (VoicePackHandler,), {'root': root, 'digests': DigestIndex()})
+    server = http.server.ThreadingHTTPServer((bind, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve voice pack ZIPs to the vacuum over HTTP.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--dir',  default='.', help='Directory to serve (default: current directory)')
+    parser.add_argument('--port', default=80, type=int, help='TCP port (default: 80)')
+    parser.add_argument('--bind', default='', help='Address to bind (default: all interfaces)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        sys.exit(f"ERROR: Not a directory: {args.dir}")
+    try:
+        server = make_server(args.dir, args.bind, args.port)
+    except PermissionError:
+        sys.exit(f"ERROR: Permission denied binding port {args.port}. Run with sudo or use --port.")
+
+    root = os.path.realpath(args.dir)
+    digests = server.RequestHandlerClass.digests
+    print(f'Serving {root} on port {args.port}')
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.endswith('.zip') and os.path.isfile(path):
+            st = os.stat(path)
+            print(f'  {name}  size={st.st_size}  md5={digests.md5(path, st)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nStopped.')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+synth_daemon.py — Keep Piper voice models loaded between voice pack builds.
+
+Loading an ONNX voice model can take longer than synthesizing a handful of
+edited prompts. This daemon loads each model once and serves synthesis
+requests over a local Unix socket. build_voice_pack.py uses it automatically
+when it is running and loads the model in-process when it is not.
+
+  - Requests carry a batch of texts; results stream back one per text, in
+    order, as PCM or MP3
+  - Synthesis of text N+1 overlaps with post-processing and MP3 encoding
+    of text N
+  - Up to --max-models models stay loaded; the least recently used one is
+    dropped to make room, and a model is reloaded if its file changes
+
+Usage:
+    python3 synth_daemon.py --preload /path/to/en_US-voice.onnx
+
+    # then build as usual; the daemon is picked up automatically
+    python3 build_voice_pack.py --voice-model /path/to/en_US-voice.onnx
+
+    # Show loaded models and request counts
+    python3 synth_daemon.py --status
+
+Requirements:
+    pip install piper-tts
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from build_voice_pack import (
+    DEFAULT_DAEMON_SOCKET, ENCODERS, AudioPost, SynthDaemonClient, add_ort_arguments,
+    import_piper, lameenc, load_voice, np, recv_frame, send_frame, session_settings,
+    synthesize_pcm,
+)
+
+
+class ModelCache:
+    """
+    LRU of loaded Piper voices, keyed on the model's real path.
+
+    Each entry remembers the (size, mtime) of the model and its .onnx.json
+    config, and is reloaded if either changes. Synthesis on one voice is
+    serialized by a per-model lock (onnxruntime already spreads a single
+    inference over several cores).
+    """
+
+    def __init__(self, max_models: int, session: dict | None = None):
+        self.max_models = max_models
+        self.session = session
+        self._lock = threading.Lock()
+        self._models = collections.OrderedDict()  # path -> (signature, voice, lock)
+        self.loads = 0
+
+    @staticmethod
+    def _signature(path: str) -> tuple:
+        sig = []
+        for p in (path, f'{path}.json'):
+            try:
+                st = os.stat(p)
+                sig.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def get(self, model_path: str):
+        """Return (voice, lock) for a model, loading it if needed."""
+        path = os.path.realpath(model_path)
+        sig = self._signature(path)
+        if sig[0] is None:
+            raise FileNotFoundError(f'model not found: {model_path}')
+        with self._lock:
+            entry = self._models.get(path)
+            if entry and entry[0] == sig:
+                self._models.move_to_end(path)
+                return entry[1], entry[2]
+            # Loading under the cache lock keeps two requests from loading
+            # the same model twice; other loaded models wait meanwhile.
+            t0 = time.monotonic()
+            voice = load_voice(path, self.session)
+            self.loads += 1
+            log(f'loaded {path} in {time.monotonic() - t0:.1f}s')
+            self._models[path] = (sig, voice, threading.Lock())
+            self._models.move_to_end(path)
+            while len(self._models) > self.max_models:
+                old, _ = self._models.popitem(last=False)
+                log(f'unloaded {old} (--max-models {self.max_models})')
+            return voice, self._models[path][2]
+
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._models)
+
+
+def log(msg: str) -> None:
+    print(f'[{time.strftime("%H:%M:%S")}] {msg}', flush=True)
+
+
+class SynthHandler(socketserver.StreamRequestHandler):
+    # Set by make_server()
+    models: ModelCache = None
+    encode_pool: concurrent.futures.ThreadPoolExecutor = None
+    encode_threads: int = 1
+    stats: collections.Counter = None
+
+    def handle(self):
+        while True:
+            try:
+                header, _ = recv_frame(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            op = header.get('op')
+            if op == 'synthesize':
+                self._synthesize(header)
+            elif op == 'status':
+                send_frame(self.connection, {
+                    'models': self.models.loaded(),
+                    'max_models': self.models.max_models,
+                    'model_loads': self.models.loads,
+                    **self.stats,
+                })
+            else:
+                send_frame(self.connection, {'error': f'unknown op {op!r}'})
+
+    def _synthesize(self, req: dict):
+        texts = req.get('texts') or []
+        fmt = req.get('format', 'mp3')
+        encoder = req.get('encoder', 'ffmpeg')
+        error = None
+        if fmt not in ('mp3', 'pcm'):
+            error = f'unknown format {fmt!r}'
+        elif fmt == 'mp3' and (encoder not in ENCODERS or (encoder == 'lame' and lameenc is None)):
+            error = f'encoder {encoder!r} not available in the daemon'
+        post = None
+        if error is None and req.get('post'):
+            try:
+                if np is None:
+                    raise ValueError('numpy is not installed in the daemon')
+                post = AudioPost(**req['post'])
+            except (TypeError, ValueError) as e:
+                error = f'bad post-processing settings: {e}'
+        voice = lock = None
+        if error is None:
+            try:
+                voice, lock = self.models.get(req['model'])
+            except Exception as e:
+                error = f'cannot load model: {e}'
+
+        t0 = time.monotonic()
+        pending = collections.deque()
+        window = 2 * self.encode_threads
+        for text in texts:
+            pending.append(self._submit(voice, lock, text, fmt, encoder, post, error))
+            while len(pending) > window or (pending and pending[0].done()):
+                self._reply(pending.popleft())
+        while pending:
+            self._reply(pending.popleft())
+        send_frame(self.connection, {'done': True})
+        self.stats['requests'] += 1
+        self.stats['texts'] += len(texts)
+        log(f'{len(texts)} texts ({fmt}{"/" + encoder if fmt == "mp3" else ""}) '
+            f'in {time.monotonic() - t0:.1f}s')
+
+    def _submit(self, voice, lock, text: str, fmt: str, encoder: str, post: AudioPost | None,
+                error: str | None):
+        """Synthesize now (in this connection's thread) and queue post-processing and encoding."""
+        future = concurrent.futures.Future()
+        if error:
+            future.set_exception(RuntimeError(error))
+            return future
+        try:
+            with lock:
+                pcm, rate = synthesize_pcm(voice, text)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+
+        def finish():
+            data, removed = post.apply(pcm, rate) if post else (pcm, 0)
+            if fmt == 'mp3':
+                data = ENCODERS[encoder](data, rate)
+            return data, rate, removed / rate
+
+        return self.encode_pool.submit(finish)
+
+    def _reply(self, future: concurrent.futures.Future):
+        try:
+            data, rate, trimmed = future.result()
+        except Exception as e:
+            self.stats['errors'] += 1
+            send_frame(self.connection, {'error': f'{type(e).__name__}: {e}'})
+        else:
+            send_frame(self.connection, {'sample_rate': rate, 'trimmed': trimmed}, data)
+
+
+class SynthServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(path: str, max_models: int, encode_threads: int,
+                session: dict | None = None) -> SynthServer:
+    if os.path.exists(path):
+        probe = SynthDaemonClient.connect(path)
+        if probe:
+            probe.close()
+            sys.exit(f"ERROR: a synthesis daemon is already listening on {path}")
+        os.remove(path)  # stale socket from a daemon that did not shut down cleanly
+    handler = type('Handler', (SynthHandler,), {
+        'models': ModelCache(max_models, session),
+        'encode_pool': concurrent.futures.ThreadPoolExecutor(max_workers=encode_threads),
+        'encode_threads': encode_threads,
+        'stats': collections.Counter(),
+    })
+    old_umask = os.umask(0o177)  # socket usable by this user only
+    try:
+        return SynthServer(path, handler)
+    finally:
+        os.umask(old_umask)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve Piper synthesis from resident models over a Unix socket.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--socket', default=DEFAULT_DAEMON_SOCKET,
+                        help=f'Unix socket path (default: {DEFAULT_DAEMON_SOCKET})')
+    parser.add_argument('--preload', action='append', default=[], metavar='MODEL',
+                        help='Load this .onnx model at startup (repeatable)')
+    parser.add_argument('--max-models', type=int, default=2,
+                        help='Models kept loaded at once, least recently used dropped first (default: 2)')
+    parser.add_argument('--encode-threads', type=int, default=os.cpu_count() or 1,
+                        help='Parallel MP3 encodes (default: one per CPU core)')
+    parser.add_argument('--status', action='store_true',
+                        help='Print the status of the running daemon and exit')
+    add_ort_arguments(parser)
+    args = parser.parse_args()
+
+    if args.status:
+        client = SynthDaemonClient.connect(args.socket)
+        if client is None:
+            sys.exit(f"No synthesis daemon listening on {args.socket}")
+        status = client.request({'op': 'status'})
+        client.close()
+        print(f"Synthesis daemon on {args.socket}")
+        for key, value in status.items():
+            print(f"  {key:<12}: {value}")
+        return
+
+    import_piper()
+    server = make_server(args.socket, max(1, args.max_models), max(1, args.encode_threads),
+                         session_settings(args))
+    models = server.RequestHandlerClass.models
+    for model in args.preload:
+        try:
+            models.get(model)
+        except Exception as e:
+            sys.exit(f"ERROR: cannot load {model}: {e}")
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    log(f'listening on {args.socket} (max {args.max_models} models)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(args.socket)
+        except FileNotFoundError:
+            pass
+        log('stopped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts live at the repository root and in tools/, not in a package
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+sys.path.insert(0, ROOT)
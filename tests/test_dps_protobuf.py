@@ -0,0 +1,259 @@
+"""Round-trip and malformed-input tests for dps_protobuf.py."""
+
+import base64
+import random
+import struct
+
+import pytest
+
+import dps_protobuf as pb
+from dps_protobuf import Field, Message
+from send_voice_pack import build_dps162, decode_dps162_response
+
+LEAF = Message('leaf', [
+    Field(1, 'u32', 'uint32'),
+    Field(2, 's', 'string'),
+])
+
+# A schema using every field kind: nested messages, groups, repeated and packed fields
+EVERYTHING = Message('everything', [
+    Field(1, 'u32', 'uint32'),
+    Field(2, 'u64', 'uint64'),
+    Field(3, 'i32', 'int32'),
+    Field(4, 'i64', 'int64'),
+    Field(5, 's32', 'sint32'),
+    Field(6, 's64', 'sint64'),
+    Field(7, 'flag', 'bool'),
+    Field(8, 'mode', 'enum'),
+    Field(9, 'f32', 'fixed32'),
+    Field(10, 'sf32', 'sfixed32'),
+    Field(11, 'fl', 'float'),
+    Field(12, 'f64', 'fixed64'),
+    Field(13, 'sf64', 'sfixed64'),
+    Field(14, 'db', 'double'),
+    Field(15, 'text', 'string'),
+    Field(16, 'blob', 'bytes'),
+    Field(17, 'leaf', 'message', LEAF),
+    Field(18, 'grp', 'group', LEAF),
+    Field(19, 'nums', 'uint32', repeated=True),
+    Field(20, 'leaves', 'message', LEAF, repeated=True),
+    Field(21, 'doubles', 'double', repeated=True),
+    Field(2000, 'far', 'sint64'),
+])
+
+_F32 = struct.Struct('<f')
+
+SEEDS = range(5)
+ITERATIONS = 400
+
+
+def _random_text(rng: random.Random) -> str:
+    return ''.join(rng.choice('abcxyz/:._-é€😀') for _ in range(rng.randrange(12)))
+
+
+def random_leaf(rng: random.Random) -> dict:
+    out = {}
+    if rng.random() < 0.7:
+        out['u32'] = rng.randrange(1 << 32)
+    if rng.random() < 0.7:
+        out['s'] = _random_text(rng)
+    return out
+
+
+def random_everything(rng: random.Random) -> dict:
+    gens = {
+        'u32': lambda: rng.randrange(1 << 32),
+        'u64': lambda: rng.randrange(1 << 64),
+        'i32': lambda: rng.randrange(-(1 << 31), 1 << 31),
+        'i64': lambda: rng.randrange(-(1 << 63), 1 << 63),
+        's32': lambda: rng.randrange(-(1 << 31), 1 << 31),
+        's64': lambda: rng.randrange(-(1 << 63), 1 << 63),
+        'flag': lambda: rng.random() < 0.5,
+        'mode': lambda: rng.randrange(-3, 100),
+        'f32': lambda: rng.randrange(1 << 32),
+        'sf32': lambda: rng.randrange(-(1 << 31), 1 << 31),
+        'fl': lambda: _F32.unpack(_F32.pack(rng.uniform(-1e6, 1e6)))[0],
+        'f64': lambda: rng.randrange(1 << 64),
+        'sf64': lambda: rng.randrange(-(1 << 63), 1 << 63),
+        'db': lambda: rng.uniform(-1e300, 1e300),
+        'text': lambda: _random_text(rng),
+        'blob': lambda: rng.randbytes(rng.randrange(40)),
+        'leaf': lambda: random_leaf(rng),
+        'grp': lambda: random_leaf(rng),
+        'nums': lambda: [rng.randrange(1 << 32) for _ in range(rng.randrange(1, 5))],
+        'leaves': lambda: [random_leaf(rng) for _ in range(rng.randrange(1, 4))],
+        'doubles': lambda: [rng.uniform(-1, 1) for _ in range(rng.randrange(1, 4))],
+        'far': lambda: rng.randrange(-(1 << 63), 1 << 63),
+    }
+    return {name: gen() for name, gen in gens.items() if rng.random() < 0.5}
+
+
+def random_fields(rng: random.Random, depth: int = 0) -> list:
+    fields = []
+    for _ in range(rng.randrange(6)):
+        number = rng.choice((1, 2, 3, 15, 16, 2047, (1 << 29) - 1))
+        wt = rng.choice((pb.VARINT, pb.I64, pb.LEN, pb.I32) + ((pb.SGROUP,) if depth < 3 else ()))
+        if wt in (pb.VARINT, pb.I64):
+            value = rng.randrange(1 << 64)
+        elif wt == pb.I32:
+            value = rng.randrange(1 << 32)
+        elif wt == pb.LEN:
+            value = rng.randbytes(rng.randrange(20))
+        else:
+            value = random_fields(rng, depth + 1)
+        fields.append((number, wt, value))
+    return fields
+
+
+def mutate(rng: random.Random, data: bytes) -> bytes:
+    b = bytearray(data)
+    for _ in range(rng.randrange(1, 4)):
+        op = rng.randrange(5)
+        if op == 0 and b:
+            i = rng.randrange(len(b))
+            b[i] ^= 1 << rng.randrange(8)
+        elif op == 1 and b:
+            del b[rng.randrange(len(b)):]
+        elif op == 2:
+            i = rng.randrange(len(b) + 1)
+            b[i:i] = rng.randbytes(rng.randrange(1, 6))
+        elif op == 3 and b:
+            b[rng.randrange(len(b))] = rng.choice((0x00, 0x7F, 0x80, 0xFF, 0x0B, 0x0C))
+        elif op == 4 and len(b) > 2:
+            i, j = sorted(rng.sample(range(len(b)), 2))
+            b[i:i] = b[i:j]  # duplicate a span: repeated fields, bad lengths
+    return bytes(b)
+
+
+def plain(value):
+    """Decoded values with memoryviews turned into bytes, for comparison."""
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(plain(v) for v in value)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Round trips
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_schema_roundtrip(seed):
+    rng = random.Random(seed)
+    for _ in range(ITERATIONS):
+        values = random_everything(rng)
+        data = EVERYTHING.encode(values)
+        decoded = EVERYTHING.decode(data)
+        assert plain(decoded) == values
+        assert EVERYTHING.encode(decoded) == data
+        assert pb.encode_fields(pb.decode_fields(data)) == data
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_schemaless_roundtrip(seed):
+    rng = random.Random(seed)
+    for _ in range(ITERATIONS):
+        fields = random_fields(rng)
+        data = pb.encode_fields(fields)
+        assert plain(pb.decode_fields(data)) == fields
+        assert pb.encode_fields(pb.decode_fields(data)) == data
+
+
+def test_unknown_fields_are_kept():
+    data = LEAF.encode({'u32': 7}) + pb.encode_fields([(9, pb.LEN, b'extra'), (10, pb.I32, 5)])
+    decoded = LEAF.decode(data)
+    assert decoded['u32'] == 7
+    assert plain(decoded['_unknown']) == [(9, pb.LEN, b'extra'), (10, pb.I32, 5)]
+    assert LEAF.encode(decoded) == data
+
+
+def test_dps162_request_roundtrip():
+    value = build_dps162(502, 'http://192.168.1.100/pack.zip', 'ab' * 16, 16, 1234)
+    assert pb.dps162_kind(value) == 'request'
+    decoded = pb.decode_dps(value, pb.dps162_message)
+    assert decoded['voice_info'] == {
+        'set_id': 502, 'url': 'http://192.168.1.100/pack.zip', 'md5': 'ab' * 16,
+        'version': 16, 'size': 1234,
+    }
+    assert pb.encode_dps(pb.DPS162_REQUEST, decoded) == value
+
+
+def test_dps162_status():
+    value = pb.encode_dps(pb.DPS162_STATUS, {
+        'status': 2, 'installed_id': 502, 'installed_version': 16, 'target_id': 502, 'state': 2})
+    assert pb.dps162_kind(value) == 'status'
+    assert decode_dps162_response(value) == {1: 2, 2: 502, 3: 16, 4: 502, 5: 2}
+
+
+def test_decode_dps_batch_reuses_results():
+    a = pb.encode_dps(pb.DPS162_STATUS, {'state': 1})
+    b = pb.encode_dps(pb.DPS162_STATUS, {'state': 2})
+    results = pb.decode_dps_batch([a, b, a, 'not base64!'], pb.DPS162_STATUS, skip_errors=True)
+    assert results == [{'state': 1}, {'state': 2}, {'state': 1}, None]
+    assert results[0] is results[2]
+    with pytest.raises(pb.DecodeError):
+        pb.decode_dps_batch([a, 'not base64!'], pb.DPS162_STATUS)
+
+
+# ---------------------------------------------------------------------------
+# Malformed input: DecodeError and nothing else
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize('data', [
+    b'\x08',                    # varint field with no value
+    b'\x08\xff\xff',            # truncated varint
+    b'\x12\x05abc',             # length runs past the end
+    b'\x0d\x01\x02',            # truncated fixed32
+    b'\x09\x01\x02\x03',        # truncated fixed64
+    b'\x13\x08\x01',            # group never terminated
+    b'\x14',                    # end of a group that was never started
+    b'\x00\x01',                # field number 0
+    b'\x08' + b'\xff' * 11,     # varint longer than 64 bits
+    b'\x7a\x02\xff\xfe',        # string field 15 that is not UTF-8
+])
+def test_malformed_message(data):
+    with pytest.raises(pb.DecodeError):
+        EVERYTHING.decode(data)
+
+
+def test_nesting_limit():
+    depth = pb.MAX_DEPTH + 2
+    with pytest.raises(pb.DecodeError, match='deeper'):
+        pb.decode_fields(b'\x13' * depth + b'\x14' * depth)  # groups nested `depth` deep
+
+
+@pytest.mark.parametrize('value', [
+    'not base64!',
+    '/w==',                                         # truncated length prefix
+    base64.b64encode(b'\x05\x0a\x09').decode(),     # length prefix past the end
+    base64.b64encode(b'\x02\x08').decode(),         # truncated message
+])
+def test_malformed_dps_value(value):
+    with pytest.raises(pb.DecodeError):
+        pb.decode_dps(value, pb.dps162_message)
+    with pytest.raises(pb.DecodeError):
+        decode_dps162_response(value)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_mutated_input_raises_only_decode_error(seed):
+    rng = random.Random(seed)
+    samples = [EVERYTHING.encode(random_everything(rng)) for _ in range(32)]
+    samples.append(bytes(pb.dps_message(build_dps162(502, 'http://h/a.zip', 'ab' * 16, 16, 1234))))
+    for i in range(ITERATIONS):
+        data = mutate(rng, rng.choice(samples))
+        for decode in (EVERYTHING.decode, pb.decode_fields, pb.DPS162_REQUEST.decode,
+                       pb.DPS162_STATUS.decode):
+            try:
+                decode(data)
+            except pb.DecodeError:
+                pass
+        value = base64.b64encode(pb.encode_varint(len(data)) + data) if i % 2 \
+            else rng.randbytes(rng.randrange(30))
+        try:
+            pb.decode_dps(value, pb.dps162_message)
+        except pb.DecodeError:
+            pass
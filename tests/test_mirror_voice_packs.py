@@ -0,0 +1,179 @@
+"""Mirror.refresh() and _prune() against a stub voicePackage API."""
+
+import hashlib
+import json
+import os
+
+import pytest
+
+import mirror_voice_packs
+from mirror_voice_packs import Mirror
+
+
+class StubAPI:
+    """Serves `packs` and the files in `files` (url -> bytes) like VoicePackAPI."""
+
+    def __init__(self):
+        self.files = {}
+        self.packs = []
+        self.etag = 0
+        self.downloads = []
+
+    def publish(self, pack_id: int, version: int, data: bytes, md5: str | None = None) -> None:
+        url = f'https://cdn.example/{pack_id}/v{version}.zip'
+        self.files[url] = data
+        self.packs = [p for p in self.packs if p['id'] != pack_id]
+        self.packs.append({'id': pack_id, 'version': version, 'url': url, 'size': len(data),
+                           'md5': md5 or hashlib.md5(data).hexdigest()})
+        self.etag += 1
+
+    def list_packs(self, validators: dict):
+        if validators.get('etag') == str(self.etag):
+            return None, validators
+        return [dict(p) for p in self.packs], {'etag': str(self.etag)}
+
+    def download(self, url: str, f) -> None:
+        self.downloads.append(url)
+        f.write(self.files[url])
+
+
+def objects(mirror_dir) -> set[str]:
+    return set(os.listdir(os.path.join(mirror_dir, 'objects')))
+
+
+def test_refresh_adds_and_skips_unchanged_list(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'female')
+    api.publish(502, 15, b'male')
+    mirror = Mirror(str(tmp_path))
+
+    assert sorted(mirror.refresh(api)) == [(501, 'added'), (502, 'added')]
+    md5 = hashlib.md5(b'female').hexdigest()
+    assert objects(tmp_path) == {f'{md5}.zip', f'{md5}.zip.md5',
+                                 f"{hashlib.md5(b'male').hexdigest()}.zip",
+                                 f"{hashlib.md5(b'male').hexdigest()}.zip.md5"}
+    with open(mirror.path(501), 'rb') as f:
+        assert f.read() == b'female'
+    assert mirror_voice_packs.known_versions(str(tmp_path)) == {501: 13, 502: 15}
+
+    # Same ETag: the list is "not modified" and nothing is downloaded
+    assert mirror.refresh(api) == []
+    assert len(api.downloads) == 2
+    # A fresh Mirror reads the validators back from index.json
+    assert Mirror(str(tmp_path)).refresh(api) == []
+
+
+def test_update_prunes_the_old_object(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'female v13')
+    mirror = Mirror(str(tmp_path))
+    mirror.refresh(api)
+
+    api.publish(501, 14, b'female v14')
+    assert mirror.refresh(api) == [(501, 'updated')]
+    md5 = hashlib.md5(b'female v14').hexdigest()
+    assert objects(tmp_path) == {f'{md5}.zip', f'{md5}.zip.md5'}
+    assert mirror.packs['501']['version'] == 14
+
+
+def test_shared_content_is_reused(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'same')
+    mirror = Mirror(str(tmp_path))
+    mirror.refresh(api)
+
+    api.publish(502, 15, b'same')
+    assert sorted(mirror.refresh(api)) == [(501, 'unchanged'), (502, 'reused')]
+    assert len(api.downloads) == 1
+    assert mirror.path(501) == mirror.path(502)
+
+    # Pruning keeps an object while any pack still refers to it
+    del mirror.packs['501']
+    mirror._prune()
+    assert len(objects(tmp_path)) == 2
+    del mirror.packs['502']
+    mirror._prune()
+    assert objects(tmp_path) == set()
+
+
+def test_md5_mismatch_fails_and_retries(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'female', md5='0' * 32)
+    api.publish(502, 15, b'male')
+    mirror = Mirror(str(tmp_path))
+
+    results = dict(mirror.refresh(api))
+    assert results[501].startswith('failed: MD5 mismatch')
+    assert results[502] == 'added'
+    assert '501' not in mirror.packs
+    assert not [n for n in objects(tmp_path) if n.endswith('.tmp')]
+
+    # The validators were not saved, so the next refresh tries the failed pack again
+    api.publish(501, 13, b'female')
+    assert sorted(mirror.refresh(api)) == [(501, 'added'), (502, 'unchanged')]
+
+
+def test_malformed_entry_is_reported(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'female')
+    api.packs.append({'id': 9, 'version': 'x'})
+    results = dict(Mirror(str(tmp_path)).refresh(api))
+    assert results[501] == 'added'
+    assert results[9].startswith('failed: malformed entry')
+
+
+@pytest.mark.parametrize('content', ['{"packs": ', '[1]', '{"packs": []}'])
+def test_corrupt_index(tmp_path, content):
+    (tmp_path / 'index.json').write_text(content)
+    with pytest.raises(ValueError, match='corrupt'):
+        Mirror(str(tmp_path))
+    assert mirror_voice_packs.known_versions(str(tmp_path)) == {}
+
+
+def test_index_is_json(tmp_path):
+    api = StubAPI()
+    api.publish(501, 13, b'female')
+    Mirror(str(tmp_path)).refresh(api)
+    with open(tmp_path / 'index.json') as f:
+        index = json.load(f)
+    assert index['api'] == {'etag': '1'}
+    assert index['packs']['501']['file'] == f"objects/{hashlib.md5(b'female').hexdigest()}.zip"
+
+
+def test_send_voice_pack_keeps_known_versions_name():
+    send_voice_pack = pytest.importorskip('send_voice_pack')
+    assert send_voice_pack.KNOWN_VERSIONS is send_voice_pack.BUILTIN_VERSIONS
+
+
+def test_concurrent_refreshes_do_not_prune_each_other(tmp_path):
+    import threading
+
+    started, release = threading.Event(), threading.Event()
+
+    class SlowAPI(StubAPI):
+        def download(self, url, f):
+            started.set()
+            release.wait(5)  # hold the first refresh mid-download
+            super().download(url, f)
+
+    first, second = SlowAPI(), StubAPI()
+    second.etag = 100  # a different list from the first one
+    first.publish(501, 13, b'female')
+    second.publish(502, 15, b'male')
+    # Both mirrors read the (empty) index before either refresh starts
+    a, b = Mirror(str(tmp_path)), Mirror(str(tmp_path))
+    results = {}
+    ta = threading.Thread(target=lambda: results.setdefault('a', a.refresh(first)))
+    tb = threading.Thread(target=lambda: results.setdefault('b', b.refresh(second)))
+    ta.start()
+    assert started.wait(5)
+    tb.start()
+    tb.join(0.3)
+    assert tb.is_alive()  # waiting for the lock, not pruning the first download's .tmp
+    release.set()
+    ta.join()
+    tb.join()
+
+    assert results == {'a': [(501, 'added')], 'b': [(502, 'added')]}
+    assert mirror_voice_packs.known_versions(str(tmp_path)) == {501: 13, 502: 15}
+    assert len(objects(tmp_path)) == 4
@@ -0,0 +1,268 @@
+"""The voice pack ZIP writer and patcher must produce archives that zipfile reads back."""
+
+import hashlib
+import os
+import zipfile
+import zlib
+
+import pytest
+
+import build_voice_pack
+from build_voice_pack import ChimeSource, StreamingZipWriter, ZipPatcher, write_pack_zip
+
+
+def file_md5(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def read_all(path) -> dict[str, bytes]:
+    with zipfile.ZipFile(path) as zf:
+        assert zf.testzip() is None
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+# ---------------------------------------------------------------------------
+# StreamingZipWriter
+# ---------------------------------------------------------------------------
+
+def test_streaming_writer_roundtrip(tmp_path):
+    path = str(tmp_path / 'pack.zip')
+    audio = bytes(range(256)) * 40
+    text = b'id: 502\nversion: 16\n' * 20
+    with StreamingZipWriter(path) as zw:
+        zw.writestr('voice/config.yaml', text, compress=True)
+        zw.writestr('voice/main/A0000.mp3', audio)
+        zw.writestr('voice/main/ü.mp3', b'utf-8 name')
+        deflated = zlib.compressobj(9, zlib.DEFLATED, -15)
+        payload = deflated.compress(audio) + deflated.flush()
+        zw.write_raw('voice/main/raw.mp3', payload, zipfile.ZIP_DEFLATED, zlib.crc32(audio),
+                     len(audio))
+
+    assert read_all(path) == {
+        'voice/config.yaml': text,
+        'voice/main/A0000.mp3': audio,
+        'voice/main/ü.mp3': b'utf-8 name',
+        'voice/main/raw.mp3': audio,
+    }
+    with zipfile.ZipFile(path) as zf:
+        methods = {i.filename: i.compress_type for i in zf.infolist()}
+    assert methods['voice/config.yaml'] == zipfile.ZIP_DEFLATED
+    assert methods['voice/main/A0000.mp3'] == zipfile.ZIP_STORED
+    # The MD5 and size are accumulated while writing
+    assert zw.size == os.path.getsize(path)
+    assert zw.md5 == file_md5(path)
+
+
+def test_streaming_writer_empty(tmp_path):
+    path = str(tmp_path / 'empty.zip')
+    with StreamingZipWriter(path) as zw:
+        pass
+    assert read_all(path) == {}
+    assert zw.md5 == file_md5(path)
+
+
+# ---------------------------------------------------------------------------
+# write_pack_zip
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def chimes(tmp_path):
+    chime_dir = tmp_path / 'chimes'
+    chime_dir.mkdir()
+    (chime_dir / 'A0000.mp3').write_bytes(b'chime 0')
+    return ChimeSource.open(str(chime_dir))
+
+
+PROMPTS = {'A0000': '[CHIME]', 'A0010': 'Hello.', 'A0011': 'Goodbye.'}
+CONFIG = b'id: 502\nversion: 16\n'
+
+
+def test_write_pack_zip(tmp_path, chimes):
+    zip_path = str(tmp_path / 'out' / 'en_us_male.zip')
+    os.makedirs(os.path.dirname(zip_path))
+    keep_dir = str(tmp_path / 'out' / 'en_us_male')
+    size, md5 = write_pack_zip(zip_path, 'en_us_male', CONFIG, PROMPTS, chimes,
+                               lambda code: f'mp3 of {code}'.encode(), keep_dir)
+
+    assert read_all(zip_path) == {
+        'en_us_male/config.yaml': CONFIG,
+        'en_us_male/main/A0000.mp3': b'chime 0',
+        'en_us_male/main/A0010.mp3': b'mp3 of A0010',
+        'en_us_male/main/A0011.mp3': b'mp3 of A0011',
+    }
+    assert (size, md5) == (os.path.getsize(zip_path), file_md5(zip_path))
+    with open(zip_path + '.md5') as f:
+        assert f.read().split() == [md5, 'en_us_male.zip']
+    with open(os.path.join(keep_dir, 'main', 'A0010.mp3'), 'rb') as f:
+        assert f.read() == b'mp3 of A0010'
+    assert not os.path.exists(zip_path + '.tmp')
+
+
+def test_write_pack_zip_failed_prompt(tmp_path, chimes):
+    zip_path = str(tmp_path / 'en_us_male.zip')
+    result = write_pack_zip(zip_path, 'en_us_male', CONFIG, PROMPTS, chimes,
+                            lambda code: None if code == 'A0010' else b'mp3')
+    assert result is None
+    assert os.listdir(tmp_path) == ['chimes']
+
+
+def test_write_pack_zip_exception_removes_tmp(tmp_path, chimes):
+    zip_path = str(tmp_path / 'en_us_male.zip')
+
+    def audio(code):
+        raise RuntimeError('encoder failed')
+
+    with pytest.raises(RuntimeError):
+        write_pack_zip(zip_path, 'en_us_male', CONFIG, PROMPTS, chimes, audio)
+    assert os.listdir(tmp_path) == ['chimes']
+
+
+def test_chimes_from_a_pack_zip(tmp_path, chimes):
+    # A pack written by write_pack_zip() is itself a valid --chime-src
+    stock = str(tmp_path / 'stock.zip')
+    write_pack_zip(stock, 'en_us_male', CONFIG, PROMPTS, chimes, lambda code: b'speech')
+    source = ChimeSource.open(stock, str(tmp_path / 'cache'))
+    assert source.read('A0000') == (b'chime 0', zlib.crc32(b'chime 0'))
+    assert source.read('A0010')[0] == b'speech'
+
+    # The second open (in a later build) comes from the disk cache
+    build_voice_pack._CHIME_SOURCES.clear()
+    assert ChimeSource.open(stock, str(tmp_path / 'cache')).read('A0011')[0] == b'speech'
+
+
+def test_chime_index_follows_path_size_and_mtime(tmp_path, chimes, monkeypatch):
+    stock = str(tmp_path / 'stock.zip')
+    write_pack_zip(stock, 'en_us_male', CONFIG, PROMPTS, chimes, lambda code: b'speech')
+    cache = str(tmp_path / 'cache')
+    calls = []
+    for name in ('file_sha256', '_scan_chime_zip'):
+        real = getattr(build_voice_pack, name)
+        monkeypatch.setattr(build_voice_pack, name,
+                            lambda path, name=name, real=real: calls.append(name) or real(path))
+
+    def reopen(path=stock):
+        """Open as a later build would, returning (source, hashes and scans it needed)."""
+        build_voice_pack._CHIME_SOURCES.clear()
+        del calls[:]
+        return ChimeSource.open(path, cache), sorted(calls)
+
+    assert reopen()[1] == ['_scan_chime_zip', 'file_sha256']
+    assert reopen()[1] == []
+    # Touched or copied: hashed again, but the content's index is reused
+    st = os.stat(stock)
+    os.utime(stock, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert reopen()[1] == ['file_sha256']
+    copy = str(tmp_path / 'copy.zip')
+    with open(stock, 'rb') as src, open(copy, 'wb') as dst:
+        dst.write(src.read())
+    assert reopen(copy)[1] == ['file_sha256']
+    # Replaced with other content: scanned again
+    write_pack_zip(stock, 'en_us_male', CONFIG, PROMPTS, chimes, lambda code: b'new speech')
+    source, needed = reopen()
+    assert needed == ['_scan_chime_zip', 'file_sha256']
+    assert source.read('A0010')[0] == b'new speech'
+
+
+# ---------------------------------------------------------------------------
+# ZipPatcher
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def pack(tmp_path, chimes):
+    zip_path = str(tmp_path / 'en_us_male.zip')
+    write_pack_zip(zip_path, 'en_us_male', CONFIG, PROMPTS, chimes,
+                   lambda code: f'mp3 of {code}'.encode() * 50)
+    return zip_path
+
+
+def test_patch_replace_add_remove(pack):
+    before = read_all(pack)
+    patcher = ZipPatcher(pack)
+    assert patcher.names() == sorted(before)
+
+    patcher.writestr('en_us_male/config.yaml', b'id: 502\nversion: 17\n', compress=True)
+    patcher.writestr('en_us_male/main/A0010.mp3', b'new A0010')
+    patcher.writestr('en_us_male/main/A0012.mp3', b'added')
+    patcher.remove('en_us_male/main/A0011.mp3')
+    size, md5 = patcher.commit()
+
+    expected = dict(before)
+    expected['en_us_male/config.yaml'] = b'id: 502\nversion: 17\n'
+    expected['en_us_male/main/A0010.mp3'] = b'new A0010'
+    expected['en_us_male/main/A0012.mp3'] = b'added'
+    del expected['en_us_male/main/A0011.mp3']
+    assert read_all(pack) == expected
+    assert (size, md5) == (os.path.getsize(pack), file_md5(pack))
+    assert patcher.dead > 0
+
+    # A second commit continues from the first, and a fresh patcher reads the result
+    patcher.writestr('en_us_male/main/A0010.mp3', b'newer A0010')
+    size, md5 = patcher.commit()
+    expected['en_us_male/main/A0010.mp3'] = b'newer A0010'
+    assert read_all(pack) == expected
+    assert (size, md5) == (os.path.getsize(pack), file_md5(pack))
+    assert ZipPatcher(pack).names() == sorted(expected)
+
+
+def test_patch_compact(pack):
+    patcher = ZipPatcher(pack)
+    for n in range(3):
+        patcher.writestr('en_us_male/main/A0010.mp3', f'version {n}'.encode() * 100)
+        patcher.commit()
+    expected = read_all(pack)
+    grown = os.path.getsize(pack)
+
+    size, md5 = patcher.compact()
+    assert read_all(pack) == expected
+    assert size == os.path.getsize(pack) < grown
+    assert md5 == file_md5(pack)
+    assert patcher.dead == 0
+    assert not os.path.exists(pack + '.tmp')
+
+    # The patcher stays usable after compacting
+    patcher.remove('en_us_male/main/A0010.mp3')
+    assert patcher.commit() == (os.path.getsize(pack), file_md5(pack))
+    assert 'en_us_male/main/A0010.mp3' not in read_all(pack)
+
+
+def test_patch_not_a_zip(tmp_path):
+    path = tmp_path / 'junk.zip'
+    path.write_bytes(b'not a zip' * 10)
+    with pytest.raises(ValueError):
+        ZipPatcher(str(path))
+
+
+def test_patch_leaves_open_readers_on_the_old_file(pack):
+    before = read_all(pack)
+    with open(pack, 'rb') as download:
+        patcher = ZipPatcher(pack)
+        patcher.writestr('en_us_male/main/A0010.mp3', b'new A0010')
+        patcher.commit()
+        # A download in progress still sees the complete old archive
+        with zipfile.ZipFile(download) as zf:
+            assert {name: zf.read(name) for name in zf.namelist()} == before
+    assert read_all(pack)['en_us_male/main/A0010.mp3'] == b'new A0010'
+
+
+def test_failed_commit_leaves_the_zip_and_patcher_unchanged(pack, monkeypatch):
+    before = read_all(pack)
+    size, md5 = os.path.getsize(pack), file_md5(pack)
+    patcher = ZipPatcher(pack)
+    patcher.writestr('en_us_male/main/A0010.mp3', b'new A0010')
+
+    def fail(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(os, 'replace', fail)
+    with pytest.raises(OSError):
+        patcher.commit()
+    monkeypatch.undo()
+    assert read_all(pack) == before
+    assert (os.path.getsize(pack), file_md5(pack)) == (size, md5)
+    assert not os.path.exists(pack + '.tmp')
+    assert patcher.dead == 0
+
+    # The staged change is still there and commits cleanly
+    assert patcher.commit() == (os.path.getsize(pack), file_md5(pack))
+    assert read_all(pack)['en_us_male/main/A0010.mp3'] == b'new A0010'
@@ -0,0 +1,209 @@
+"""pcap_analyzer.py against small synthetic captures."""
+
+import struct
+
+import pcap_analyzer as pa
+from pcap_analyzer import CaptureStats, StreamConsumer, TcpReassembler, TcpSegment
+
+HOST, SERVER = '10.0.0.253', '10.0.0.1'
+
+
+def ip_packet(src: str, dst: str, sport: int, dport: int, seq: int, flags: int,
+              payload: bytes = b'') -> bytes:
+    tcp = struct.pack('>HHIIHHHH', sport, dport, seq, 0, (5 << 12) | flags, 65535, 0, 0)
+    header = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp) + len(payload), 0, 0, 64,
+                         pa.IPPROTO_TCP, 0, bytes(map(int, src.split('.'))),
+                         bytes(map(int, dst.split('.'))))
+    return header + tcp + payload
+
+
+def write_pcap(path, packets) -> str:
+    """A raw-IP pcap with the packets one millisecond apart."""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, pa.LINKTYPE_RAW))
+        for n, packet in enumerate(packets):
+            f.write(struct.pack('<IIII', 1000, n * 1000, len(packet), len(packet)))
+            f.write(packet)
+    return str(path)
+
+
+class Conversation:
+    """Builds the packets of one TCP connection from HOST:sport to SERVER:dport."""
+
+    def __init__(self, sport: int, dport: int = 80):
+        self.sport, self.dport = sport, dport
+        self.seq = {'c': 1000, 's': 5000}
+        self.packets = []
+
+    def _packet(self, side: str, flags: int, payload: bytes = b'', seq: int | None = None):
+        src, dst = (HOST, SERVER) if side == 'c' else (SERVER, HOST)
+        sport, dport = (self.sport, self.dport) if side == 'c' else (self.dport, self.sport)
+        return ip_packet(src, dst, sport, dport, self.seq[side] if seq is None else seq,
+                         flags, payload)
+
+    def syn(self, answered: bool = True):
+        self.packets.append(self._packet('c', pa.TCP_SYN))
+        self.seq['c'] += 1
+        if answered:
+            self.packets.append(self._packet('s', pa.TCP_SYN | pa.TCP_ACK))
+            self.seq['s'] += 1
+        return self
+
+    def send(self, side: str, data: bytes):
+        self.packets.append(self._packet(side, pa.TCP_ACK, data))
+        self.seq[side] += len(data)
+        return self
+
+    def fin(self):
+        for side in 'cs':
+            self.packets.append(self._packet(side, pa.TCP_FIN | pa.TCP_ACK))
+        return self
+
+
+def response(body: bytes, status: str = '200 OK', length: int | None = None) -> bytes:
+    length = len(body) if length is None else length
+    return f'HTTP/1.1 {status}\r\nContent-Length: {length}\r\n\r\n'.encode() + body
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+def test_pipelined_requests_and_head(tmp_path):
+    conv = Conversation(40000).syn()
+    conv.send('c', b'GET /packs/en_us_male.zip HTTP/1.1\r\nHost: cdn.example\r\n\r\n'
+                   b'HEAD /main/A0010.mp3 HTTP/1.1\r\nHost: cdn.example\r\n\r\n'
+                   b'GET /main/A0011.mp3 HTTP/1.1\r\nHost: cdn.example\r\n\r\n')
+    # The HEAD reply has a Content-Length but no body; the next reply follows it directly
+    conv.send('s', response(b'PK\x03\x04zip') + response(b'', length=500)
+              + response(b'ID3 mp3')).fin()
+    report = pa.analyze(write_pcap(tmp_path / 'c.pcap', conv.packets), HOST)
+
+    assert report.http == {('GET', 'cdn.example', '/packs/en_us_male.zip'): 1,
+                           ('HEAD', 'cdn.example', '/main/A0010.mp3'): 1,
+                           ('GET', 'cdn.example', '/main/A0011.mp3'): 1}
+    assert report.connections == {(SERVER, 80): 1}
+    assert [(o.name, o.size, o.kind, o.complete) for o in report.objects] == [
+        ('en_us_male.zip', 7, 'ZIP archive', True),
+        ('A0011.mp3', 7, 'MP3 audio', True),
+    ]
+
+
+def test_out_of_order_response(tmp_path):
+    conv = Conversation(40001).syn()
+    conv.send('c', b'GET /pack.zip HTTP/1.1\r\nHost: h\r\n\r\n')
+    data = response(b'PK\x03\x04' + bytes(range(200)))
+    start = conv.seq['s']
+    parts = [(start, data[:50]), (start + 50, data[50:120]), (start + 120, data[120:])]
+    for seq, part in (parts[1], parts[2], parts[0]):
+        conv.packets.append(conv._packet('s', pa.TCP_ACK, part, seq))
+    conv.seq['s'] += len(data)
+    report = pa.analyze(write_pcap(tmp_path / 'c.pcap', conv.fin().packets), HOST)
+
+    assert report.stats.tcp_gaps == 0
+    assert [(o.name, o.size, o.complete) for o in report.objects] == [('pack.zip', 204, True)]
+
+
+def test_unanswered_syns_do_not_fill_the_connection_table(tmp_path):
+    packets = []
+    for port in range(41000, 41050):
+        packets += Conversation(port).syn(answered=False).packets
+    conv = Conversation(40002).syn()
+    conv.send('c', b'HEAD /a.zip HTTP/1.1\r\nHost: h\r\n\r\n'
+                   b'GET /b.zip HTTP/1.1\r\nHost: h\r\n\r\n')
+    conv.send('s', response(b'', length=9) + response(b'PK\x03\x04b')).fin()
+    analyzer = pa.CaptureAnalyzer(write_pcap(tmp_path / 'c.pcap', packets + conv.packets), HOST,
+                                  max_streams=16)
+    analyzer.feed(analyzer.report.path)
+    assert len(analyzer._conns) <= 16
+    report = analyzer.finish()
+
+    assert not analyzer._conns
+    assert report.stats.streams_evicted > 0
+    assert [(o.name, o.size) for o in report.objects] == [('b.zip', 5)]
+
+
+# ---------------------------------------------------------------------------
+# TCP reassembly
+# ---------------------------------------------------------------------------
+
+class Recorder(StreamConsumer):
+    def __init__(self):
+        self.events = []
+
+    def data(self, ts, data):
+        self.events.append(bytes(data))
+        return True
+
+    def gap(self, ts):
+        self.events.append('gap')
+
+    def close(self, ts):
+        self.events.append('close')
+
+
+def reassemble(segments, max_pending: int = 1 << 20) -> list:
+    recorder = Recorder()
+    tcp = TcpReassembler(lambda key, syn: recorder, CaptureStats(), max_pending=max_pending)
+    tcp.segment(0.0, 'a', 'b', TcpSegment(1, 2, 99, pa.TCP_SYN, b''))
+    for seq, payload in segments:
+        tcp.segment(0.0, 'a', 'b', TcpSegment(1, 2, 100 + seq, pa.TCP_ACK, payload))
+    tcp.finish(0.0)
+    return recorder.events
+
+
+def test_reorder_and_retransmit():
+    assert reassemble([(4, b'EFGH'), (0, b'ABCD'), (0, b'ABCD'), (2, b'CDEF'), (8, b'IJ')]) == [
+        b'ABCD', b'EFGH', b'IJ', 'close']
+
+
+def test_overlapping_segments_past_a_hole():
+    # Bytes 4-5 are never captured; the buffered segments past the hole overlap
+    events = reassemble([(0, b'ABCD'), (6, b'GHIJ'), (8, b'IJKL'), (15, b'PQ')])
+    assert events == [b'ABCD', 'gap', b'GHIJ', b'KL', 'gap', b'PQ', 'close']
+
+
+def test_pending_overflow_declares_a_gap():
+    events = reassemble([(0, b'AB'), (4, b'EFGH'), (8, b'IJKL')], max_pending=4)
+    assert events == [b'AB', 'gap', b'EFGH', b'IJKL', 'close']
+
+
+# ---------------------------------------------------------------------------
+# TLS
+# ---------------------------------------------------------------------------
+
+def client_hello(sni: str, padding: int = 0) -> bytes:
+    """A TLS record holding a minimal ClientHello with server_name first."""
+    name = sni.encode()
+    server_name = struct.pack('>HBH', len(name) + 3, 0, len(name)) + name
+    extensions = (struct.pack('>HH', 0, len(server_name)) + server_name
+                  + struct.pack('>HH', 21, padding) + bytes(padding))
+    hello = (b'\x03\x03' + bytes(32) + b'\x00' + b'\x00\x02\x13\x01' + b'\x01\x00'
+             + struct.pack('>H', len(extensions)) + extensions)
+    handshake = b'\x01' + len(hello).to_bytes(3, 'big') + hello
+    return b'\x16\x03\x01' + struct.pack('>H', len(handshake)) + handshake
+
+
+def test_client_hello_split_across_segments(tmp_path):
+    hello = client_hello('api.example')
+    conv = Conversation(40010, 443).syn()
+    for n in range(0, len(hello), 7):
+        conv.send('c', hello[n:n + 7])
+    report = pa.analyze(write_pcap(tmp_path / 'c.pcap', conv.fin().packets), HOST)
+
+    assert report.tls == {('api.example', 443): SERVER}
+
+
+def test_truncated_client_hello_is_parsed_on_close(tmp_path):
+    # The capture ends before the padding: the record is never complete
+    hello = client_hello('mqtt.example', padding=1000)
+    conv = Conversation(40011, 8883).syn().send('c', hello[:200]).fin()
+    report = pa.analyze(write_pcap(tmp_path / 'c.pcap', conv.packets), HOST)
+
+    assert report.tls == {('mqtt.example', 8883): SERVER}
+
+
+def test_sni_cut_short_is_ignored():
+    hello = client_hello('mqtt.example')
+    assert pa.parse_client_hello_sni(hello) == 'mqtt.example'
+    assert pa.parse_client_hello_sni(hello[:-7]) is None   # 3 bytes short of the name
@@ -0,0 +1,67 @@
+"""synth_daemon.ModelCache against a stub loader."""
+
+import os
+
+import pytest
+
+import synth_daemon
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """Replace load_voice(); returns the list of paths loaded so far."""
+    paths = []
+
+    def load_voice(model_path, session=None):
+        paths.append(os.path.basename(model_path))
+        return object()
+
+    monkeypatch.setattr(synth_daemon, 'load_voice', load_voice)
+    return paths
+
+
+def model(tmp_path, name, data=b'model', config=None):
+    path = tmp_path / name
+    path.write_bytes(data)
+    if config is not None:
+        (tmp_path / f'{name}.json').write_text(config)
+    return str(path)
+
+
+def test_reloads_when_the_model_or_config_changes(tmp_path, loaded):
+    cache = synth_daemon.ModelCache(2)
+    path = model(tmp_path, 'a.onnx', config='{}')
+    voice, lock = cache.get(path)
+    assert cache.get(path) == (voice, lock)
+    assert loaded == ['a.onnx']
+
+    # A new config, same size, newer mtime
+    os.utime(f'{path}.json', ns=(0, os.stat(f'{path}.json').st_mtime_ns + 10**9))
+    assert cache.get(path)[0] is not voice
+    # A rebuilt model of another size
+    model(tmp_path, 'a.onnx', b'retrained model')
+    cache.get(path)
+    # The config removed
+    os.remove(f'{path}.json')
+    cache.get(path)
+    assert loaded == ['a.onnx'] * 4
+    assert cache.loaded() == [os.path.realpath(path)]
+
+
+def test_least_recently_used_model_is_unloaded(tmp_path, loaded):
+    cache = synth_daemon.ModelCache(2)
+    a, b, c = (model(tmp_path, f'{name}.onnx') for name in 'abc')
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(c)
+    assert cache.loaded() == [os.path.realpath(p) for p in (a, c)]
+    cache.get(b)
+    assert loaded == ['a.onnx', 'b.onnx', 'c.onnx', 'b.onnx']
+    assert cache.loads == 4
+
+
+def test_missing_model(tmp_path, loaded):
+    with pytest.raises(FileNotFoundError):
+        synth_daemon.ModelCache(1).get(str(tmp_path / 'missing.onnx'))
+    assert loaded == []
@@ -0,0 +1,182 @@
+"""Prompt synthesis, the synthesis cache and deduplication, against bench_build.py's stub voice."""
+
+import os
+
+import pytest
+
+import build_voice_pack as bvp
+from bench_build import StubVoice
+
+
+@pytest.fixture
+def loads(tmp_path, monkeypatch):
+    """Replace load_voice() with the stub voice; returns a reader for the (model, pid) loads."""
+    log = tmp_path / 'loads'
+    log.touch()
+
+    def load_voice(model_path, session=None, alignments=False):
+        # Appended from pool workers too (forked, so they see this patch)
+        with open(log, 'a') as f:
+            f.write(f'{model_path} {os.getpid()}\n')
+        if 'bad' in model_path:
+            raise RuntimeError(f'cannot load {model_path}')
+        return StubVoice()
+
+    monkeypatch.setattr(bvp, 'load_voice', load_voice)
+    monkeypatch.setattr(bvp, '_worker_model', (None, None))
+    monkeypatch.setattr(bvp, '_worker_settings', (None, False))
+    monkeypatch.setattr(bvp, '_batch_failed', False)
+    return lambda: [tuple(line.split()) for line in log.read_text().splitlines()]
+
+
+def pcm_of(text: str) -> bytes:
+    return bvp.synthesize_pcm(StubVoice(), text)[0]
+
+
+def tasks_for(texts, model='m.onnx'):
+    return [(model, f'A{n:04d}', text) for n, text in enumerate(texts)]
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_results_in_task_order_with_errors_per_task(loads, jobs):
+    texts = [f'Prompt number {n}.' for n in range(7)]
+    tasks = tasks_for(texts[:3]) + tasks_for(texts[3:5], 'bad.onnx') + tasks_for(texts[5:])
+    tasks.insert(2, ('m.onnx', 'A0099', ''))  # Piper produces no audio for it
+    results = list(bvp.synthesize_all(tasks, jobs, None, batch=2))
+
+    assert [(model, code, text) for model, code, text, *_ in results] == tasks
+    for (model, _, text, data, trimmed, error) in results:
+        if model == 'bad.onnx':
+            assert (data, str(error)) == (None, 'cannot load bad.onnx')
+        elif not text:
+            assert data is None and 'no audio' in str(error)
+        else:
+            assert (data, trimmed, error) == (pcm_of(text), 0.0, None)
+
+
+def test_shared_pool_keeps_models_loaded(loads):
+    pool = bvp.synthesis_pool(2, model_path='m.onnx')
+    try:
+        # Both workers loaded the model before synthesis_pool() returned
+        assert sorted(model for model, _ in loads()) == ['m.onnx', 'm.onnx']
+        for texts in (['One.', 'Two.', 'Three.'], ['Four.', 'Five.']):
+            results = list(bvp.synthesize_all(tasks_for(texts), 2, None, pool=pool))
+            assert [(text, data) for _, _, text, data, _, _ in results] == \
+                [(text, pcm_of(text)) for text in texts]
+        assert len(loads()) == 2  # no reloads across calls
+    finally:
+        pool.shutdown()
+
+
+def test_batch_failure_falls_back_and_is_reported_once(monkeypatch, capsys):
+    import tracing
+
+    monkeypatch.setattr(bvp, '_batch_failed', False)
+    monkeypatch.setattr(tracing, '_enabled', False)
+    tracing.enable()
+    tasks = [('A0010', 'One.'), ('A0011', 'Two.')]
+    try:
+        # The stub has no batched inference, so every group falls back
+        for _ in range(2):
+            results = bvp.synthesize_group(StubVoice(), tasks, None, batch=4)
+            assert results == [(pcm_of('One.'), 0.0, None), (pcm_of('Two.'), 0.0, None)]
+        events = tracing.drain()
+    finally:
+        monkeypatch.setattr(tracing, '_enabled', False)
+    err = capsys.readouterr().err
+    assert err.count('Batched inference failed for a group of 2 prompts') == 1
+    fallbacks = [e for e in events if e.get('name') == 'batch_fallback']
+    assert len(fallbacks) == 2 and fallbacks[0]['args']['prompts'] == 2
+    assert 'error' in fallbacks[0]['args']
+
+
+@pytest.mark.parametrize('seconds', [0.25, 1.0, 1.37])
+def test_trim_saving_matches_the_encoded_size(seconds):
+    pytest.importorskip('lameenc')
+    pcm = pcm_of('A prompt long enough to trim a second or more from its start.')
+    cut = 2 * int(22050 * seconds)
+    saved = len(bvp.encode_mp3_lame(pcm, 22050)) - len(bvp.encode_mp3_lame(pcm[cut:], 22050))
+    frame = 72  # bytes per 16 kbps frame
+    assert abs(saved - bvp.trim_saving(seconds)) <= frame
+
+
+# ---------------------------------------------------------------------------
+# SynthesisCache
+# ---------------------------------------------------------------------------
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    model = tmp_path / 'm.onnx'
+    model.write_bytes(b'model')
+    cache = bvp.SynthesisCache(str(tmp_path / 'cache'), str(model), max_bytes=150)
+    for age, text in enumerate(['Newest.', 'Middle.', 'Oldest.']):
+        cache.put(text, text.encode() * 10)
+        os.utime(cache._path(cache.key(text)), (1e9 - age, 1e9 - age))
+    assert cache.get('Oldest.') == b'Oldest.' * 10  # a hit makes it the newest
+
+    assert cache.evict() == 1
+    assert [cache.contains(t) for t in ('Newest.', 'Middle.', 'Oldest.')] == [True, False, True]
+    assert cache.evict() == 0
+    cache.max_bytes = 0
+    assert cache.evict() == 2
+    assert not os.listdir(tmp_path / 'cache' / cache.key('Oldest.')[:2])
+
+
+# ---------------------------------------------------------------------------
+# Deduplication and sentence fragments
+# ---------------------------------------------------------------------------
+
+def test_split_sentences():
+    assert bvp.split_sentences('  Battery low.  Returning   to base!Now? ') == \
+        ['Battery low.', 'Returning to base!Now?']
+    assert bvp.split_sentences(' \n') == []
+
+
+@pytest.fixture
+def unique(loads, tmp_path, monkeypatch):
+    """(model path, list of texts synthesized); 'raw' encodes to the PCM itself."""
+    path = tmp_path / 'm.onnx'
+    (tmp_path / 'm.onnx.json').write_text('{"audio": {"sample_rate": 22050}}')
+    monkeypatch.setitem(bvp.ENCODERS, 'raw', lambda pcm, sample_rate: pcm)
+    synthesized = []
+    real = bvp.synthesize_pcm
+    monkeypatch.setattr(bvp, 'synthesize_pcm',
+                        lambda voice, text: synthesized.append(text) or real(voice, text))
+    return str(path), synthesized
+
+
+def test_identical_prompts_are_synthesized_once(unique):
+    model, synthesized = unique
+    tasks = tasks_for(['Cleaning started.', 'Docked.', 'Cleaning started.'], model)
+    stats = bvp.DedupStats()
+    results = list(bvp.synthesize_unique(tasks, encoder='raw', stats=stats))
+    made = list(synthesized)  # before pcm_of() adds to it
+
+    assert [(code, data) for _, code, _, data, _, _ in results] == \
+        [(code, pcm_of(text)) for _, code, text in tasks]
+    assert made == ['Cleaning started.', 'Docked.']
+    assert (stats.prompts, stats.texts) == (3, 2)
+    assert stats.reused == len(pcm_of('Cleaning started.'))
+
+
+def test_prompts_are_assembled_from_shared_sentences(unique):
+    model, synthesized = unique
+    texts = ['Battery low. Returning to base.', 'Cleaning started.',
+             'Battery low.  Please charge.', 'Cleaning started.', 'Battery low. ...']
+    stats = bvp.DedupStats()
+    results = list(bvp.synthesize_unique(tasks_for(texts, model), encoder='raw',
+                                         sentence_gap_ms=100, stats=stats))
+    made = sorted(synthesized)
+
+    assert len(results) == len(texts)
+    gap = bytes(2 * 2205)  # 100 ms at 22050 Hz
+    for (_, _, text, data, _, error), expected in zip(results, texts):
+        assert text == expected
+        if text.endswith('...'):
+            # The stub has no audio for '...', so only this prompt fails
+            assert data is None and 'no audio' in str(error)
+        else:
+            assert error is None
+            assert data == gap.join(pcm_of(s) for s in bvp.split_sentences(text))
+    assert made == ['...', 'Battery low.', 'Cleaning started.', 'Please charge.',
+                    'Returning to base.']
+    assert (stats.prompts, stats.texts, stats.sentences, stats.fragments) == (5, 4, 8, 5)
@@ -0,0 +1,129 @@
+"""Tuya v3.3 framing (tools/tuya_local.py) and the capture decoder (tools/decode_tuya_capture.py)."""
+
+import json
+
+import pytest
+
+pytest.importorskip('Crypto')  # tuya_local.py exits without pycryptodome
+
+import decode_tuya_capture as dtc
+import dps_protobuf as pb
+import tuya_local as tl
+from send_voice_pack import build_dps162
+from test_pcap_analyzer import ip_packet, write_pcap
+
+KEY = '0123456789abcdef'
+OTHER_KEY = 'fedcba9876543210'
+DEVICE, APP = '10.0.0.253', '10.0.0.2'
+
+
+def dps_frame(seqno: int, dps: dict, key: str = KEY, retcode: int | None = None,
+              cmd: int = tl.CMD_CONTROL) -> bytes:
+    payload = tl.TuyaCipher(key).encode_payload(json.dumps({'dps': dps}).encode(),
+                                                version_header=True)
+    return tl.pack_frame(seqno, cmd, payload, retcode)
+
+
+# ---------------------------------------------------------------------------
+# FrameReader and TuyaCipher
+# ---------------------------------------------------------------------------
+
+def test_frames_split_across_segments():
+    stream = tl.pack_frame(1, tl.CMD_HEART_BEAT, b'') + tl.pack_frame(2, tl.CMD_STATUS, b'abc')
+    reader = tl.FrameReader(has_retcode=False)
+    frames = []
+    for i in range(len(stream)):
+        frames += reader.feed(stream[i:i + 1])
+    assert frames == [tl.Frame(1, tl.CMD_HEART_BEAT, None, b'', True),
+                      tl.Frame(2, tl.CMD_STATUS, None, b'abc', True)]
+
+
+def test_several_frames_in_one_segment_with_garbage():
+    data = (b'junk' + tl.pack_frame(1, tl.CMD_STATUS, b'one', retcode=0)
+            + tl.pack_frame(2, tl.CMD_STATUS, b'two', retcode=1) + b'\x00\x00\x55')
+    reader = tl.FrameReader(has_retcode=True)
+    assert reader.feed(data) == [tl.Frame(1, tl.CMD_STATUS, 0, b'one', True),
+                                 tl.Frame(2, tl.CMD_STATUS, 1, b'two', True)]
+    # The partial prefix at the end is kept for the next segment
+    assert reader.feed(b'\xaa' + tl.pack_frame(3, tl.CMD_STATUS, b'', retcode=0)[4:]) == [
+        tl.Frame(3, tl.CMD_STATUS, 0, b'', True)]
+
+
+def test_bad_crc_and_bogus_length():
+    frame = bytearray(tl.pack_frame(1, tl.CMD_STATUS, b'payload'))
+    frame[-5] ^= 0xFF  # last CRC byte, before the 4-byte suffix
+    bogus = tl.PREFIX_BIN + bytes(8) + (tl.MAX_FRAME_PAYLOAD + 1).to_bytes(4, 'big')
+    frames = tl.FrameReader(has_retcode=False).feed(bogus + bytes(frame))
+    assert frames == [tl.Frame(1, tl.CMD_STATUS, None, b'payload', False)]
+
+
+def test_cipher_roundtrip_and_wrong_key():
+    raw = json.dumps({'dps': {'162': 'x'}}).encode()
+    cipher = tl.TuyaCipher(KEY)
+    for header in (True, False):
+        assert cipher.decode_payload(cipher.encode_payload(raw, header)) == raw
+    with pytest.raises(ValueError):
+        tl.TuyaCipher(OTHER_KEY).decode_payload(cipher.encode_payload(raw, True))
+    with pytest.raises(ValueError):
+        tl.TuyaCipher('short')
+
+
+def test_dps162_through_a_frame():
+    value = build_dps162(502, 'http://10.0.0.2/en_us_male.zip', 'ab' * 16, 16, 1234)
+    [frame] = tl.FrameReader(has_retcode=False).feed(dps_frame(7, {'162': value}))
+    msg = json.loads(tl.TuyaCipher(KEY).decode_payload(frame.payload))
+    assert pb.decode_dps(msg['dps']['162'], pb.dps162_message)['voice_info'] == {
+        'set_id': 502, 'url': 'http://10.0.0.2/en_us_male.zip', 'md5': 'ab' * 16,
+        'version': 16, 'size': 1234,
+    }
+
+
+# ---------------------------------------------------------------------------
+# TuyaDecoder
+# ---------------------------------------------------------------------------
+
+def decoder(keys: list[str], devices: list[dict] = ()):
+    events = []
+    return dtc.TuyaDecoder(dtc.KeyRing(keys, list(devices)), {(None, 6668)}, events.append), events
+
+
+def test_decoder_stream_events():
+    dec, events = decoder([OTHER_KEY, KEY])
+    to_device = dec._new_stream((APP, 50000, DEVICE, 6668), True)
+    from_device = dec._new_stream((DEVICE, 6668, APP, 50000), True)
+    request = build_dps162(502, 'http://10.0.0.2/p.zip', 'ab' * 16, 16, 1234)
+    status = pb.encode_dps(pb.DPS162_STATUS, {'installed_id': 502, 'installed_version': 16,
+                                              'target_id': 502, 'state': 2})
+    data = dps_frame(1, {'162': request}) + tl.pack_frame(2, tl.CMD_HEART_BEAT, b'')
+    to_device.data(1.0, data[:30])
+    to_device.data(1.5, data[30:])
+    from_device.data(2.0, dps_frame(1, {'162': status}, retcode=0, cmd=tl.CMD_STATUS))
+    # Wrong key: counted, not emitted
+    from_device.data(3.0, dps_frame(2, {'5': 'x'}, key='0' * 16, retcode=0, cmd=tl.CMD_STATUS))
+
+    assert [(e['direction'], e['cmd'], e['seq'], e['dps162']['kind']) for e in events] == [
+        ('to_device', 'CONTROL', 1, 'request'), ('from_device', 'STATUS', 1, 'status')]
+    assert events[0]['device'] == DEVICE and events[0]['time'] == 1.5
+    assert events[0]['dps162']['set_id'] == 502
+    assert events[1]['dps162']['state'] == 2
+    assert 'state=2 (installed)' in dtc.format_event(events[1])
+    assert (dec.stats.frames, dec.stats.heartbeats, dec.stats.undecryptable) == (4, 1, 1)
+
+
+def test_decoder_reads_a_capture(tmp_path):
+    frames = [dps_frame(1, {'162': build_dps162(501, 'http://h/a.zip', 'cd' * 16, 14, 99)}),
+              dps_frame(2, {'3': 50})]
+    data = b''.join(frames)
+    seq = 1000
+    packets = [ip_packet(APP, DEVICE, 50000, 6668, seq - 1, 0x02)]
+    # The second segment arrives first, and ends in the middle of the second frame
+    cut = len(frames[0]) + 10
+    packets.append(ip_packet(APP, DEVICE, 50000, 6668, seq + 20, 0x10, data[20:cut]))
+    packets.append(ip_packet(APP, DEVICE, 50000, 6668, seq, 0x10, data[:20]))
+    packets.append(ip_packet(APP, DEVICE, 50000, 6668, seq + cut, 0x10, data[cut:]))
+    dec, events = decoder([KEY], [{'ip': DEVICE, 'port': None, 'local_key': KEY}])
+    dec.run(write_pcap(tmp_path / 'tuya.pcap', packets))
+
+    assert [(e['seq'], list(e['dps'])) for e in events] == [(1, ['162']), (2, ['3'])]
+    assert events[0]['dps162']['version'] == 14
+    assert dec.stats.bad_crc == dec.stats.undecryptable == 0
@@ -0,0 +1,132 @@
+"""validate_pack() against packs built from synthetic MPEG-2 frames."""
+
+import zipfile
+
+import pytest
+
+from build_voice_pack import StreamingZipWriter
+from validate_voice_pack import PACK_FILES, validate_pack
+
+# A 16 kbps 16 kHz mono MPEG-2 layer III frame: 72 bytes, 36 ms
+FRAME = bytes([0xFF, 0xF3, 0x28, 0xC0]) + bytes(68)
+MP3 = FRAME * 50
+# The same frame at 24 kbps: 108 bytes
+MP3_24K = (bytes([0xFF, 0xF3, 0x38, 0xC0]) + bytes(104)) * 50
+
+CONFIG = b'id: 502\nversion: 16\n'
+
+
+def make_pack(path, voice_name='en_us_male', config=CONFIG, audio=None, extra=None):
+    """Write a pack with every PACK_FILES code; `audio` overrides code -> bytes (None drops it)."""
+    audio = {code: MP3 for code in PACK_FILES} | (audio or {})
+    with StreamingZipWriter(str(path)) as zw:
+        if config is not None:
+            zw.writestr(f'{voice_name}/config.yaml', config, compress=True)
+        for code, data in audio.items():
+            if data is not None:
+                zw.writestr(f'{voice_name}/main/{code}.mp3', data)
+        for name, data in (extra or {}).items():
+            zw.writestr(name, data)
+    return str(path)
+
+
+def test_good_pack(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip'), 502, 16)
+    assert report.ok
+    assert report.errors == report.warnings == []
+    assert (report.voice_name, report.pack_id, report.version) == ('en_us_male', 502, 16)
+    assert len(report.files) == len(PACK_FILES)
+    assert report.files['A0010'] == {'bytes': len(MP3), 'frames': 50, 'seconds': 1.8,
+                                     'errors': [], 'warnings': []}
+
+
+def test_missing_files(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', audio={'A0010': None, 'A0011': None}))
+    assert not report.ok
+    assert report.errors == [f'2 of {len(PACK_FILES)} files missing: A0010, A0011']
+
+
+def test_wrong_bitrate(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', audio={'A0010': MP3_24K}))
+    assert not report.ok
+    assert report.errors == []
+    assert report.files['A0010']['errors'] == ['bitrate 24 kbps (16 required)']
+
+
+def test_folder_does_not_match_id(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', voice_name='en_us_female'))
+    assert report.errors == ['folder en_us_female/ does not match id 502 (en_us_male/)']
+
+
+def test_unknown_id_is_a_warning(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', config=b'id: 999\nversion: 1\n'))
+    assert report.ok
+    assert report.warnings[0].startswith('id 999 is not a known voice pack id')
+
+
+@pytest.mark.parametrize('pack_id, version, error', [
+    (501, None, 'config.yaml id is 502, expected 501'),
+    (None, 17, 'config.yaml version is 16, expected 17'),
+])
+def test_expected_id_and_version(tmp_path, pack_id, version, error):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip'), pack_id, version)
+    assert report.errors == [error]
+
+
+@pytest.mark.parametrize('config, errors', [
+    (None, ['en_us_male/config.yaml is missing']),
+    (b'id: 502\n', ['config.yaml has no version']),
+    (b'id: 502\nversion: v16\n', ["config.yaml version is not an integer: 'v16'"]),
+])
+def test_bad_config(tmp_path, config, errors):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', config=config))
+    assert report.errors == errors
+
+
+def test_not_a_zip(tmp_path):
+    path = tmp_path / 'pack.zip'
+    path.write_bytes(MP3)
+    report = validate_pack(str(path))
+    assert not report.ok
+    assert report.errors[0].startswith('not a ZIP file')
+
+
+def test_two_top_folders(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', extra={'other/A0010.mp3': MP3}))
+    assert report.errors == ['expected a single <voice_name>/ folder at the top, '
+                             'found en_us_male, other']
+
+
+def test_crc_mismatch(tmp_path):
+    path = make_pack(tmp_path / 'pack.zip')
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo('en_us_male/main/A0010.mp3')
+    with open(path, 'r+b') as f:
+        # Flip a byte in the stored data, past the 30-byte local header and the name
+        f.seek(info.header_offset + 30 + len(info.filename.encode()) + 100)
+        byte = f.read(1)
+        f.seek(-1, 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    report = validate_pack(path)
+    assert not report.ok
+    assert report.files['A0010']['errors'] == ['CRC mismatch in en_us_male/main/A0010.mp3']
+    assert report.files['A0011']['errors'] == []
+
+
+def test_extra_files_are_warnings(tmp_path):
+    report = validate_pack(make_pack(tmp_path / 'pack.zip', audio={'Z9999': MP3},
+                                     extra={'en_us_male/readme.txt': b'hi'}))
+    assert report.ok
+    assert report.warnings == ['unexpected file en_us_male/readme.txt',
+                               '1 files the vacuum does not play: Z9999']
+
+
+def test_compressed_mp3_is_a_warning(tmp_path):
+    path = tmp_path / 'pack.zip'
+    with StreamingZipWriter(str(path)) as zw:
+        zw.writestr('en_us_male/config.yaml', CONFIG)
+        for code in PACK_FILES:
+            zw.writestr(f'en_us_male/main/{code}.mp3', MP3, compress=code == 'A0010')
+    report = validate_pack(str(path))
+    assert report.ok
+    assert report.files['A0010']['warnings'] == ['compressed in the ZIP (stock packs store MP3s)']
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+bench_build.py — Stage-by-stage benchmark of the build_voice_pack.py pipeline.
+
+Runs the build pipeline against a deterministic stub voice, so no Piper
+model (or piper-tts install) is needed. The stub yields synthetic
+`audio_int16_bytes` chunks, one per sentence, with a length proportional
+to the text like real speech. Each stage is timed separately:
+
+  synthesis  synthesize_pcm(): collecting and joining the voice's chunks
+             (the stub's own cost is negligible, so this is pipeline overhead)
+  wav        pcm_to_wav(): WAV assembly before ffmpeg (ffmpeg encoder only)
+  encode     MP3 encoding with the selected backend
+  chimes     reading the [CHIME] files
+  zip        StreamingZipWriter: headers, file writes, central directory
+  md5        MD5 of the archive, computed while it is written
+
+Pack sizes range from the default prompt map (86 entries) to thousands of
+prompts; larger packs reuse the default texts with a numeric suffix.
+
+Results are written as JSON. With --baseline, every stage is compared with
+a previous run and the script exits 1 if one got slower than the tolerance
+allows; --limit sets absolute per-prompt caps.
+
+Usage:
+    python3 tools/bench_build.py --json bench.json
+    python3 tools/bench_build.py --sizes 86,500 --encoder lame --baseline bench.json
+    python3 tools/bench_build.py --limit encode=50 --limit zip=0.5
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import zlib
+from typing import NamedTuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import build_voice_pack  # noqa: E402
+from bench_encoders import synthetic_pcm  # noqa: E402
+
+
+STAGES = ('synthesis', 'wav', 'encode', 'chimes', 'zip', 'md5')
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'examples', 'prompts', 'data_star_trek.json')
+
+
+# ---------------------------------------------------------------------------
+# Stub voice
+# ---------------------------------------------------------------------------
+
+class StubChunk(NamedTuple):
+    sample_rate: int
+    sample_width: int
+    sample_channels: int
+    audio_int16_bytes: bytes
+
+
+class StubVoice:
+    """
+    Deterministic stand-in for PiperVoice.
+
+    synthesize() yields one chunk per sentence, sliced from a precomputed
+    waveform, with about `chars_per_second` characters of text per second
+    of audio.
+    """
+
+    def __init__(self, sample_rate: int = 22050, chars_per_second: float = 14.0):
+        self.sample_rate = sample_rate
+        self.chars_per_second = chars_per_second
+        self._table = synthetic_pcm(4.0, sample_rate, seed=0)
+
+    def synthesize(self, text: str):
+        table = self._table
+        for sentence in text.replace('!', '.').replace('?', '.').split('.'):
+            if not sentence.strip():
+                continue
+            n = 2 * int(self.sample_rate * (0.2 + len(sentence) / self.chars_per_second))
+            start = 2 * (zlib.crc32(sentence.encode()) % (len(table) // 2))
+            pcm = bytearray()
+            while len(pcm) < n:
+                pcm += table[start:start + n - len(pcm)]
+                start = 0
+            yield StubChunk(self.sample_rate, 2, 1, bytes(pcm))
+
+
+class TimedZipWriter(build_voice_pack.StreamingZipWriter):
+    """StreamingZipWriter that accounts for MD5 time separately from writing."""
+
+    md5_seconds = 0.0
+
+    def _write(self, data: bytes) -> None:
+        t0 = time.perf_counter()
+        self._md5.update(data)
+        self.md5_seconds += time.perf_counter() - t0
+        self._f.write(data)
+        self.size += len(data)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def load_base_prompts(path: str) -> list[tuple[str, str]]:
+    with open(path) as f:
+        return [(k, v) for k, v in json.load(f).items() if not k.startswith('_comment')]
+
+
+def make_prompts(base: list[tuple[str, str]], count: int) -> list[tuple[str, str]]:
+    """`count` (code, text) prompts, cycling through `base` with unique codes and texts."""
+    prompts = []
+    for i in range(count):
+        code, text = base[i % len(base)]
+        rnd = i // len(base)
+        if rnd:
+            code = f'{code}_{rnd}'
+            if text != '[CHIME]':
+                text = f'{text} Variant {rnd}.'
+        prompts.append((code, text))
+    return sorted(prompts)
+
+
+def run_pack(prompts: list[tuple[str, str]], voice: StubVoice, encoder: str,
+             chime_data: bytes, work_dir: str) -> dict:
+    """Build one pack through the real pipeline functions, timing every stage."""
+    t = dict.fromkeys(STAGES, 0.0)
+    chime_dir = os.path.join(work_dir, 'chimes')
+    os.makedirs(chime_dir, exist_ok=True)
+    audio_seconds = 0.0
+    wall0 = time.perf_counter()
+
+    zw = TimedZipWriter(os.path.join(work_dir, 'bench.zip'))
+    t0 = time.perf_counter()
+    zw.writestr('voice/config.yaml', b'id: 502\nversion: 16\n', compress=True)
+    t['zip'] += time.perf_counter() - t0
+
+    for code, text in prompts:
+        if text == '[CHIME]':
+            path = os.path.join(chime_dir, f'{code}.mp3')
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(chime_data)
+            t0 = time.perf_counter()
+            with open(path, 'rb') as f:
+                data = f.read()
+            t['chimes'] += time.perf_counter() - t0
+        else:
+            t0 = time.perf_counter()
+            pcm, rate = build_voice_pack.synthesize_pcm(voice, text)
+            t1 = time.perf_counter()
+            if encoder == 'ffmpeg':
+                wav = build_voice_pack.pcm_to_wav(pcm, rate)
+                t2 = time.perf_counter()
+                data = build_voice_pack.ffmpeg_wav_to_mp3(wav)
+            else:
+                t2 = t1
+                data = build_voice_pack.ENCODERS[encoder](pcm, rate)
+            t3 = time.perf_counter()
+            t['synthesis'] += t1 - t0
+            t['wav'] += t2 - t1
+            t['encode'] += t3 - t2
+            audio_seconds += len(pcm) / 2 / rate
+
+        t0 = time.perf_counter()
+        zw.writestr(f'voice/main/{code}.mp3', data)
+        t['zip'] += time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    zw.close()
+    t['zip'] += time.perf_counter() - t0
+    t['md5'] = zw.md5_seconds
+    t['zip'] -= zw.md5_seconds
+    wall = time.perf_counter() - wall0
+
+    n = len(prompts)
+    return {
+        'prompts': n,
+        'speech': sum(1 for _, text in prompts if text != '[CHIME]'),
+        'chimes': sum(1 for _, text in prompts if text == '[CHIME]'),
+        'audio_seconds': round(audio_seconds, 1),
+        'zip_bytes': zw.size,
+        'wall_seconds': round(wall, 4),
+        'stages': {
+            stage: {'seconds': round(sec, 6), 'ms_per_prompt': round(1000 * sec / n, 4)}
+            for stage, sec in t.items()
+        },
+    }
+
+
+def best_of(runs: list[dict]) -> dict:
+    """Merge repeated runs of one size, keeping each stage's fastest time."""
+    best = dict(min(runs, key=lambda r: r['wall_seconds']))
+    best['stages'] = {
+        stage: min((r['stages'][stage] for r in runs), key=lambda s: s['seconds'])
+        for stage in STAGES
+    }
+    return best
+
+
+def check_regressions(results: list[dict], baseline: dict | None, tolerance: float,
+                      limits: dict[str, float], min_ms: float) -> list[str]:
+    failures = []
+    base_by_size = {r['prompts']: r for r in (baseline or {}).get('results', [])}
+    for r in results:
+        base = base_by_size.get(r['prompts'])
+        for stage, cur in r['stages'].items():
+            ms = cur['ms_per_prompt']
+            if stage in limits and ms > limits[stage]:
+                failures.append(f"{r['prompts']} prompts: {stage} {ms:.3f} ms/prompt "
+                                f"> limit {limits[stage]:.3f}")
+            if base is None or stage not in base['stages']:
+                continue
+            old = base['stages'][stage]['ms_per_prompt']
+            if max(ms, old) < min_ms:
+                continue  # both below the noise floor
+            if ms > old * (1 + tolerance):
+                failures.append(f"{r['prompts']} prompts: {stage} {ms:.3f} ms/prompt vs "
+                                f"baseline {old:.3f} (+{100 * (ms / old - 1) if old else 100:.0f}%)")
+    return failures
+
+
+def parse_limit(value: str) -> tuple[str, float]:
+    stage, _, ms = value.partition('=')
+    if stage not in STAGES:
+        raise argparse.ArgumentTypeError(f'unknown stage {stage!r} (choose from {", ".join(STAGES)})')
+    try:
+        return stage, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'bad limit {value!r}, expected STAGE=MS')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the build_voice_pack.py pipeline with a stub voice.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--sizes', default='86,1000,3000',
+                        help='Comma-separated pack sizes in prompts (default: 86,1000,3000)')
+    parser.add_argument('--prompts', default=DEFAULT_PROMPTS,
+                        help='Prompt map to draw texts from (default: examples/prompts/data_star_trek.json)')
+    parser.add_argument('--encoder', choices=sorted(build_voice_pack.ENCODERS), default='ffmpeg',
+                        help='MP3 encoding backend (default: ffmpeg)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per size; the fastest time per stage is kept (default: 1)')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Previous --json output to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown per stage vs the baseline, as a fraction (default: 0.25)')
+    parser.add_argument('--limit', type=parse_limit, action='append', default=[],
+                        metavar='STAGE=MS', help='Fail if STAGE exceeds MS milliseconds per prompt')
+    parser.add_argument('--min-ms', type=float, default=0.05,
+                        help='Ignore baseline changes in stages under this many ms/prompt (default: 0.05)')
+    args = parser.parse_args()
+
+    if args.encoder == 'lame' and build_voice_pack.lameenc is None:
+        sys.exit("lameenc not installed. Run: pip install lameenc")
+    try:
+        sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    except ValueError:
+        sys.exit(f"ERROR: bad --sizes: {args.sizes}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    voice = StubVoice()
+    base = load_base_prompts(args.prompts)
+    chime_data = build_voice_pack.ENCODERS[args.encoder](*build_voice_pack.synthesize_pcm(voice, 'Chime.'))
+
+    print(f'encoder={args.encoder}  sizes={sizes}  repeat={args.repeat}\n')
+    print(f'{"prompts":>8} ' + ' '.join(f'{s:>10}' for s in STAGES) + f' {"wall s":>8}   (ms/prompt)')
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench_build_') as work_dir:
+        for size in sizes:
+            prompts = make_prompts(base, size)
+            runs = [run_pack(prompts, voice, args.encoder, chime_data, work_dir)
+                    for _ in range(max(1, args.repeat))]
+            r = best_of(runs)
+            results.append(r)
+            print(f'{size:>8} ' + ' '.join(f'{r["stages"][s]["ms_per_prompt"]:>10.3f}' for s in STAGES)
+                  + f' {r["wall_seconds"]:>8.2f}')
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'encoder': args.encoder,
+            'repeat': args.repeat,
+            'prompt_source': build_voice_pack.file_sha256(args.prompts)[:16],
+        },
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote {args.json}')
+
+    if baseline and baseline.get('meta', {}).get('encoder') != args.encoder:
+        print(f"\nWARNING: baseline used encoder {baseline['meta'].get('encoder')!r}", file=sys.stderr)
+    failures = check_regressions(results, baseline, args.tolerance, dict(args.limit), args.min_ms)
+    if failures:
+        print(f'\nREGRESSION: {len(failures)} stage(s) over threshold:', file=sys.stderr)
+        for line in failures:
+            print(f'  {line}', file=sys.stderr)
+        sys.exit(1)
+    if baseline or args.limit:
+        print('\nAll stages within thresholds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+bench_dps_codec.py — Benchmark the DPS protobuf codec (dps_protobuf.py).
+
+Round-trip and malformed-input checks live in tests/test_dps_protobuf.py.
+
+Decodes a synthetic capture log of DPS 162 values, mostly repeated status
+reports with some install requests, with:
+
+  legacy         the previous decode_dps162_response() (one level, copies
+                 each field; requests need a second parse for the inner message)
+  fields         decode_dps162_response() on dps_protobuf.decode_fields()
+  schema         decode_dps() with dps162_message() picking the schema
+  batch          decode_dps_batch(), decoding each distinct value once
+
+plus build_dps162() against the previous encoder.
+
+Usage:
+    python3 tools/bench_dps_codec.py
+    python3 tools/bench_dps_codec.py --count 100000 --distinct 500 --json dps.json
+"""
+
+import argparse
+import base64
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dps_protobuf as pb  # noqa: E402
+from send_voice_pack import build_dps162, decode_dps162_response  # noqa: E402
+
+
+# ---------------------------------------------------------------------------
+# The functions dps_protobuf.py replaced, kept as the benchmark baseline
+# ---------------------------------------------------------------------------
+
+def _legacy_encode_varint(v: int) -> bytes:
+    out = []
+    while True:
+        b = v & 0x7F
+        v >>= 7
+        out.append(b | 0x80 if v else b)
+        if not v:
+            break
+    return bytes(out)
+
+
+def _legacy_field_varint(field_num: int, value: int) -> bytes:
+    return _legacy_encode_varint((field_num << 3) | 0) + _legacy_encode_varint(value)
+
+
+def _legacy_field_string(field_num: int, value: bytes | str) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    return _legacy_encode_varint((field_num << 3) | 2) + _legacy_encode_varint(len(value)) + value
+
+
+def legacy_build_dps162(set_id: int, url: str, md5: str, version: int, size: int) -> str:
+    inner  = _legacy_field_varint(1, set_id)
+    inner += _legacy_field_string(2, url)
+    inner += _legacy_field_string(3, md5)
+    inner += _legacy_field_varint(4, version)
+    inner += _legacy_field_varint(5, size)
+    outer  = _legacy_field_string(1, inner)
+    outer += _legacy_field_string(2, b'')
+    return base64.b64encode(_legacy_encode_varint(len(outer)) + outer).decode()
+
+
+def _legacy_read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        b = data[pos]; pos += 1
+        result |= (b & 0x7F) << shift
+        if not (b & 0x80):
+            break
+        shift += 7
+    return result, pos
+
+
+def _legacy_parse(inner: bytes) -> dict:
+    fields = {}
+    pos2 = 0
+    while pos2 < len(inner):
+        tag, pos2 = _legacy_read_varint(inner, pos2)
+        fn, wt = tag >> 3, tag & 7
+        if wt == 0:
+            v, pos2 = _legacy_read_varint(inner, pos2)
+            fields[fn] = v
+        elif wt == 2:
+            l, pos2 = _legacy_read_varint(inner, pos2)
+            fields[fn] = inner[pos2:pos2+l]
+            pos2 += l
+    return fields
+
+
+def legacy_decode_dps162_response(b64_value: str) -> dict:
+    data = base64.b64decode(b64_value)
+    length, pos = _legacy_read_varint(data, 0)
+    return _legacy_parse(data[pos:])
+
+
+def legacy_decode_full(b64_value: str) -> dict:
+    """What a caller had to do to read a request's fields with the old helpers."""
+    fields = legacy_decode_dps162_response(b64_value)
+    if isinstance(fields.get(1), bytes):
+        return _legacy_parse(fields[1])
+    return fields
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def capture_log(count: int, distinct: int, seed: int) -> list[str]:
+    """`count` DPS 162 values drawn from `distinct` different ones (90% status reports)."""
+    rng = random.Random(seed)
+    pool = []
+    for i in range(max(1, distinct)):
+        if i % 10 == 9:
+            pool.append(build_dps162(502, f'http://192.168.1.100/pack_{i}.zip',
+                                     '%032x' % rng.getrandbits(128), 16 + i, rng.randrange(1 << 20)))
+        else:
+            pool.append(pb.encode_dps(pb.DPS162_STATUS, {
+                'status': 2, 'installed_id': 502, 'installed_version': 16 + i % 50,
+                'target_id': 502, 'state': rng.choice((0, 1, 2, 3))}))
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def _time(fn, repeat: int) -> float:
+    best = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench(count: int, distinct: int, seed: int, repeat: int) -> dict:
+    values = capture_log(count, distinct, seed)
+    cases = {
+        'legacy': lambda: [legacy_decode_full(v) for v in values],
+        'fields': lambda: [decode_dps162_response(v) for v in values],
+        'schema': lambda: [pb.decode_dps(v, pb.dps162_message) for v in values],
+        'batch': lambda: pb.decode_dps_batch(values, pb.dps162_message),
+    }
+    args = [(502, f'http://192.168.1.100/pack_{i}.zip', 'ab' * 16, 16 + i, 250000 + i)
+            for i in range(min(count, 10000))]
+    encode_cases = {
+        'legacy_encode': lambda: [legacy_build_dps162(*a) for a in args],
+        'encode': lambda: [build_dps162(*a) for a in args],
+    }
+    results = {}
+    for name, fn in cases.items():
+        sec = _time(fn, repeat)
+        results[name] = {'seconds': round(sec, 5), 'us_per_value': round(1e6 * sec / count, 3)}
+    for name, fn in encode_cases.items():
+        sec = _time(fn, repeat)
+        results[name] = {'seconds': round(sec, 5), 'us_per_value': round(1e6 * sec / len(args), 3)}
+    base = results['legacy']['seconds']
+    for name in cases:
+        results[name]['speedup'] = round(base / results[name]['seconds'], 2)
+    results['encode']['speedup'] = round(results['legacy_encode']['seconds']
+                                         / results['encode']['seconds'], 2)
+    return {'count': count, 'distinct': len(set(values)), 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the DPS protobuf codec.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--count', type=int, default=20000,
+                        help='Values in the capture log (default: 20000)')
+    parser.add_argument('--distinct', type=int, default=200,
+                        help='Distinct values in the capture log (default: 200)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per benchmark case; the fastest is kept (default: 3)')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    report = {'meta': {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }}
+    report['bench'] = bench(args.count, args.distinct, args.seed, args.repeat)
+    b = report['bench']
+    print(f"Decode {b['count']} DPS 162 values ({b['distinct']} distinct):")
+    print(f"  {'case':<14} {'seconds':>9} {'us/value':>9} {'speedup':>8}")
+    for name, r in b['results'].items():
+        speedup = f"{r['speedup']:.2f}x" if 'speedup' in r else ''
+        print(f"  {name:<14} {r['seconds']:>9.4f} {r['us_per_value']:>9.2f} {speedup:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote {args.json}')
+
+
+if __name__ == '__main__':
+    main()
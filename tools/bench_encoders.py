@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+bench_encoders.py — Compare the MP3 encoding backends of build_voice_pack.py.
+
+Encodes synthetic Piper-like PCM (22.05kHz mono int16, a few seconds per
+prompt) with every available backend and reports wall time, per-prompt
+latency and output size. Synthesis is not included, so the numbers isolate
+the cost of the encode path (process spawn + WAV copy for ffmpeg, in-process
+LAME for lame).
+
+Usage:
+    python3 tools/bench_encoders.py
+    python3 tools/bench_encoders.py --prompts 200 --seconds 5
+"""
+
+import argparse
+import math
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import build_voice_pack  # noqa: E402
+
+
+def synthetic_pcm(seconds: float, sample_rate: int, seed: int) -> bytes:
+    """A voiced-sounding test tone: a few harmonics with a slow amplitude envelope."""
+    n = int(seconds * sample_rate)
+    f0 = 110 + 15 * (seed % 7)
+    samples = []
+    for i in range(n):
+        t = i / sample_rate
+        env = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+        v = sum(math.sin(2 * math.pi * f0 * h * t) / h for h in (1, 2, 3, 5))
+        samples.append(int(6000 * env * v))
+    return struct.pack(f'<{n}h', *samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark build_voice_pack.py MP3 encoders.')
+    parser.add_argument('--prompts', type=int, default=81,
+                        help='Number of prompts to encode per backend (default: 81)')
+    parser.add_argument('--seconds', type=float, default=4.0,
+                        help='Audio length per prompt in seconds (default: 4.0)')
+    parser.add_argument('--sample-rate', type=int, default=22050,
+                        help='Input sample rate, as produced by the Piper model (default: 22050)')
+    args = parser.parse_args()
+
+    # A handful of distinct clips, reused round-robin, keeps setup time down.
+    clips = [synthetic_pcm(args.seconds, args.sample_rate, seed) for seed in range(8)]
+
+    available = dict(build_voice_pack.ENCODERS)
+    if build_voice_pack.lameenc is None:
+        print('lame   : skipped (pip install lameenc)')
+        available.pop('lame')
+
+    print(f'{args.prompts} prompts x {args.seconds:.1f}s @ {args.sample_rate} Hz\n')
+    print(f'{"backend":<8} {"total s":>9} {"ms/prompt":>10} {"x realtime":>11} {"bytes/prompt":>13}')
+    for name, encode in sorted(available.items()):
+        encode(clips[0], args.sample_rate)  # warm up (page cache, lazy imports)
+        total_bytes = 0
+        start = time.perf_counter()
+        for i in range(args.prompts):
+            total_bytes += len(encode(clips[i % len(clips)], args.sample_rate))
+        elapsed = time.perf_counter() - start
+        audio_seconds = args.prompts * args.seconds
+        print(f'{name:<8} {elapsed:>9.2f} {1000 * elapsed / args.prompts:>10.1f} '
+              f'{audio_seconds / elapsed:>11.0f} {total_bytes // args.prompts:>13}')
+
+
+if __name__ == '__main__':
+    main()
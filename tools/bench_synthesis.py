@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+bench_synthesis.py — Piper inference throughput under different ONNX Runtime settings.
+
+Synthesizes the speech prompts of a prompt map (by default the 81 in
+data_star_trek.json) with a real voice model once per configuration and
+reports wall time, real-time factor and prompts per second. Only inference
+and PCM assembly are timed; model loading, encoding and the ZIP are not
+(see bench_build.py for those).
+
+The first row is always Piper's own defaults (PiperVoice.load(), one
+prompt per call), and the speedup column is relative to it. The other rows
+are every combination of --threads, --opt-levels and --batches:
+
+  threads   --ort-intra-threads (0 = onnxruntime's default, one per core)
+  opt       --ort-opt-level
+  batch     --batch: sentences per inference call (1 = Piper's own path)
+
+Each configuration synthesizes one prompt as a warm-up before timing, and
+with --repeat the fastest run is kept. Outputs of every configuration are
+compared with the defaults row; batched inference should match it sample
+for sample, and a mismatch is flagged.
+
+Usage:
+    python3 tools/bench_synthesis.py --voice-model en_US-lessac-medium.onnx
+    python3 tools/bench_synthesis.py --voice-model voice.onnx \\
+        --threads 1,2,4 --batches 1,4,8 --opt-levels all,extended --json synth.json
+
+Requirements:
+    pip install piper-tts onnx numpy
+"""
+
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import build_voice_pack  # noqa: E402
+from build_voice_pack import ORT_OPT_LEVELS  # noqa: E402
+
+DEFAULT_PROMPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'examples', 'prompts', 'data_star_trek.json')
+
+
+def load_speech_prompts(path: str) -> list[str]:
+    with open(path) as f:
+        prompts = json.load(f)
+    return [text for code, text in sorted(prompts.items())
+            if not code.startswith('_comment') and text != '[CHIME]']
+
+
+def int_list(value: str) -> list[int]:
+    try:
+        return [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected comma-separated integers, got {value!r}')
+
+
+def run_config(model: str, texts: list[str], threads: int, opt: str | None, batch: int,
+               repeat: int) -> dict:
+    session = {k: v for k, v in (('intra_threads', threads), ('opt_level', opt)) if v} or None
+    t0 = time.perf_counter()
+    voice = build_voice_pack.load_voice(model, session, alignments=batch > 1)
+    load_seconds = time.perf_counter() - t0
+    rate = voice.config.sample_rate
+
+    def synthesize(items):
+        if batch > 1:
+            return build_voice_pack.synthesize_pcm_batch(voice, items, batch)
+        return [build_voice_pack.synthesize_pcm(voice, text)[0] for text in items]
+
+    synthesize(texts[:1])  # warm-up: first-run allocations and kernel selection
+    best, pcm = None, None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        pcm = synthesize(texts)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    audio_seconds = sum(len(p) for p in pcm) / 2 / rate
+    return {
+        'threads': threads,
+        'opt_level': opt or 'all',
+        'batch': batch,
+        'load_seconds': round(load_seconds, 3),
+        'wall_seconds': round(best, 3),
+        'audio_seconds': round(audio_seconds, 2),
+        'rtf': round(best / audio_seconds, 4) if audio_seconds else None,
+        'prompts_per_second': round(len(texts) / best, 2),
+        'output_md5': hashlib.md5(b''.join(pcm)).hexdigest(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Piper inference throughput across ONNX Runtime settings.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--voice-model', required=True, help='Path to the Piper .onnx model')
+    parser.add_argument('--prompts', default=DEFAULT_PROMPTS,
+                        help='Prompt map to synthesize (default: examples/prompts/data_star_trek.json)')
+    parser.add_argument('--threads', type=int_list, default=[0, 1, 2, 4],
+                        help='Intra-op thread counts to try, 0 = default (default: 0,1,2,4)')
+    parser.add_argument('--opt-levels', default='all',
+                        help=f'Comma-separated graph optimization levels from '
+                             f'{",".join(ORT_OPT_LEVELS)} (default: all)')
+    parser.add_argument('--batches', type=int_list, default=[1, 4, 8],
+                        help='Sentences per inference call to try (default: 1,4,8)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per configuration; the fastest is kept (default: 1)')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    if build_voice_pack.np is None:
+        sys.exit("numpy not installed. Run: pip install numpy")
+    build_voice_pack.import_piper()
+    if max(args.batches) > 1:
+        try:
+            import onnx  # noqa: F401
+        except ImportError:
+            sys.exit("onnx not installed (needed for --batches above 1). Run: pip install onnx")
+    opt_levels = [o.strip() for o in args.opt_levels.split(',') if o.strip()]
+    for o in opt_levels:
+        if o not in ORT_OPT_LEVELS:
+            sys.exit(f"ERROR: unknown optimization level {o!r} (choose from {', '.join(ORT_OPT_LEVELS)})")
+    if not os.path.exists(args.voice_model):
+        sys.exit(f"ERROR: voice model not found: {args.voice_model}")
+
+    texts = load_speech_prompts(args.prompts)
+    configs = [(0, None, 1)] + [
+        (threads, None if opt == 'all' else opt, batch)
+        for threads, opt, batch in itertools.product(args.threads, opt_levels, args.batches)
+        if (threads, opt, batch) != (0, 'all', 1)
+    ]
+    print(f'{len(texts)} speech prompts, {len(configs)} configurations, cpu_count={os.cpu_count()}\n')
+    print(f'{"threads":>7} {"opt":>8} {"batch":>5} {"wall s":>8} {"RTF":>7} '
+          f'{"prompts/s":>9} {"speedup":>8}')
+    results = []
+    for threads, opt, batch in configs:
+        r = run_config(args.voice_model, texts, threads, opt, batch, args.repeat)
+        base = results[0] if results else r
+        r['speedup'] = round(base['wall_seconds'] / r['wall_seconds'], 2)
+        r['matches_default'] = r['output_md5'] == base['output_md5']
+        results.append(r)
+        print(f'{threads or "default":>7} {r["opt_level"]:>8} {batch:>5} {r["wall_seconds"]:>8.2f} '
+              f'{r["rtf"]:>7.3f} {r["prompts_per_second"]:>9.1f} {r["speedup"]:>7.2f}x'
+              + ('' if r['matches_default'] else '  (output differs)'))
+
+    if args.json:
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'model': os.path.basename(args.voice_model),
+                'model_sha256': build_voice_pack.file_sha256(args.voice_model)[:16],
+                'prompts': len(texts),
+                'repeat': args.repeat,
+            },
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote {args.json}')
+
+
+if __name__ == '__main__':
+    main()
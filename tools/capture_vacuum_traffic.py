@@ -20,14 +20,74 @@ Requires: scapy, tshark
 Usage: sudo python3 tools/capture_vacuum_traffic.py
 Then change voice language in the Eufy app to trigger a download.
 Ctrl+C to stop and analyze.
+
+For long (e.g. overnight) sessions, --ring keeps disk use bounded:
+    sudo python3 tools/capture_vacuum_traffic.py --ring --ring-mb 500 --duration 43200
+
+  - tshark writes a ring buffer of --ring-files segments in /tmp/vacuum_ring,
+    rotating every --ring-mb / --ring-files MB or --segment-seconds,
+    whichever comes first, and deleting the oldest segment
+  - the capture filter keeps only Tuya (6668), HTTP, DNS and the start of
+    TLS connections (SYN/FIN/RST and handshake records), not bulk TLS data
+  - each segment is analyzed as soon as tshark closes it, and new DNS
+    names, connections, HTTP requests, SNIs and HTTP objects are printed
+    then; Ctrl+C (or the end of --duration) prints the whole report
+
+To re-analyze a saved capture without the ARP setup:
+    python3 tools/pcap_analyzer.py /tmp/vacuum_capture.pcapng --host 10.0.0.253
 """
 
-import sys, os, time, threading, signal, subprocess
+import sys, os, re, time, threading, signal, subprocess, argparse, itertools
+
+import pcap_analyzer
 
 VACUUM_IP  = "10.0.0.253"
 GATEWAY_IP = "10.0.0.1"
 IFACE      = "eno1"
 PCAP_FILE  = "/tmp/vacuum_capture.pcapng"
+RING_DIR   = "/tmp/vacuum_ring"
+HTTP_DIR   = "/tmp/vacuum_http_objects"
+
+parser = argparse.ArgumentParser(
+    description="ARP spoof the vacuum and capture its traffic (devices you own only).",
+    formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+parser.add_argument("--ring", action="store_true",
+                    help=f"Ring buffer capture in {RING_DIR} with a tight filter and "
+                         f"per-segment analysis")
+parser.add_argument("--ring-mb", type=int, default=1024,
+                    help="--ring: total size of the ring buffer in MB (default: 1024)")
+parser.add_argument("--ring-files", type=int, default=20,
+                    help="--ring: number of segments in the ring (default: 20)")
+parser.add_argument("--segment-seconds", type=int, default=300,
+                    help="--ring: start a new segment at least this often, so analysis "
+                         "never lags by more (default: 300)")
+parser.add_argument("--snaplen", type=int, default=65535,
+                    help="--ring: bytes kept per packet (default: 65535, whole packets "
+                         "including GRO-merged ones)")
+parser.add_argument("--http-ports", default="80",
+                    help="--ring: comma-separated HTTP ports to capture (default: 80, the "
+                         "only port the vacuum downloads from)")
+parser.add_argument("--duration", type=int, default=0,
+                    help="Stop after this many seconds and analyze (default: 0, run until "
+                         "Ctrl+C)")
+args = parser.parse_args()
+if args.ring_files < 2:
+    parser.error("--ring-files must be at least 2")
+
+
+def ring_filter(host, http_ports):
+    """
+    BPF capture filter for --ring: Tuya local protocol, HTTP and DNS in
+    full; for TLS (443, and 8883 for MQTT) only the packets pcap_analyzer
+    reads (SYN/FIN/RST and segments that start a handshake record, such as
+    the ClientHello carrying the SNI).
+    """
+    http = " or ".join(f"tcp port {p}" for p in http_ports)
+    return (f"host {host} and (tcp port 6668 or port 53 or {http}"
+            f" or ((tcp port 443 or tcp port 8883)"
+            f" and (tcp[tcpflags] & (tcp-syn|tcp-fin|tcp-rst) != 0"
+            f" or tcp[((tcp[12] & 0xf0) >> 2)] = 0x16)))")
+
 
 print("[*] Resolving MACs...")
 from scapy.all import srp, Ether, ARP, get_if_hwaddr, sendp
@@ -78,13 +138,29 @@ def restore_arp():
         time.sleep(0.3)
 
 # ── tshark ──────────────────────────────────────────────────────────────────
-if os.path.exists(PCAP_FILE):
-    os.remove(PCAP_FILE)
+if args.ring:
+    os.makedirs(RING_DIR, exist_ok=True)
+    for name in os.listdir(RING_DIR):
+        if name.endswith(".pcapng"):
+            os.remove(os.path.join(RING_DIR, name))
+    http_ports = [int(p) for p in args.http_ports.split(",") if p.strip()]
+    capture_filter = ring_filter(VACUUM_IP, http_ports)
+    segment_kb = max(1, args.ring_mb * 1024 // args.ring_files)
+    tshark_cmd = ["tshark", "-i", IFACE, "-f", capture_filter, "-s", str(args.snaplen),
+                  "-w", os.path.join(RING_DIR, "capture.pcapng"),
+                  "-b", f"files:{args.ring_files}", "-b", f"filesize:{segment_kb}",
+                  "-b", f"duration:{args.segment_seconds}", "-q"]
+    print(f"[*] Ring buffer: {args.ring_files} x {segment_kb:,} KB in {RING_DIR}, "
+          f"new segment at least every {args.segment_seconds}s")
+    print(f"    Filter: {capture_filter}")
+else:
+    if os.path.exists(PCAP_FILE):
+        os.remove(PCAP_FILE)
+    tshark_cmd = ["tshark", "-i", IFACE, "-f", f"host {VACUUM_IP}", "-w", PCAP_FILE, "-q"]
+if args.duration:
+    tshark_cmd[-1:-1] = ["-a", f"duration:{args.duration}"]
 
-tshark_proc = subprocess.Popen(
-    ["tshark", "-i", IFACE, "-f", f"host {VACUUM_IP}", "-w", PCAP_FILE, "-q"],
-    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
-)
+tshark_proc = subprocess.Popen(tshark_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
 time.sleep(1.5)
 if tshark_proc.poll() is not None:
     err = tshark_proc.stderr.read().decode(errors='replace')
@@ -97,80 +173,93 @@ def analyze_capture():
     print(f"\n{'='*60}\nANALYSIS\n{'='*60}")
     if not os.path.exists(PCAP_FILE):
         print("[!] No pcap file"); return
-    size = os.path.getsize(PCAP_FILE)
-    print(f"pcap: {size:,} bytes")
-    if size < 200:
+    if os.path.getsize(PCAP_FILE) < 200:
         print("[!] pcap is empty - tshark didn't capture anything"); return
 
-    def tshark(args):
-        r = subprocess.run(["tshark", "-r", PCAP_FILE] + args,
-                           capture_output=True, text=True)
-        return r.stdout.strip()
-
-    print("\n[DNS from vacuum]")
-    out = tshark(["-Y", f"ip.src=={VACUUM_IP} && dns.flags.response==0",
-                  "-T", "fields", "-e", "dns.qry.name"])
-    seen = set()
-    for q in out.split('\n'):
-        if q.strip() and q.strip() not in seen:
-            seen.add(q.strip()); print(f"  {q.strip()}")
-    if not seen: print("  (none - DNS bypassing us)")
-
-    print("\n[TCP connections from vacuum]")
-    out = tshark(["-Y", f"ip.src=={VACUUM_IP} && tcp.flags.syn==1 && tcp.flags.ack==0",
-                  "-T", "fields", "-e", "ip.dst", "-e", "tcp.dstport"])
-    conns = set()
-    for line in out.split('\n'):
-        p = line.split('\t')
-        if len(p) >= 2 and p[0]:
-            k = f"{p[0]}:{p[1]}"
-            if k not in conns:
-                conns.add(k)
-                proto = "HTTPS" if p[1] == "443" else ("HTTP" if p[1] == "80" else f"port {p[1]}")
-                print(f"  {p[0]}:{p[1]} ({proto})")
-    if not conns: print("  (none - ICMP redirect still blocking?)")
-
-    print("\n[HTTP requests from vacuum]")
-    out = tshark(["-Y", f"ip.src=={VACUUM_IP} && http.request",
-                  "-T", "fields", "-e", "http.request.method",
-                  "-e", "http.host", "-e", "http.request.uri"])
-    if out:
-        for line in out.split('\n'):
-            p = line.split('\t')
-            if len(p) >= 3: print(f"  {p[0]} http://{p[1]}{p[2]}")
-    else:
-        print("  (none on port 80)")
-
-    print("\n[HTTPS connections (TLS SNI)]")
-    out = tshark(["-Y", f"ip.src=={VACUUM_IP} && tls.handshake.type==1",
-                  "-T", "fields", "-e", "ip.dst", "-e", "tcp.dstport",
-                  "-e", "tls.handshake.extensions_server_name"])
-    seen = set()
-    for line in out.split('\n'):
-        p = line.split('\t')
-        if len(p) >= 3 and p[2]:
-            k = f"{p[2]}:{p[1]}"
-            if k not in seen:
-                seen.add(k); print(f"  https://{p[2]}:{p[1]}  ({p[0]})")
-    if not seen: print("  (none)")
-
-    # HTTP object export
-    http_dir = "/tmp/vacuum_http_objects"
-    os.makedirs(http_dir, exist_ok=True)
-    subprocess.run(["tshark", "-r", PCAP_FILE,
-                    "--export-objects", f"http,{http_dir}"], capture_output=True)
-    files = [f for f in os.listdir(http_dir)]
-    if files:
-        print(f"\n[HTTP objects -> {http_dir}/]")
-        for f in files:
-            fp = os.path.join(http_dir, f)
-            print(f"  {f}  ({os.path.getsize(fp):,} bytes)")
-            r = subprocess.run(["file", fp], capture_output=True, text=True)
-            print(f"    -> {r.stdout.split(':', 1)[1].strip()}")
+    # Single streaming pass over the capture; see pcap_analyzer.py
+    try:
+        report = pcap_analyzer.analyze(PCAP_FILE, host=VACUUM_IP, export_dir=HTTP_DIR)
+    except pcap_analyzer.CaptureFormatError as e:
+        print(f"[!] {e}"); return
+    pcap_analyzer.print_report(report)
 
     os.system(f"chmod 644 {PCAP_FILE}")
     print(f"\n[*] Full pcap: {PCAP_FILE}")
 
+# ── ring buffer analysis ─────────────────────────────────────────────────────
+# tshark names segments capture_<5-digit sequence>_<YYYYmmddHHMMSS>.pcapng
+SEGMENT_RE = re.compile(r"^capture_(\d+)_\d{14}\.pcapng$")
+
+ring_analyzer = None
+ring_next = 1       # sequence number of the next segment to analyze
+ring_seen = {}      # report section -> entries already printed
+
+def ring_segments():
+    """(sequence number, name) of the segments currently on disk, oldest first."""
+    return sorted((int(m.group(1)), n) for n in os.listdir(RING_DIR)
+                  if (m := SEGMENT_RE.match(n)))
+
+def print_new_findings(report):
+    """Print what the last segment added to the report."""
+    sections = (
+        ("dns", lambda k, v: f"DNS   {k[0]} ({k[1]})"),
+        ("connections", lambda k, v: f"TCP   {k[0]}:{k[1]}"),
+        ("http", lambda k, v: f"HTTP  {k[0]} http://{k[1]}{k[2]}"),
+        ("tls", lambda k, v: f"TLS   https://{k[0]}:{k[1]}  ({v})"),
+    )
+    for name, fmt in sections:
+        entries = getattr(report, name)
+        for k, v in itertools.islice(entries.items(), ring_seen.get(name, 0), None):
+            print(f"    {fmt(k, v)}")
+        ring_seen[name] = len(entries)
+    for o in report.objects[ring_seen.get("objects", 0):]:
+        note = "" if o.complete else "  INCOMPLETE"
+        print(f"    FILE  {o.name} ({o.size:,} bytes, md5 {o.md5}) -> {o.kind}{note}")
+    ring_seen["objects"] = len(report.objects)
+
+def analyze_segments(final=False):
+    """Analyze every closed segment not yet analyzed (all of them once tshark has stopped)."""
+    global ring_analyzer, ring_next
+    segments = ring_segments()
+    if not final:
+        segments = segments[:-1]  # the newest segment is still being written
+    for seq, name in segments:
+        if seq < ring_next:
+            continue
+        if seq > ring_next:
+            print(f"[!] {seq - ring_next} segment(s) rotated out before they were analyzed; "
+                  f"raise --ring-files or --ring-mb")
+        ring_next = seq + 1
+        path = os.path.join(RING_DIR, name)
+        if ring_analyzer is None:
+            os.makedirs(HTTP_DIR, exist_ok=True)
+            ring_analyzer = pcap_analyzer.CaptureAnalyzer(path, VACUUM_IP, HTTP_DIR)
+        report = ring_analyzer.report
+        packets, elapsed = report.stats.packets, report.elapsed
+        try:
+            ring_analyzer.feed(path)
+        except FileNotFoundError:
+            print(f"[!] {name} rotated out before it was analyzed; "
+                  f"raise --ring-files or --ring-mb")
+            continue
+        except pcap_analyzer.CaptureFormatError as e:
+            print(f"[!] {name}: {e}")
+            continue
+        print(f"[.] {time.strftime('%H:%M:%S')}  {name}: "
+              f"{report.stats.packets - packets:,} packets, "
+              f"analyzed in {report.elapsed - elapsed:.2f}s", flush=True)
+        print_new_findings(report)
+
+def analyze_ring():
+    print(f"\n{'='*60}\nANALYSIS\n{'='*60}")
+    analyze_segments(final=True)
+    if ring_analyzer is None:
+        print("[!] No segments - tshark didn't capture anything"); return
+    pcap_analyzer.print_report(ring_analyzer.finish())
+    print(f"\n[*] Last {args.ring_files} segments: {RING_DIR}")
+    print(f"    Re-analyze: python3 tools/pcap_analyzer.py {RING_DIR}/capture_*.pcapng "
+          f"--host {VACUUM_IP}")
+
 def signal_handler(sig, frame):
     stop_event.set()
     print("\n[*] Stopping...")
@@ -178,7 +267,10 @@ def signal_handler(sig, frame):
     time.sleep(1.5)
     os.system("iptables -D FORWARD -p icmp --icmp-type redirect -j DROP 2>/dev/null")
     restore_arp()
-    analyze_capture()
+    if args.ring:
+        analyze_ring()
+    else:
+        analyze_capture()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
@@ -196,7 +288,13 @@ print("=" * 60 + "\n")
 try:
     while True:
         time.sleep(5)
-        sz = os.path.getsize(PCAP_FILE) if os.path.exists(PCAP_FILE) else 0
-        print(f"[.] {time.strftime('%H:%M:%S')}  pcap={sz:,}b", flush=True)
+        if args.ring:
+            analyze_segments()
+        else:
+            sz = os.path.getsize(PCAP_FILE) if os.path.exists(PCAP_FILE) else 0
+            print(f"[.] {time.strftime('%H:%M:%S')}  pcap={sz:,}b", flush=True)
+        if tshark_proc.poll() is not None:
+            print(f"\n[*] tshark exited (code {tshark_proc.returncode})")
+            signal_handler(None, None)
 except KeyboardInterrupt:
     signal_handler(None, None)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+decode_tuya_capture.py — Decrypt and decode Tuya v3.3 DPS traffic from a capture.
+
+Reassembles the local-protocol TCP streams (port 6668) in a pcap/pcapng,
+decrypts each 55AA frame with the device's local key, and prints a
+timestamped DPS event log. DPS 162 values are decoded with
+dps_protobuf.py into the voice pack request/status fields from
+docs/dps162_protocol.md.
+
+The capture is read as a stream (see pcap_analyzer.py), so multi-gigabyte
+files work in bounded memory. One AES cipher is built per local key and
+reused; each device remembers the key that last decrypted its traffic, so
+with several candidate keys only the first frame of a device pays for the
+trial decryptions.
+
+Usage:
+    python3 tools/decode_tuya_capture.py /tmp/vacuum_capture.pcapng --local-key YOUR_LOCAL_KEY
+
+    # Many devices: keys come from a send_voice_pack.py inventory
+    python3 tools/decode_tuya_capture.py capture.pcap --inventory fleet.csv --jsonl events.jsonl
+
+    # Only voice pack traffic
+    python3 tools/decode_tuya_capture.py capture.pcap --local-key KEY --dps 162
+"""
+
+import argparse
+import base64
+import functools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import dps_protobuf  # noqa: E402
+from send_voice_pack import load_inventory  # noqa: E402
+import pcap_analyzer as pa  # noqa: E402
+import tuya_local as tl  # noqa: E402
+
+
+CMD_NAMES = {
+    tl.CMD_CONTROL: 'CONTROL',
+    tl.CMD_STATUS: 'STATUS',
+    tl.CMD_HEART_BEAT: 'HEART_BEAT',
+    tl.CMD_DP_QUERY: 'DP_QUERY',
+    tl.CMD_CONTROL_NEW: 'CONTROL_NEW',
+    tl.CMD_DP_QUERY_NEW: 'DP_QUERY_NEW',
+    tl.CMD_UPDATEDPS: 'UPDATEDPS',
+}
+
+DPS162_STATES = {2: 'installed', 3: 'failed'}
+
+
+def _raw_field(wt: int, value):
+    """JSON-friendly form of a field the schema does not know."""
+    if isinstance(value, int):
+        return value
+    data = bytes(value) if wt == dps_protobuf.LEN else dps_protobuf.encode_fields(value)
+    return base64.b64encode(data).decode()
+
+
+@functools.lru_cache(maxsize=4096)  # devices report the same status over and over
+def decode_dps162(value: str) -> dict:
+    """
+    Name the fields of a DPS 162 value (the result is shared between calls).
+
+    App->device values wrap the request in field 1 (see build_dps162());
+    device->app values are the flat status message.
+    """
+    kind = dps_protobuf.dps162_kind(value)
+    if kind == 'request':
+        outer = dps_protobuf.decode_dps(value, dps_protobuf.DPS162_REQUEST)
+        fields = dict(outer.get('voice_info', {}))
+        fields['_unknown'] = fields.get('_unknown', []) + outer.get('_unknown', [])
+    else:
+        fields = dps_protobuf.decode_dps(value, dps_protobuf.DPS162_STATUS)
+    out = {'kind': kind}
+    for name, v in fields.items():
+        if name == '_unknown':
+            out.update((f'field{number}', _raw_field(wt, raw)) for number, wt, raw in v)
+        else:
+            out[name] = v
+    return out
+
+
+def format_dps162(d: dict) -> str:
+    if d['kind'] == 'request':
+        return (f"install set_id={d.get('set_id')} version={d.get('version')} "
+                f"size={d.get('size')} md5={d.get('md5')} url={d.get('url')}")
+    state = d.get('state')
+    return (f"status installed={d.get('installed_id')} v{d.get('installed_version')} "
+            f"target={d.get('target_id')} state={state} ({DPS162_STATES.get(state, 'in progress')})")
+
+
+# ---------------------------------------------------------------------------
+# Keys
+# ---------------------------------------------------------------------------
+
+def device_label(ip: str, port: int, default_port: int = 6668) -> str:
+    return ip if port == default_port else f'{ip}:{port}'
+
+
+class KeyRing:
+    """
+    Local keys and the device each one belongs to.
+
+    Ciphers are created once per key. Devices named in an inventory use
+    their own key; others try every key on their first frame and keep the
+    one that worked.
+    """
+
+    def __init__(self, local_keys: list[str], devices: list[dict], default_port: int = 6668):
+        self._ciphers = {}
+        self._by_device = {}
+        for key in local_keys:
+            self._cipher(key)
+        for dev in devices:
+            label = device_label(dev['ip'], dev['port'] or default_port, default_port)
+            self._by_device[label] = self._cipher(dev['local_key'])
+
+    def _cipher(self, key: str) -> tl.TuyaCipher:
+        if key not in self._ciphers:
+            self._ciphers[key] = tl.TuyaCipher(key)
+        return self._ciphers[key]
+
+    def decrypt(self, device: str, payload: bytes) -> bytes:
+        cipher = self._by_device.get(device)
+        if cipher is not None:
+            try:
+                return cipher.decode_payload(payload)
+            except ValueError:
+                pass
+        for candidate in self._ciphers.values():
+            if candidate is cipher:
+                continue
+            try:
+                raw = candidate.decode_payload(payload)
+            except ValueError:
+                continue
+            self._by_device[device] = candidate
+            return raw
+        raise ValueError('no local key decrypts this frame')
+
+
+# ---------------------------------------------------------------------------
+# Stream decoding
+# ---------------------------------------------------------------------------
+
+class DecodeStats:
+    def __init__(self):
+        self.frames = 0
+        self.heartbeats = 0
+        self.bad_crc = 0
+        self.undecryptable = 0
+        self.events = 0
+
+
+class TuyaStream(pa.StreamConsumer):
+    """One direction of a device connection, fed by pcap_analyzer.TcpReassembler."""
+
+    def __init__(self, decoder: 'TuyaDecoder', device: str, from_device: bool):
+        self.decoder = decoder
+        self.device = device
+        self.from_device = from_device
+        self.reader = tl.FrameReader(has_retcode=from_device)
+
+    def data(self, ts: float, data: bytes) -> bool:
+        for frame in self.reader.feed(data):
+            self.decoder.frame(ts, self.device, self.from_device, frame)
+        return True
+
+
+class TuyaDecoder:
+    def __init__(self, keys: KeyRing, ports: set[tuple[str | None, int]], emit,
+                 dps_filter: set[str] | None = None, default_port: int = 6668):
+        self.keys = keys
+        self.ports = ports
+        self.default_port = default_port
+        self.emit = emit
+        self.dps_filter = dps_filter
+        self.stats = DecodeStats()
+        self.capture = pa.CaptureStats()
+        self.tcp = pa.TcpReassembler(self._new_stream, self.capture)
+
+    def _is_device(self, ip: str, port: int) -> bool:
+        return (ip, port) in self.ports or (None, port) in self.ports
+
+    def _new_stream(self, key: pa.StreamKey, syn: bool) -> pa.StreamConsumer | None:
+        src, sport, dst, dport = key
+        if self._is_device(dst, dport):
+            return TuyaStream(self, device_label(dst, dport, self.default_port), from_device=False)
+        if self._is_device(src, sport):
+            return TuyaStream(self, device_label(src, sport, self.default_port), from_device=True)
+        return None
+
+    def run(self, path: str):
+        last_ts = 0.0
+        for ts, ip in pa.iter_ip(path, self.capture):
+            last_ts = ts
+            if ip.proto != pa.IPPROTO_TCP:
+                continue
+            tcp = pa.parse_tcp(ip.payload)
+            if tcp is None:
+                continue
+            if self._is_device(ip.dst, tcp.dport) or self._is_device(ip.src, tcp.sport):
+                self.tcp.segment(ts, ip.src, ip.dst, tcp)
+        self.tcp.finish(last_ts)
+
+    def frame(self, ts: float, device: str, from_device: bool, frame: tl.Frame):
+        s = self.stats
+        s.frames += 1
+        if not frame.crc_ok:
+            s.bad_crc += 1
+            return
+        if frame.cmd == tl.CMD_HEART_BEAT or not frame.payload:
+            s.heartbeats += frame.cmd == tl.CMD_HEART_BEAT
+            return
+        try:
+            msg = json.loads(self.keys.decrypt(device, frame.payload))
+        except (ValueError, UnicodeDecodeError):
+            s.undecryptable += 1
+            return
+        dps = msg.get('dps') if isinstance(msg, dict) else None
+        if not dps:
+            return
+        if self.dps_filter and not self.dps_filter.intersection(dps):
+            return
+
+        event = {
+            'time': round(ts, 6),
+            'device': device,
+            'direction': 'from_device' if from_device else 'to_device',
+            'cmd': CMD_NAMES.get(frame.cmd, hex(frame.cmd)),
+            'seq': frame.seqno,
+            'dps': dps,
+        }
+        if frame.retcode:
+            event['retcode'] = frame.retcode
+        if isinstance(dps.get('162'), str):
+            try:
+                event['dps162'] = decode_dps162(dps['162'])
+            except ValueError:  # dps_protobuf.DecodeError
+                event['dps162'] = {'kind': 'undecodable'}
+        s.events += 1
+        self.emit(event)
+
+
+def format_event(event: dict) -> str:
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['time']))
+    stamp += f".{int(event['time'] % 1 * 1000):03d}"
+    arrow = '->' if event['direction'] == 'from_device' else '<-'
+    head = f"{stamp}  {event['device']} {arrow} {event['cmd']:<11} seq={event['seq']:<5}"
+    parts = []
+    for dp, value in event['dps'].items():
+        if dp == '162' and 'dps162' in event and event['dps162']['kind'] != 'undecodable':
+            parts.append(f"162: {format_dps162(event['dps162'])}")
+        else:
+            parts.append(f"{dp}={json.dumps(value)}")
+    return head + '  ' + '  '.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Decrypt Tuya v3.3 DPS traffic from a pcap/pcapng capture.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('pcap', help='Capture file (pcap or pcapng)')
+    parser.add_argument('--local-key', action='append', default=[],
+                        help='Device local key (repeat for several devices)')
+    parser.add_argument('--inventory', help='send_voice_pack.py inventory (CSV/JSON) with per-device keys')
+    parser.add_argument('--port', default=6668, type=int, help='Tuya local port (default: 6668)')
+    parser.add_argument('--dps', action='append', default=[],
+                        help='Only show events touching this DPS (repeatable)')
+    parser.add_argument('--jsonl', help='Write events as JSON lines to this file ("-" for stdout)')
+    args = parser.parse_args()
+
+    devices = []
+    if args.inventory:
+        try:
+            devices = load_inventory(args.inventory)
+        except (OSError, ValueError) as e:
+            sys.exit(f"ERROR: {e}")
+    if not args.local_key and not devices:
+        parser.error('--local-key or --inventory is required')
+    try:
+        keys = KeyRing(args.local_key, devices, args.port)
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+
+    ports = {(None, args.port)}
+    ports.update((d['ip'], d['port']) for d in devices if d['port'])
+
+    out = None
+    if args.jsonl == '-':
+        emit = lambda e: print(json.dumps(e))  # noqa: E731
+    elif args.jsonl:
+        out = open(args.jsonl, 'w')
+        emit = lambda e: out.write(json.dumps(e) + '\n')  # noqa: E731
+    else:
+        emit = lambda e: print(format_event(e))  # noqa: E731
+
+    decoder = TuyaDecoder(keys, ports, emit, set(args.dps) or None, args.port)
+    t0 = time.perf_counter()
+    try:
+        decoder.run(args.pcap)
+    except (OSError, pa.CaptureFormatError) as e:
+        sys.exit(f"ERROR: {e}")
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - t0
+
+    s, c = decoder.stats, decoder.capture
+    mb = c.bytes / 1e6
+    print(f"\n{c.packets:,} packets ({mb:,.1f} MB) in {elapsed:.1f}s "
+          f"({mb / elapsed if elapsed else 0:.1f} MB/s): {s.frames} frames, {s.events} DPS events, "
+          f"{s.heartbeats} heartbeats, {s.undecryptable} undecryptable, {s.bad_crc} bad CRC, "
+          f"{c.tcp_gaps} TCP gaps", file=sys.stderr)
+    if s.undecryptable and not s.events:
+        print("No frame decrypted - check the local key.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1033 @@
+#!/usr/bin/env python3
+"""
+pcap_analyzer.py — Single-pass offline analysis of a vacuum traffic capture.
+
+Reads a pcap or pcapng file once, as a stream, and extracts:
+
+  - DNS queries
+  - TCP connections (SYNs)
+  - HTTP requests, plus request/response bodies exported to a directory
+  - TLS SNI from ClientHellos
+
+Memory stays bounded however large the capture is: packets are never held
+after they are parsed, TCP reassembly keeps a capped out-of-order buffer per
+stream and a capped number of live streams, streams that are neither HTTP
+nor TLS are dropped after their first bytes, and HTTP bodies are written
+straight to disk.
+
+capture_vacuum_traffic.py uses this for its Ctrl+C analysis, and in --ring
+mode to analyze each ring buffer segment as soon as tshark closes it. It
+also runs standalone on an existing capture, without any ARP setup:
+
+Usage:
+    python3 tools/pcap_analyzer.py /tmp/vacuum_capture.pcapng --host 10.0.0.253
+    python3 tools/pcap_analyzer.py capture.pcap --export-dir /tmp/objects --json
+    python3 tools/pcap_analyzer.py /tmp/vacuum_ring/capture_*.pcapng --host 10.0.0.253
+
+Supports Ethernet (with VLAN tags), Linux cooked (SLL/SLL2), raw IP and BSD
+loopback link types, IPv4 and IPv6. IPv4 fragments are counted and skipped.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+import re
+import socket
+import struct
+import sys
+import time
+import urllib.parse
+from typing import Callable, Iterator, NamedTuple
+
+
+# ---------------------------------------------------------------------------
+# pcap / pcapng reader
+# ---------------------------------------------------------------------------
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+_PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_SHB = b'\x0a\x0d\x0d\x0a'
+
+# A single pcapng block larger than this is treated as corruption rather
+# than read into memory.
+MAX_BLOCK_SIZE = 64 << 20
+
+
+class CaptureFormatError(ValueError):
+    pass
+
+
+def iter_packets(path: str) -> Iterator[tuple[float, int, bytes]]:
+    """Yield (timestamp, linktype, frame bytes) for every packet in a pcap/pcapng file."""
+    with open(path, 'rb', buffering=1 << 20) as f:
+        magic = f.read(4)
+        if magic == _PCAPNG_SHB:
+            yield from _iter_pcapng(f)
+        elif magic in _PCAP_MAGICS:
+            yield from _iter_pcap(f, *_PCAP_MAGICS[magic])
+        else:
+            raise CaptureFormatError(f'{path}: not a pcap or pcapng file')
+
+
+def _iter_pcap(f, endian: str, resolution: float):
+    header = f.read(20)
+    if len(header) < 20:
+        raise CaptureFormatError('truncated pcap header')
+    linktype = struct.unpack(endian + 'HHiIII', header)[5] & 0x0FFFFFFF
+    record = struct.Struct(endian + 'IIII')
+    while True:
+        head = f.read(16)
+        if len(head) < 16:
+            return
+        sec, frac, caplen, _ = record.unpack(head)
+        if caplen > MAX_BLOCK_SIZE:
+            raise CaptureFormatError(f'bad pcap record length {caplen}')
+        data = f.read(caplen)
+        if len(data) < caplen:
+            return  # capture cut off mid-packet (e.g. still being written)
+        yield sec + frac * resolution, linktype, data
+
+
+def _iter_pcapng(f):
+    endian = '<'
+    interfaces = []  # (linktype, ts resolution, ts offset) per interface in this section
+    first = True
+    while True:
+        if first:
+            btype_raw = _PCAPNG_SHB
+            first = False
+        else:
+            btype_raw = f.read(4)
+            if len(btype_raw) < 4:
+                return
+        length_raw = f.read(4)
+        if len(length_raw) < 4:
+            return
+
+        if btype_raw == _PCAPNG_SHB:
+            bom = f.read(4)
+            if bom == b'\x4d\x3c\x2b\x1a':
+                endian = '<'
+            elif bom == b'\x1a\x2b\x3c\x4d':
+                endian = '>'
+            else:
+                raise CaptureFormatError('bad pcapng byte-order magic')
+            length = struct.unpack(endian + 'I', length_raw)[0]
+            if length < 28 or length > MAX_BLOCK_SIZE:
+                raise CaptureFormatError(f'bad pcapng section header length {length}')
+            f.read(length - 12)
+            interfaces = []
+            continue
+
+        btype, length = struct.unpack(endian + 'II', btype_raw + length_raw)
+        if length < 12 or length % 4 or length > MAX_BLOCK_SIZE:
+            raise CaptureFormatError(f'bad pcapng block length {length}')
+        body = f.read(length - 8)
+        if len(body) < length - 8:
+            return
+        body = body[:-4]  # trailing block length
+
+        if btype == 1:    # Interface Description Block
+            linktype = struct.unpack_from(endian + 'H', body)[0]
+            interfaces.append((linktype, *_idb_timestamp_options(body[8:], endian)))
+        elif btype == 6:  # Enhanced Packet Block
+            iface, ts_hi, ts_lo, caplen, _ = struct.unpack_from(endian + 'IIIII', body)
+            if iface >= len(interfaces):
+                continue
+            linktype, resolution, offset = interfaces[iface]
+            yield ((ts_hi << 32 | ts_lo) * resolution + offset, linktype, body[20:20 + caplen])
+        elif btype == 3:  # Simple Packet Block: no timestamp, interface 0
+            if interfaces:
+                origlen = struct.unpack_from(endian + 'I', body)[0]
+                yield 0.0, interfaces[0][0], body[4:4 + origlen]
+        elif btype == 2:  # obsolete Packet Block
+            iface, _, ts_hi, ts_lo, caplen, _ = struct.unpack_from(endian + 'HHIIII', body)
+            if iface < len(interfaces):
+                linktype, resolution, offset = interfaces[iface]
+                yield ((ts_hi << 32 | ts_lo) * resolution + offset, linktype, body[20:20 + caplen])
+
+
+def _idb_timestamp_options(options: bytes, endian: str) -> tuple[float, float]:
+    resolution, offset, pos = 1e-6, 0.0, 0
+    while pos + 4 <= len(options):
+        code, olen = struct.unpack_from(endian + 'HH', options, pos)
+        value = options[pos + 4:pos + 4 + olen]
+        if code == 0:
+            break
+        if code == 9 and olen >= 1:     # if_tsresol
+            v = value[0]
+            resolution = 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        elif code == 14 and olen >= 8:  # if_tsoffset, seconds
+            offset = float(struct.unpack(endian + 'q', value[:8])[0])
+        pos += 4 + (olen + 3) // 4 * 4
+    return resolution, offset
+
+
+# ---------------------------------------------------------------------------
+# Link / IP / transport decoding
+# ---------------------------------------------------------------------------
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_ACK = 0x10
+
+_IPV6_EXT_HEADERS = {0, 43, 44, 60}
+
+
+class IpPacket(NamedTuple):
+    src: str
+    dst: str
+    proto: int
+    payload: bytes
+    fragment: bool
+
+
+class TcpSegment(NamedTuple):
+    sport: int
+    dport: int
+    seq: int
+    flags: int
+    payload: bytes
+
+
+def link_to_ip(linktype: int, frame: bytes) -> bytes | None:
+    """Strip the link-layer header, returning the IP packet (or None if not IP)."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None
+        pos, ethertype = 14, struct.unpack_from('>H', frame, 12)[0]
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= pos + 4:
+            ethertype = struct.unpack_from('>H', frame, pos + 2)[0]
+            pos += 4
+        return frame[pos:] if ethertype in (0x0800, 0x86DD) else None
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return frame
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16 or struct.unpack_from('>H', frame, 14)[0] not in (0x0800, 0x86DD):
+            return None
+        return frame[16:]
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20 or struct.unpack_from('>H', frame, 0)[0] not in (0x0800, 0x86DD):
+            return None
+        return frame[20:]
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # 4-byte address family; the IP version nibble is more reliable than
+        # guessing the byte order of the capturing host.
+        return frame[4:] if len(frame) > 4 else None
+    return None
+
+
+def parse_ip(packet: bytes) -> IpPacket | None:
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        total, frag, proto = struct.unpack_from('>H2xH1xB', packet, 2)
+        fragment = bool(frag & 0x3FFF)  # MF flag or a non-zero offset
+        return IpPacket(socket.inet_ntop(socket.AF_INET, packet[12:16]),
+                        socket.inet_ntop(socket.AF_INET, packet[16:20]),
+                        proto, packet[ihl:total], fragment)
+    if version == 6:
+        if len(packet) < 40:
+            return None
+        plen = struct.unpack_from('>H', packet, 4)[0]
+        proto, pos, end = packet[6], 40, 40 + plen
+        fragment = False
+        while proto in _IPV6_EXT_HEADERS and pos + 8 <= len(packet):
+            if proto == 44:
+                fragment = True
+                proto, pos = packet[pos], pos + 8
+            else:
+                proto, pos = packet[pos], pos + (packet[pos + 1] + 1) * 8
+        return IpPacket(socket.inet_ntop(socket.AF_INET6, packet[8:24]),
+                        socket.inet_ntop(socket.AF_INET6, packet[24:40]),
+                        proto, packet[pos:end], fragment)
+    return None
+
+
+def parse_tcp(segment: bytes) -> TcpSegment | None:
+    if len(segment) < 20:
+        return None
+    sport, dport, seq, _, off_flags = struct.unpack_from('>HHIIH', segment)
+    offset = (off_flags >> 12) * 4
+    return TcpSegment(sport, dport, seq, off_flags & 0x3F, segment[offset:])
+
+
+def iter_ip(path: str, stats: 'CaptureStats') -> Iterator[tuple[float, IpPacket]]:
+    """Yield (timestamp, IpPacket) for every unfragmented IP packet in the capture."""
+    for ts, linktype, frame in iter_packets(path):
+        stats.packets += 1
+        stats.bytes += len(frame)
+        if stats.first_ts is None and ts:
+            stats.first_ts = ts
+        stats.last_ts = ts
+        raw = link_to_ip(linktype, frame)
+        ip = parse_ip(raw) if raw else None
+        if ip is None:
+            continue
+        if ip.fragment:
+            stats.fragments += 1
+            continue
+        yield ts, ip
+
+
+class CaptureStats:
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.fragments = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.tcp_gaps = 0
+        self.streams_evicted = 0
+
+
+# ---------------------------------------------------------------------------
+# TCP reassembly
+# ---------------------------------------------------------------------------
+
+StreamKey = tuple[str, int, str, int]  # (src, sport, dst, dport), one direction
+
+
+class StreamConsumer:
+    """
+    Receives the in-order bytes of one TCP direction from TcpReassembler.
+
+    data() returns False when the consumer has seen enough; the reassembler
+    then stops buffering that direction.
+    """
+
+    def data(self, ts: float, data: bytes) -> bool:
+        return False
+
+    def gap(self, ts: float):
+        """Bytes were lost (not captured, or out-of-order buffer overflowed)."""
+
+    def close(self, ts: float):
+        """The direction ended: FIN, RST, eviction, or end of capture."""
+
+
+class _Direction:
+    __slots__ = ('consumer', 'next_seq', 'pending', 'pending_bytes')
+
+    def __init__(self, consumer: StreamConsumer | None, next_seq: int | None):
+        self.consumer = consumer
+        self.next_seq = next_seq
+        self.pending = {}
+        self.pending_bytes = 0
+
+
+def _seq_diff(a: int, b: int) -> int:
+    """a - b in 32-bit sequence space, as a signed value."""
+    d = (a - b) & 0xFFFFFFFF
+    return d - (1 << 32) if d >= 1 << 31 else d
+
+
+class TcpReassembler:
+    """
+    Reorders TCP segments per direction and feeds contiguous bytes to consumers.
+
+    `factory(key, syn)` is called once per new direction and returns a
+    StreamConsumer, or None to ignore it. Out-of-order data is buffered up to
+    `max_pending` bytes per direction; beyond that the missing bytes are
+    declared lost. At most `max_streams` directions are tracked at once; the
+    least recently active one is closed to make room.
+    """
+
+    def __init__(self, factory: Callable[[StreamKey, bool], StreamConsumer | None],
+                 stats: CaptureStats, max_streams: int = 4096, max_pending: int = 1 << 20):
+        self.factory = factory
+        self.stats = stats
+        self.max_streams = max_streams
+        self.max_pending = max_pending
+        self._streams: collections.OrderedDict[StreamKey, _Direction] = collections.OrderedDict()
+
+    def segment(self, ts: float, src: str, dst: str, tcp: TcpSegment):
+        key = (src, tcp.sport, dst, tcp.dport)
+        d = self._streams.get(key)
+        syn = bool(tcp.flags & TCP_SYN)
+        if d is None or (syn and d.next_seq is not None
+                          and (tcp.seq + 1) & 0xFFFFFFFF != d.next_seq):
+            if d is not None:
+                self._close(key, ts)  # port reuse: a new connection on the same 4-tuple
+            if tcp.flags & (TCP_RST | TCP_FIN) and not tcp.payload:
+                return
+            consumer = self.factory(key, syn)
+            d = _Direction(consumer, (tcp.seq + 1) & 0xFFFFFFFF if syn else None)
+            self._streams[key] = d
+            if len(self._streams) > self.max_streams:
+                self.stats.streams_evicted += 1
+                self._close(next(iter(self._streams)), ts)
+        else:
+            self._streams.move_to_end(key)
+
+        if d.consumer is not None and tcp.payload:
+            if d.next_seq is None:
+                d.next_seq = tcp.seq  # capture started mid-connection
+            self._data(d, ts, tcp.seq, tcp.payload)
+        if tcp.flags & (TCP_FIN | TCP_RST):
+            self._close(key, ts)
+
+    def _data(self, d: _Direction, ts: float, seq: int, payload: bytes):
+        diff = _seq_diff(seq, d.next_seq)
+        if diff < 0:
+            if -diff >= len(payload):
+                return  # retransmission of bytes already delivered
+            payload, seq = payload[-diff:], d.next_seq
+            diff = 0
+        if diff > 0:
+            if seq not in d.pending or len(d.pending[seq]) < len(payload):
+                d.pending_bytes += len(payload) - len(d.pending.get(seq, b''))
+                d.pending[seq] = payload
+            if d.pending_bytes <= self.max_pending:
+                return
+            # Give up on the hole and resume from the earliest buffered segment.
+            self.stats.tcp_gaps += 1
+            d.consumer.gap(ts)
+            d.next_seq = min(d.pending, key=lambda s: _seq_diff(s, d.next_seq))
+            payload = d.pending.pop(d.next_seq)
+            d.pending_bytes -= len(payload)
+        self._deliver(d, ts, payload)
+        while d.pending and d.consumer is not None:
+            ready = [s for s in d.pending if _seq_diff(s, d.next_seq) <= 0]
+            if not ready:
+                break
+            for s in ready:
+                chunk = d.pending.pop(s)
+                d.pending_bytes -= len(chunk)
+                skip = -_seq_diff(s, d.next_seq)
+                if skip < len(chunk):
+                    self._deliver(d, ts, chunk[skip:])
+
+    def _deliver(self, d: _Direction, ts: float, data: bytes):
+        d.next_seq = (d.next_seq + len(data)) & 0xFFFFFFFF
+        if d.consumer is not None and not d.consumer.data(ts, data):
+            d.consumer.close(ts)
+            d.consumer = None
+            d.pending.clear()
+            d.pending_bytes = 0
+
+    def _close(self, key: StreamKey, ts: float):
+        d = self._streams.pop(key)
+        if d.consumer is not None:
+            # Deliver what is buffered past the hole(s), trimming overlaps
+            # as the in-order path does
+            for s in sorted(d.pending, key=lambda s: _seq_diff(s, d.next_seq)):
+                if d.consumer is None:
+                    break
+                chunk = d.pending[s]
+                diff = _seq_diff(s, d.next_seq)
+                if diff > 0:
+                    self.stats.tcp_gaps += 1
+                    d.consumer.gap(ts)
+                    d.next_seq = s
+                elif -diff >= len(chunk):
+                    continue  # covered by bytes already delivered
+                else:
+                    chunk = chunk[-diff:]
+                self._deliver(d, ts, chunk)
+            if d.consumer is not None:
+                d.consumer.close(ts)
+
+    def finish(self, ts: float):
+        """Close every open direction (end of capture)."""
+        while self._streams:
+            self._close(next(iter(self._streams)), ts)
+
+
+# ---------------------------------------------------------------------------
+# DNS / TLS / HTTP extraction
+# ---------------------------------------------------------------------------
+
+_DNS_TYPES = {1: 'A', 5: 'CNAME', 12: 'PTR', 16: 'TXT', 28: 'AAAA', 33: 'SRV', 65: 'HTTPS'}
+
+
+def parse_dns_query(payload: bytes) -> tuple[str, str] | None:
+    """Return (qname, qtype) from a DNS query message, or None for responses/garbage."""
+    if len(payload) < 12:
+        return None
+    flags, qdcount = struct.unpack_from('>HH', payload, 2)
+    if flags & 0x8000 or qdcount < 1:
+        return None
+    labels, pos = [], 12
+    while pos < len(payload):
+        n = payload[pos]
+        if n == 0:
+            pos += 1
+            break
+        if n & 0xC0 or pos + 1 + n > len(payload):
+            return None  # queries are not compressed
+        labels.append(payload[pos + 1:pos + 1 + n].decode('ascii', 'replace'))
+        pos += 1 + n
+    if pos + 2 > len(payload):
+        return None
+    qtype = struct.unpack_from('>H', payload, pos)[0]
+    return '.'.join(labels), _DNS_TYPES.get(qtype, str(qtype))
+
+
+def parse_client_hello_sni(record: bytes) -> str | None:
+    """Extract server_name from a TLS record containing a ClientHello.
+
+    The record may be truncated: the name is returned as long as it is complete.
+    """
+    try:
+        if record[0] != 0x16 or record[5] != 0x01:
+            return None
+        pos = 5 + 4 + 2 + 32                  # handshake header, version, random
+        pos += 1 + record[pos]                # session id
+        pos += 2 + struct.unpack_from('>H', record, pos)[0]   # cipher suites
+        pos += 1 + record[pos]                # compression methods
+        end = pos + 2 + struct.unpack_from('>H', record, pos)[0]
+        pos += 2
+        while pos + 4 <= end:
+            etype, elen = struct.unpack_from('>HH', record, pos)
+            pos += 4
+            if etype == 0:                    # server_name
+                name_len = struct.unpack_from('>H', record, pos + 3)[0]
+                if pos + 5 + name_len > len(record):
+                    return None
+                return record[pos + 5:pos + 5 + name_len].decode('ascii', 'replace')
+            pos += elen
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+_HTTP_METHODS = (b'GET ', b'POST ', b'PUT ', b'HEAD ', b'DELETE ', b'OPTIONS ', b'PATCH ')
+MAX_HTTP_HEADER = 64 << 10
+MAX_TLS_HELLO = 16 << 10
+
+
+class HttpObject(NamedTuple):
+    name: str
+    path: str | None
+    size: int
+    md5: str
+    kind: str
+    complete: bool
+
+
+def sniff_kind(head: bytes) -> str:
+    if head.startswith(b'PK\x03\x04'):
+        return 'ZIP archive'
+    if head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'MP3 audio'
+    if head.startswith(b'\x1f\x8b'):
+        return 'gzip data'
+    if head.lstrip()[:1] in (b'{', b'['):
+        return 'JSON'
+    if head.lstrip()[:1] == b'<':
+        return 'HTML/XML'
+    return 'data'
+
+
+class _BodySink:
+    """Streams one HTTP body to disk (if exporting) while hashing it."""
+
+    def __init__(self, export_dir: str | None, name: str):
+        self.name = name
+        self.size = 0
+        self.head = b''
+        self._md5 = hashlib.md5()
+        self.path = None
+        self._f = None
+        if export_dir:
+            self.path = _unique_path(export_dir, name)
+            self._f = open(self.path, 'wb')
+
+    def write(self, data: bytes):
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        self._md5.update(data)
+        self.size += len(data)
+        if self._f:
+            self._f.write(data)
+
+    def finish(self, complete: bool) -> HttpObject:
+        if self._f:
+            self._f.close()
+        return HttpObject(self.name, self.path, self.size, self._md5.hexdigest(),
+                          sniff_kind(self.head), complete)
+
+
+def _unique_path(directory: str, name: str) -> str:
+    base, ext = os.path.splitext(name)
+    path, n = os.path.join(directory, name), 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f'{base}({n}){ext}')
+        n += 1
+    return path
+
+
+def _object_name(uri: str) -> str:
+    name = os.path.basename(urllib.parse.unquote(urllib.parse.urlsplit(uri).path))
+    return re.sub(r'[^\w.\-]', '_', name) or 'index'
+
+
+def _conn_key(key: StreamKey) -> tuple:
+    """The same key for both directions of a connection."""
+    src, sport, dst, dport = key
+    return tuple(sorted([(src, sport), (dst, dport)]))
+
+
+class _Connection:
+    """State shared by the two directions of one TCP connection."""
+    __slots__ = ('requests',)
+
+    def __init__(self):
+        self.requests = collections.deque(maxlen=64)  # (method, uri) awaiting a response
+
+
+class _Sniffer(StreamConsumer):
+    """
+    Classifies one TCP direction by its first bytes and extracts HTTP or TLS
+    metadata from it. Anything else is dropped immediately.
+    """
+
+    def __init__(self, analyzer: 'CaptureAnalyzer', key: StreamKey, conn: _Connection):
+        self.a = analyzer
+        self.key = key
+        self.conn = conn
+        self.mode = None          # 'tls', 'request', 'response'
+        self.buf = bytearray()
+        self.body: _BodySink | None = None
+        self.body_mode = None     # 'length', 'chunked', 'close'
+        self.remaining = 0
+        self.chunk_state = None   # 'size', 'data', 'crlf', 'trailer'
+        self.broken = False
+
+    # -- StreamConsumer ----------------------------------------------------
+
+    def data(self, ts: float, data: bytes) -> bool:
+        if self.mode is None:
+            head = bytes(self.buf[:8]) + data[:8]
+            if head[:1] == b'\x16':
+                self.mode = 'tls'
+            elif head.startswith(_HTTP_METHODS):
+                self.mode = 'request'
+            elif head.startswith(b'HTTP/'):
+                self.mode = 'response'
+            elif len(head) >= 8:
+                return False
+            else:
+                self.buf += data
+                return True
+        if self.mode == 'tls':
+            return self._tls(data)
+        return self._http(ts, data)
+
+    def gap(self, ts: float):
+        if self.mode == 'tls':
+            self._tls_done()
+        if self.body:
+            self.a.add_object(self.body.finish(complete=False))
+            self.body = None
+        self.broken = True
+
+    def close(self, ts: float):
+        if self.mode == 'tls':
+            self._tls_done()
+        if self.body:
+            complete = self.body_mode == 'close'
+            self.a.add_object(self.body.finish(complete=complete))
+            self.body = None
+        self.a.end_stream(self.key, self.conn)
+
+    # -- TLS -------------------------------------------------------------------
+
+    def _tls(self, data: bytes) -> bool:
+        if self.broken:
+            return False
+        self.buf += data
+        if len(self.buf) < 5:
+            return True
+        need = 5 + struct.unpack_from('>H', self.buf, 3)[0]
+        if len(self.buf) < need and len(self.buf) < MAX_TLS_HELLO:
+            return True
+        del self.buf[need:]
+        self._tls_done()
+        return False
+
+    def _tls_done(self):
+        """Look for the SNI in whatever is buffered, even a ClientHello cut short
+        by a gap or the end of the stream."""
+        if self.buf:
+            sni = parse_client_hello_sni(bytes(self.buf))
+            if sni:
+                self.a.add_sni(self.key, sni)
+            self.buf = bytearray()
+
+    # -- HTTP ------------------------------------------------------------------
+
+    def _http(self, ts: float, data: bytes) -> bool:
+        if self.broken:
+            return False
+        while data:
+            if self.body:
+                data = self._body(data)
+                continue
+            self.buf += data
+            data = b''
+            end = self.buf.find(b'\r\n\r\n')
+            if end < 0:
+                return len(self.buf) < MAX_HTTP_HEADER
+            head = bytes(self.buf[:end]).decode('latin-1')
+            data = bytes(self.buf[end + 4:])
+            self.buf.clear()
+            if not self._message(ts, head):
+                return False
+        return True
+
+    def _message(self, ts: float, head: str) -> bool:
+        lines = head.split('\r\n')
+        start = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            k, _, v = line.partition(':')
+            headers[k.strip().lower()] = v.strip()
+
+        if self.mode == 'request':
+            if len(start) < 2:
+                return False
+            method, uri = start[0], start[1]
+            self.conn.requests.append((method, uri))
+            self.a.add_request(ts, self.key, method, headers.get('host', self.key[2]), uri)
+            name = _object_name(uri) + '.request'
+            has_body = True
+        else:
+            if len(start) < 2 or not start[1].isdigit():
+                return False
+            status = int(start[1])
+            method, uri = self.conn.requests.popleft() if self.conn.requests else ('GET', '/')
+            name = _object_name(uri)
+            has_body = method != 'HEAD' and status >= 200 and status not in (204, 304)
+
+        self.body_mode = None
+        if not has_body:
+            return True
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            self.body_mode, self.chunk_state = 'chunked', 'size'
+        elif 'content-length' in headers:
+            try:
+                self.remaining = int(headers['content-length'])
+            except ValueError:
+                return False
+            if self.remaining <= 0:
+                return True
+            self.body_mode = 'length'
+        elif self.mode == 'response':
+            self.body_mode = 'close'
+        else:
+            return True
+        self.body = self.a.new_body(name)
+        return True
+
+    def _body(self, data: bytes) -> bytes:
+        """Consume body bytes; returns whatever follows the end of the body."""
+        if self.body_mode == 'close':
+            self.body.write(data)
+            return b''
+        if self.body_mode == 'length':
+            take = data[:self.remaining]
+            self.body.write(take)
+            self.remaining -= len(take)
+            if not self.remaining:
+                self._end_body()
+            return data[len(take):]
+        return self._chunked(data)
+
+    def _chunked(self, data: bytes) -> bytes:
+        while data and self.body:
+            if self.chunk_state == 'data':
+                take = data[:self.remaining]
+                self.body.write(take)
+                self.remaining -= len(take)
+                data = data[len(take):]
+                if not self.remaining:
+                    self.chunk_state, self.remaining = 'crlf', 2
+            elif self.chunk_state == 'crlf':
+                skip = min(self.remaining, len(data))
+                self.remaining -= skip
+                data = data[skip:]
+                if not self.remaining:
+                    self.chunk_state = 'size'
+            else:  # 'size' or 'trailer': line-oriented
+                self.buf += data
+                nl = self.buf.find(b'\r\n')
+                if nl < 0:
+                    if len(self.buf) > MAX_HTTP_HEADER:
+                        self.gap(0.0)
+                    return b''
+                line = bytes(self.buf[:nl])
+                data = bytes(self.buf[nl + 2:])
+                self.buf.clear()
+                if self.chunk_state == 'trailer':
+                    if not line:
+                        self._end_body()
+                    continue
+                try:
+                    size = int(line.split(b';')[0].strip() or b'x', 16)
+                except ValueError:
+                    self.gap(0.0)
+                    return b''
+                if size:
+                    self.chunk_state, self.remaining = 'data', size
+                else:
+                    self.chunk_state = 'trailer'
+        return data
+
+    def _end_body(self):
+        self.a.add_object(self.body.finish(complete=True))
+        self.body = None
+
+
+# ---------------------------------------------------------------------------
+# Analysis
+# ---------------------------------------------------------------------------
+
+class CaptureReport:
+    def __init__(self, path: str, host: str | None):
+        self.path = path
+        self.host = host
+        self.stats = CaptureStats()
+        self.dns: dict[tuple[str, str], int] = {}          # (qname, qtype) -> count
+        self.connections: dict[tuple[str, int], int] = {}  # (dst, dport) -> SYN count
+        self.http: dict[tuple[str, str, str], int] = {}    # (method, host, uri) -> count
+        self.tls: dict[tuple[str, int], str] = {}          # (sni, dport) -> dst
+        self.objects: list[HttpObject] = []
+        self.files: list[str] = []   # capture files analyzed, in order
+        self.file_bytes = 0
+        self.elapsed = 0.0
+
+    def to_dict(self) -> dict:
+        s = self.stats
+        return {
+            'path': self.path,
+            'host': self.host,
+            'files': self.files,
+            'file_bytes': self.file_bytes,
+            'packets': s.packets,
+            'bytes': s.bytes,
+            'ip_fragments_skipped': s.fragments,
+            'tcp_gaps': s.tcp_gaps,
+            'streams_evicted': s.streams_evicted,
+            'duration': (s.last_ts - s.first_ts) if s.first_ts is not None else 0.0,
+            'analysis_seconds': round(self.elapsed, 3),
+            'dns': [{'name': n, 'type': t, 'count': c} for (n, t), c in self.dns.items()],
+            'connections': [{'dst': d, 'port': p, 'count': c}
+                            for (d, p), c in self.connections.items()],
+            'http': [{'method': m, 'url': f'http://{h}{u}', 'count': c}
+                     for (m, h, u), c in self.http.items()],
+            'tls': [{'sni': n, 'port': p, 'dst': d} for (n, p), d in self.tls.items()],
+            'objects': [o._asdict() for o in self.objects],
+        }
+
+
+class CaptureAnalyzer:
+    """
+    One streaming pass over a capture. With `host` set, only traffic the host
+    initiates is reported (its DNS queries, SYNs, HTTP requests and
+    ClientHellos), plus the bodies exchanged on its HTTP connections.
+
+    run() analyzes one file. A capture split into consecutive files (tshark
+    ring buffer segments) is analyzed with feed() per file as each one is
+    closed, then finish(); TCP streams carry over from one file to the next
+    and the report grows with each file.
+    """
+
+    def __init__(self, path: str, host: str | None = None, export_dir: str | None = None,
+                 max_streams: int = 4096):
+        self.report = CaptureReport(path, host)
+        self.host = host
+        self.export_dir = export_dir
+        # Connections seen in one direction only, least recently opened first
+        self._conns: collections.OrderedDict[tuple, _Connection] = collections.OrderedDict()
+        self.max_conns = max_streams
+        self.tcp = TcpReassembler(self._new_stream, self.report.stats, max_streams=max_streams)
+        self._last_ts = 0.0
+
+    def _wanted(self, src: str, dst: str) -> bool:
+        return self.host is None or self.host in (src, dst)
+
+    def _new_stream(self, key: StreamKey, syn: bool) -> StreamConsumer | None:
+        src, sport, dst, dport = key
+        if not self._wanted(src, dst):
+            return None
+        ckey = _conn_key(key)
+        conn = self._conns.pop(ckey, None)
+        if conn is None:
+            conn = _Connection()
+            self._conns[ckey] = conn  # held until the other direction appears or closes
+            if len(self._conns) > self.max_conns:
+                self._conns.popitem(last=False)
+        return _Sniffer(self, key, conn)
+
+    def run(self) -> CaptureReport:
+        self.feed(self.report.path)
+        return self.finish()
+
+    def feed(self, path: str):
+        """Analyze the next file of the capture."""
+        t0 = time.perf_counter()
+        stats = self.report.stats
+        self.report.files.append(path)
+        self.report.file_bytes += os.path.getsize(path)
+        for ts, ip in iter_ip(path, stats):
+            self._last_ts = ts
+            if ip.proto == IPPROTO_TCP:
+                tcp = parse_tcp(ip.payload)
+                if tcp is None:
+                    continue
+                if tcp.flags & TCP_SYN and not tcp.flags & TCP_ACK and self._from_host(ip.src):
+                    k = (ip.dst, tcp.dport)
+                    self.report.connections[k] = self.report.connections.get(k, 0) + 1
+                self.tcp.segment(ts, ip.src, ip.dst, tcp)
+            elif ip.proto == IPPROTO_UDP and len(ip.payload) >= 8 and self._from_host(ip.src):
+                dport = struct.unpack_from('>H', ip.payload, 2)[0]
+                if dport in (53, 5353):
+                    q = parse_dns_query(ip.payload[8:])
+                    if q:
+                        self.report.dns[q] = self.report.dns.get(q, 0) + 1
+        self.report.elapsed += time.perf_counter() - t0
+
+    def finish(self) -> CaptureReport:
+        """End of capture: close the TCP streams still open and return the report."""
+        t0 = time.perf_counter()
+        self.tcp.finish(self._last_ts)
+        self.report.elapsed += time.perf_counter() - t0
+        return self.report
+
+    def _from_host(self, src: str) -> bool:
+        return self.host is None or src == self.host
+
+    # -- callbacks from _Sniffer -----------------------------------------------
+
+    def add_request(self, ts: float, key: StreamKey, method: str, host: str, uri: str):
+        if self._from_host(key[0]):
+            k = (method, host, uri)
+            self.report.http[k] = self.report.http.get(k, 0) + 1
+
+    def add_sni(self, key: StreamKey, sni: str):
+        if self._from_host(key[0]):
+            self.report.tls.setdefault((sni, key[3]), key[2])
+
+    def new_body(self, name: str) -> _BodySink:
+        return _BodySink(self.export_dir, name)
+
+    def add_object(self, obj: HttpObject):
+        if obj.size:
+            self.report.objects.append(obj)
+
+    def end_stream(self, key: StreamKey, conn: _Connection):
+        """A direction closed; forget its connection if the other direction never appeared."""
+        ckey = _conn_key(key)
+        if self._conns.get(ckey) is conn:
+            del self._conns[ckey]
+
+
+def analyze(path: str | list[str], host: str | None = None,
+            export_dir: str | None = None) -> CaptureReport:
+    """Analyze a capture file, or the consecutive files of one capture in order."""
+    paths = [path] if isinstance(path, str) else path
+    if export_dir:
+        os.makedirs(export_dir, exist_ok=True)
+    analyzer = CaptureAnalyzer(paths[0], host, export_dir)
+    for p in paths:
+        analyzer.feed(p)
+    return analyzer.finish()
+
+
+def print_report(report: CaptureReport):
+    s = report.stats
+    duration = (s.last_ts - s.first_ts) if s.first_ts is not None else 0.0
+    files = f" in {len(report.files)} files" if len(report.files) > 1 else ""
+    print(f"pcap: {report.file_bytes:,} bytes{files}, {s.packets:,} packets "
+          f"over {duration:.0f}s (analyzed in {report.elapsed:.1f}s)")
+    if s.fragments or s.tcp_gaps or s.streams_evicted:
+        print(f"  skipped: {s.fragments} IP fragments, {s.tcp_gaps} TCP gaps, "
+              f"{s.streams_evicted} streams evicted")
+    who = 'vacuum' if report.host else 'capture'
+
+    print(f"\n[DNS from {who}]")
+    for (name, qtype), count in report.dns.items():
+        print(f"  {name}  ({qtype}, x{count})" if count > 1 else f"  {name}  ({qtype})")
+    if not report.dns:
+        print("  (none - DNS bypassing us)")
+
+    print(f"\n[TCP connections from {who}]")
+    for (dst, port), count in report.connections.items():
+        proto = "HTTPS" if port == 443 else ("HTTP" if port == 80 else f"port {port}")
+        print(f"  {dst}:{port} ({proto})" + (f" x{count}" if count > 1 else ""))
+    if not report.connections:
+        print("  (none - ICMP redirect still blocking?)")
+
+    print(f"\n[HTTP requests from {who}]")
+    for (method, host, uri), count in report.http.items():
+        print(f"  {method} http://{host}{uri}" + (f"  x{count}" if count > 1 else ""))
+    if not report.http:
+        print("  (none)")
+
+    print("\n[HTTPS connections (TLS SNI)]")
+    for (sni, port), dst in report.tls.items():
+        print(f"  https://{sni}:{port}  ({dst})")
+    if not report.tls:
+        print("  (none)")
+
+    if report.objects:
+        exported = any(o.path for o in report.objects)
+        print("\n[HTTP objects" + (f" -> {os.path.dirname(report.objects[0].path)}/]"
+                                   if exported else "]"))
+        for o in report.objects:
+            note = '' if o.complete else '  INCOMPLETE'
+            print(f"  {o.name}  ({o.size:,} bytes, md5 {o.md5}){note}")
+            print(f"    -> {o.kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Single-pass analysis of a pcap/pcapng capture.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('pcap', nargs='+',
+                        help='Capture file (pcap or pcapng), or the ring buffer segments of '
+                             'one capture in order')
+    parser.add_argument('--host', help='Only report traffic initiated by this IP (the vacuum)')
+    parser.add_argument('--export-dir', help='Write HTTP bodies to this directory')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        report = analyze(args.pcap, args.host, args.export_dir)
+    except (OSError, CaptureFormatError) as e:
+        sys.exit(f"ERROR: {e}")
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+tuya_local.py — Minimal Tuya v3.3 local protocol framing and encryption.
+
+Shared by the research tools that speak or decode the vacuum's local
+protocol (vacuum_simulator.py, decode_tuya_capture.py). See
+docs/dps162_protocol.md for the frame layout:
+
+    000055AA | seqno | cmd | length | [retcode] payload | crc32 | 0000AA55
+
+Frames sent by the device carry a 4-byte return code before the payload;
+frames sent by the app/client do not. v3.3 payloads are AES-128-ECB with
+the device's local key and PKCS#7 padding. CONTROL and STATUS payloads are
+additionally prefixed with the plaintext header b'3.3' + 12 zero bytes.
+"""
+
+import binascii
+import struct
+import sys
+from typing import NamedTuple
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    sys.exit("pycryptodome not installed. Run: pip install pycryptodome")
+
+
+PREFIX = 0x000055AA
+SUFFIX = 0x0000AA55
+PREFIX_BIN = struct.pack('>I', PREFIX)
+
+CMD_CONTROL = 0x07
+CMD_STATUS = 0x08
+CMD_HEART_BEAT = 0x09
+CMD_DP_QUERY = 0x0A
+CMD_CONTROL_NEW = 0x0D
+CMD_DP_QUERY_NEW = 0x10
+CMD_UPDATEDPS = 0x12
+
+VERSION_HEADER = b'3.3' + 12 * b'\x00'
+
+_HEADER = struct.Struct('>IIII')
+_FOOTER = struct.Struct('>II')
+
+# Reject declared lengths above this so a corrupt header cannot make a
+# reader buffer an unbounded amount of data.
+MAX_FRAME_PAYLOAD = 1 << 20
+
+
+class Frame(NamedTuple):
+    seqno: int
+    cmd: int
+    retcode: int | None
+    payload: bytes
+    crc_ok: bool
+
+
+class TuyaCipher:
+    """AES-128-ECB with PKCS#7 padding, keyed on a device's local key."""
+
+    def __init__(self, local_key: str | bytes):
+        if isinstance(local_key, str):
+            local_key = local_key.encode()
+        if len(local_key) != 16:
+            raise ValueError('Tuya local keys are 16 bytes')
+        self._aes = AES.new(local_key, AES.MODE_ECB)
+
+    def encrypt(self, raw: bytes) -> bytes:
+        pad = 16 - len(raw) % 16
+        return self._aes.encrypt(raw + bytes([pad]) * pad)
+
+    def decrypt(self, enc: bytes) -> bytes:
+        if not enc or len(enc) % 16:
+            raise ValueError(f'ciphertext length {len(enc)} is not a multiple of 16')
+        raw = self._aes.decrypt(enc)
+        pad = raw[-1]
+        if not 1 <= pad <= 16 or raw[-pad:] != bytes([pad]) * pad:
+            raise ValueError('bad padding (wrong local key?)')
+        return raw[:-pad]
+
+    def encode_payload(self, raw: bytes, version_header: bool) -> bytes:
+        enc = self.encrypt(raw)
+        return VERSION_HEADER + enc if version_header else enc
+
+    def decode_payload(self, payload: bytes) -> bytes:
+        """Decrypt a frame payload, dropping the '3.3' version header if present."""
+        if payload.startswith(VERSION_HEADER[:3]):
+            payload = payload[len(VERSION_HEADER):]
+        return self.decrypt(payload)
+
+
+def pack_frame(seqno: int, cmd: int, payload: bytes, retcode: int | None = None) -> bytes:
+    body = (struct.pack('>I', retcode) if retcode is not None else b'') + payload
+    head = _HEADER.pack(PREFIX, seqno, cmd, len(body) + _FOOTER.size)
+    crc = binascii.crc32(head + body) & 0xFFFFFFFF
+    return head + body + _FOOTER.pack(crc, SUFFIX)
+
+
+class FrameReader:
+    """
+    Incremental 55AA frame parser for one direction of a TCP stream.
+
+    feed() accepts arbitrary slices of the byte stream and returns the
+    complete frames they finish. Garbage before a frame prefix is skipped.
+    """
+
+    def __init__(self, has_retcode: bool):
+        self.has_retcode = has_retcode
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> list[Frame]:
+        buf = self._buf
+        buf += data
+        frames = []
+        while True:
+            start = buf.find(PREFIX_BIN)
+            if start < 0:
+                del buf[:max(0, len(buf) - 3)]
+                return frames
+            if start:
+                del buf[:start]
+            if len(buf) < _HEADER.size:
+                return frames
+            _, seqno, cmd, length = _HEADER.unpack_from(buf)
+            if length < _FOOTER.size or length > MAX_FRAME_PAYLOAD:
+                del buf[:4]  # not a real frame; resync on the next prefix
+                continue
+            end = _HEADER.size + length
+            if len(buf) < end:
+                return frames
+            body = bytes(buf[_HEADER.size:end - _FOOTER.size])
+            crc, _ = _FOOTER.unpack_from(buf, end - _FOOTER.size)
+            crc_ok = crc == binascii.crc32(buf[:end - _FOOTER.size]) & 0xFFFFFFFF
+            del buf[:end]
+            retcode = None
+            if self.has_retcode and len(body) >= 4:
+                retcode = struct.unpack_from('>I', body)[0]
+                body = body[4:]
+            frames.append(Frame(seqno, cmd, retcode, body, crc_ok))
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+vacuum_simulator.py — Simulate Eufy L50 vacuums on the Tuya v3.3 local protocol.
+
+Runs many fake vacuums in one process so push throughput (send_voice_pack.py
+--inventory) and the pack server (serve_voice_pack.py) can be load-tested
+without real hardware. Each simulated device:
+
+  - listens for Tuya v3.3 frames (AES-ECB with its local key) on port 6668
+  - answers DP_QUERY status requests and heartbeats
+  - on a DPS 162 push, downloads the ZIP from the URL in the payload,
+    checks its MD5 and size, checks the pack ID against BUILTIN_VERSIONS,
+    the version against the installed one, and config.yaml / the
+    <voice_name>/main/ layout inside the ZIP
+  - replies with the DPS 162 status protobuf that decode_dps162_response()
+    expects: state 2 on success, 3 on failure
+
+Every device gets its own loopback address (127.0.1.1, 127.0.1.2, ...) so all
+of them can use the real port 6668; Linux routes all of 127.0.0.0/8 to lo.
+Use --spread port to put them on one address with consecutive ports instead.
+
+Usage:
+    python3 tools/vacuum_simulator.py --count 200 --inventory /tmp/sim_fleet.csv
+
+    # then, in another shell
+    python3 send_voice_pack.py --inventory /tmp/sim_fleet.csv --concurrency 50 --wait 30 \\
+        --url http://127.0.0.1:8080/en_us_male.zip --md5 ... --size ... \\
+        --set-id 502 --version 16
+
+Ctrl+C (or SIGTERM) prints a summary of pushes, installs and download times.
+"""
+
+import argparse
+import asyncio
+import csv
+import errno
+import hashlib
+import ipaddress
+import json
+import os
+import signal
+import ssl
+import sys
+import tempfile
+import time
+import urllib.parse
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from build_voice_pack import VOICE_PACK_NAMES  # noqa: E402
+from send_voice_pack import BUILTIN_VERSIONS  # noqa: E402
+import dps_protobuf  # noqa: E402
+import tuya_local as tl  # noqa: E402
+
+
+STATE_OK = 2
+STATE_FAILED = 3
+
+
+def parse_dps162_request(b64_value: str) -> dict:
+    """Decode a build_dps162() payload into {set_id, url, md5, version, size}."""
+    info = dps_protobuf.decode_dps(b64_value, dps_protobuf.DPS162_REQUEST).get('voice_info', {})
+    return {
+        'set_id':  info.get('set_id'),
+        'url':     info.get('url', ''),
+        'md5':     info.get('md5', ''),
+        'version': info.get('version'),
+        'size':    info.get('size'),
+    }
+
+
+def build_dps162_status(installed_id: int, installed_version: int, target_id: int,
+                        state: int) -> str:
+    """Encode the vacuum's DPS 162 status reply (see docs/dps162_protocol.md)."""
+    return dps_protobuf.encode_dps(dps_protobuf.DPS162_STATUS, {
+        'status': 2, 'installed_id': installed_id, 'installed_version': installed_version,
+        'target_id': target_id, 'state': state,
+    })
+
+
+async def http_download(url: str, out, rate_limit: int = 0, timeout: float = 60.0) -> str:
+    """
+    Stream `url` into the file object `out` and return the body's hex MD5.
+
+    A tiny asyncio HTTP/1.1 client, so hundreds of devices can download at
+    once without a thread each. `rate_limit` (bytes/s) emulates the
+    vacuum's slow Wi-Fi.
+    """
+    u = urllib.parse.urlsplit(url)
+    tls = u.scheme == 'https'
+    port = u.port or (443 if tls else 80)
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(
+        u.hostname, port, ssl=ssl.create_default_context() if tls else None), timeout)
+    try:
+        path = u.path or '/'
+        if u.query:
+            path += '?' + u.query
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {u.netloc}\r\n'
+                     f'User-Agent: vacuum-simulator\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+
+        status = await asyncio.wait_for(reader.readline(), timeout)
+        parts = status.split()
+        if len(parts) < 2 or parts[1] != b'200':
+            raise RuntimeError(f'HTTP {status.decode(errors="replace").strip()}')
+        length = None
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+
+        md5 = hashlib.md5()
+        got = 0
+        t0 = time.monotonic()
+        while length is None or got < length:
+            chunk = await asyncio.wait_for(reader.read(64 << 10), timeout)
+            if not chunk:
+                break
+            md5.update(chunk)
+            out.write(chunk)
+            got += len(chunk)
+            if rate_limit:
+                ahead = got / rate_limit - (time.monotonic() - t0)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        if length is not None and got != length:
+            raise RuntimeError(f'connection closed after {got} of {length} bytes')
+        return md5.hexdigest()
+    finally:
+        writer.close()
+
+
+def check_pack(zf: zipfile.ZipFile, set_id: int, version: int) -> str | None:
+    """Check the ZIP layout and config.yaml. Returns an error string or None."""
+    voice_name = VOICE_PACK_NAMES.get(set_id)
+    if voice_name is None:
+        return f'no folder name known for pack ID {set_id}'
+    try:
+        config = zf.read(f'{voice_name}/config.yaml').decode()
+    except KeyError:
+        return f'{voice_name}/config.yaml missing'
+    values = {}
+    for line in config.splitlines():
+        key, _, value = line.partition(':')
+        values[key.strip()] = value.strip()
+    if values.get('id') != str(set_id):
+        return f"config.yaml id {values.get('id')!r} != {set_id}"
+    if values.get('version') != str(version):
+        return f"config.yaml version {values.get('version')!r} != {version}"
+    if not any(n.startswith(f'{voice_name}/main/') and n.endswith('.mp3') for n in zf.namelist()):
+        return f'no MP3 files under {voice_name}/main/'
+    return None
+
+
+class Stats:
+    def __init__(self):
+        self.pushes = 0
+        self.installed = 0
+        self.failed = 0
+        self.ignored = 0
+        self.download_times = []
+
+    def summary(self) -> str:
+        lines = [f'pushes={self.pushes} installed={self.installed} '
+                 f'failed={self.failed} ignored={self.ignored}']
+        if self.download_times:
+            t = sorted(self.download_times)
+            lines.append(f'download s: min={t[0]:.2f} median={t[len(t) // 2]:.2f} '
+                         f'p95={t[int(len(t) * 0.95)]:.2f} max={t[-1]:.2f}')
+        return '\n'.join(lines)
+
+
+class SimulatedVacuum:
+    def __init__(self, device_id: str, local_key: str, stats: Stats, rate_limit: int = 0,
+                 verbose: bool = False):
+        self.device_id = device_id
+        self.cipher = tl.TuyaCipher(local_key)
+        self.stats = stats
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self.installed_id = 501
+        self.installed_version = BUILTIN_VERSIONS[501]
+        self.dps = {'158': 'mid'}  # DPS 162 is write-only: never part of status replies
+        self._seqno = 0
+        self._writers = set()
+
+    def log(self, msg: str) -> None:
+        if self.verbose:
+            print(f'[{time.strftime("%H:%M:%S")}] {self.device_id}: {msg}', flush=True)
+
+    def _frame(self, cmd: int, obj: dict | None, version_header: bool = False) -> bytes:
+        self._seqno += 1
+        payload = b''
+        if obj is not None:
+            raw = json.dumps(obj, separators=(',', ':')).encode()
+            payload = self.cipher.encode_payload(raw, version_header)
+        return tl.pack_frame(self._seqno, cmd, payload, retcode=0)
+
+    def _broadcast_status(self, dps: dict) -> None:
+        frame = self._frame(tl.CMD_STATUS, {'dps': dps, 't': int(time.time())}, version_header=True)
+        for w in list(self._writers):
+            if not w.is_closing():
+                w.write(frame)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        frames = tl.FrameReader(has_retcode=False)
+        try:
+            while data := await reader.read(4096):
+                for frame in frames.feed(data):
+                    await self._on_frame(frame, writer)
+        except (ConnectionError, ValueError) as e:
+            self.log(f'connection dropped: {e}')
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _on_frame(self, frame: tl.Frame, writer: asyncio.StreamWriter):
+        if frame.cmd == tl.CMD_HEART_BEAT:
+            writer.write(self._frame(tl.CMD_HEART_BEAT, None))
+        elif frame.cmd in (tl.CMD_DP_QUERY, tl.CMD_DP_QUERY_NEW):
+            writer.write(self._frame(frame.cmd, {'devId': self.device_id, 'dps': self.dps}))
+        elif frame.cmd in (tl.CMD_CONTROL, tl.CMD_CONTROL_NEW):
+            request = json.loads(self.cipher.decode_payload(frame.payload))
+            dps = request.get('dps', {})
+            writer.write(self._frame(frame.cmd, None))  # ACK
+            for key, value in dps.items():
+                if key == '162':
+                    asyncio.ensure_future(self._install(value))
+                else:
+                    self.dps[key] = value
+            other = {k: v for k, v in dps.items() if k != '162'}
+            if other:
+                self._broadcast_status(other)
+        else:
+            writer.write(self._frame(frame.cmd, None))
+        await writer.drain()
+
+    async def _install(self, value: str):
+        self.stats.pushes += 1
+        try:
+            req = parse_dps162_request(value)
+        except ValueError as e:  # dps_protobuf.DecodeError
+            self.log(f'undecodable DPS 162: {e}')
+            return
+        self.log(f"push set_id={req['set_id']} version={req['version']} url={req['url']}")
+
+        if req['set_id'] not in BUILTIN_VERSIONS:
+            self._finish(req, STATE_FAILED, 'unknown pack ID')
+            return
+        if req['set_id'] == self.installed_id and req['version'] <= self.installed_version:
+            # The real vacuum silently ignores versions that are not newer.
+            self.stats.ignored += 1
+            self.log('ignored: version not newer than installed')
+            return
+
+        with tempfile.TemporaryFile() as f:
+            t0 = time.monotonic()
+            try:
+                md5 = await http_download(req['url'], f, self.rate_limit)
+            except (OSError, RuntimeError, asyncio.TimeoutError, ValueError) as e:
+                self._finish(req, STATE_FAILED, f'download failed: {e}')
+                return
+            elapsed = time.monotonic() - t0
+            self.stats.download_times.append(elapsed)
+            size = f.tell()
+            if size != req['size']:
+                self._finish(req, STATE_FAILED, f"size {size} != {req['size']}")
+                return
+            if md5 != req['md5'].lower():
+                self._finish(req, STATE_FAILED, f"md5 {md5} != {req['md5']}")
+                return
+            try:
+                f.seek(0)
+                with zipfile.ZipFile(f) as zf:
+                    error = check_pack(zf, req['set_id'], req['version'])
+            except zipfile.BadZipFile as e:
+                error = f'bad zip: {e}'
+        if error:
+            self._finish(req, STATE_FAILED, error)
+            return
+        self.installed_id, self.installed_version = req['set_id'], req['version']
+        self._finish(req, STATE_OK, f'installed ({size} bytes in {elapsed:.2f}s)')
+
+    def _finish(self, req: dict, state: int, detail: str):
+        if state == STATE_OK:
+            self.stats.installed += 1
+        else:
+            self.stats.failed += 1
+        self.log(f'state {state}: {detail}')
+        status = build_dps162_status(self.installed_id, self.installed_version,
+                                     req['set_id'], state)
+        self._broadcast_status({'162': status})
+
+
+async def run(args):
+    stats = Stats()
+    base_ip = ipaddress.ip_address(args.bind)
+    servers, rows = [], []
+    for i in range(args.count):
+        ip = str(base_ip + i) if args.spread == 'ip' else args.bind
+        port = args.port + i if args.spread == 'port' else args.port
+        device_id = f'{args.id_prefix}{i:06d}'
+        local_key = args.local_key or hashlib.md5(device_id.encode()).hexdigest()[:16]
+        vac = SimulatedVacuum(device_id, local_key, stats, args.rate_limit * 1024, args.verbose)
+        servers.append(await asyncio.start_server(vac.handle, ip, port, backlog=256))
+        rows.append({'name': f'sim{i}', 'device_id': device_id, 'ip': ip,
+                     'local_key': local_key, 'port': port})
+
+    if args.inventory:
+        with open(args.inventory, 'w', newline='') as f:
+            w = csv.DictWriter(f, fieldnames=['name', 'device_id', 'ip', 'local_key', 'port'])
+            w.writeheader()
+            w.writerows(rows)
+        print(f'Wrote inventory for {len(rows)} devices to {args.inventory}')
+
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, main_task.cancel)
+
+    first, last = rows[0], rows[-1]
+    print(f"Simulating {args.count} vacuums on {first['ip']}:{first['port']} .. "
+          f"{last['ip']}:{last['port']} (Ctrl+C to stop)")
+    try:
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+    except asyncio.CancelledError:
+        pass
+    finally:
+        print('\n' + stats.summary())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate Eufy L50 vacuums on the Tuya v3.3 local protocol.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('--count', type=int, default=1, help='Number of simulated vacuums (default: 1)')
+    parser.add_argument('--bind', default='127.0.1.1',
+                        help='First address to listen on (default: 127.0.1.1)')
+    parser.add_argument('--port', type=int, default=6668, help='Tuya port (default: 6668)')
+    parser.add_argument('--spread', choices=('ip', 'port'), default='ip',
+                        help='Give each device its own address (ip) or its own port (port)')
+    parser.add_argument('--local-key', default=None,
+                        help='Local key shared by all devices (default: a distinct key per device)')
+    parser.add_argument('--id-prefix', default='simvac', help='Device ID prefix (default: simvac)')
+    parser.add_argument('--rate-limit', type=int, default=0, metavar='KIB_S',
+                        help='Per-device download rate limit in KiB/s (default: unlimited)')
+    parser.add_argument('--inventory', default=None,
+                        help='Write a send_voice_pack.py --inventory CSV for the simulated fleet')
+    parser.add_argument('--verbose', action='store_true', help='Log every push and install')
+    args = parser.parse_args()
+
+    if args.local_key and len(args.local_key) != 16:
+        sys.exit('ERROR: --local-key must be 16 characters')
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        hint = ' (raise the open file limit with `ulimit -n`)' if e.errno == errno.EMFILE else ''
+        sys.exit(f'ERROR: {e}{hint}')
+
+
+if __name__ == '__main__':
+    main()
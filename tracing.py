@@ -0,0 +1,119 @@
+"""
+tracing.py — Opt-in timeline tracing in Chrome trace-event format.
+
+Used by build_voice_pack.py and send_voice_pack.py for their --trace flag.
+Spans are recorded as complete ("X") events and written as JSON that loads
+in chrome://tracing or https://ui.perfetto.dev.
+
+    tracing.enable('build_voice_pack')
+    with tracing.span('encode', code='W001'):
+        ...
+    tracing.write('trace.json')
+
+Tracing is off unless enable() is called; span() then returns a shared
+no-op context manager, so instrumented code costs one function call.
+
+Timestamps come from time.monotonic_ns(), which on Linux and macOS is a
+system-wide clock, so spans recorded in worker processes line up with the
+parent's. Workers call drain() to ship their events back with each result
+and the parent passes them to add_events().
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_events = []
+_named_threads = set()
+_lock = threading.Lock()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable(process_name: str | None = None) -> None:
+    """
+    Start a fresh trace in this process. Forked workers call this too, which
+    drops the events they inherited from the parent.
+    """
+    global _enabled
+    _enabled = True
+    with _lock:
+        _events.clear()
+        _named_threads.clear()
+    if process_name:
+        _metadata('process_name', process_name, tid=0)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _metadata(kind: str, name: str, tid: int) -> None:
+    with _lock:
+        _events.append({'name': kind, 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                        'args': {'name': name}})
+
+
+class _Span:
+    __slots__ = ('name', 'cat', 'args', 't0')
+
+    def __init__(self, name: str, cat: str, args: dict):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.t0 = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        t1 = time.monotonic_ns()
+        if exc_type is not None:
+            self.args['error'] = f'{exc_type.__name__}: {exc}'
+        tid = threading.get_native_id()
+        event = {'name': self.name, 'cat': self.cat, 'ph': 'X', 'ts': self.t0 / 1000,
+                 'dur': (t1 - self.t0) / 1000, 'pid': os.getpid(), 'tid': tid}
+        if self.args:
+            event['args'] = self.args
+        with _lock:
+            _events.append(event)
+            new_thread = (os.getpid(), tid) not in _named_threads
+            _named_threads.add((os.getpid(), tid))
+        if new_thread:
+            _metadata('thread_name', threading.current_thread().name, tid)
+        return False
+
+
+def span(name: str, cat: str = '', **args):
+    """Context manager recording `name` as a span (no-op unless tracing is enabled)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def drain() -> list[dict]:
+    """Remove and return the events recorded so far (to ship them to another process)."""
+    global _events
+    if not _enabled:
+        return []
+    with _lock:
+        events, _events = _events, []
+    return events
+
+
+def add_events(events: list[dict]) -> None:
+    """Merge events recorded in another process."""
+    if events:
+        with _lock:
+            _events.extend(events)
+
+
+def write(path: str) -> int:
+    """Write the trace to `path` in Chrome trace-event JSON. Returns the number of spans."""
+    with _lock:
+        events = list(_events)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return sum(1 for e in events if e['ph'] == 'X')
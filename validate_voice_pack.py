@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+validate_voice_pack.py — Check a voice pack ZIP before pushing it to the vacuum.
+
+The vacuum silently rejects or mis-plays packs it does not like, and only
+says so (if at all) after a push. This reads the ZIP in place, without
+extracting it or running ffprobe, and checks:
+
+  - Layout: one <voice_name>/ folder holding config.yaml and main/*.mp3
+  - config.yaml: integer id and version, a known pack id whose folder name
+    matches, and optionally the id/version you are about to push
+  - Files: the 86 files the vacuum plays are all present (extra ones are
+    reported as warnings), and stored entries pass their CRC check
+  - Audio: every MPEG frame header is parsed; all frames must be MPEG-2
+    Layer III at 16 kHz, mono, 16 kbps CBR, with a non-zero duration
+
+A LAME/ffmpeg "Info" tag frame at the start of a file is recognized and
+excluded from the checks; a "Xing" or "VBRI" tag marks the file as VBR.
+A full pack validates in a few milliseconds.
+
+Usage:
+    python3 validate_voice_pack.py /tmp/my_voice/en_us_male.zip
+
+    # Also check the id/version you are about to push
+    python3 validate_voice_pack.py en_us_male.zip --pack-id 502 --pack-version 16
+
+    # Per-file details, or a machine-readable report
+    python3 validate_voice_pack.py en_us_male.zip --verbose
+    python3 validate_voice_pack.py en_us_male.zip --json report.json
+
+Exits 1 if any pack has errors.
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from typing import NamedTuple
+
+from build_voice_pack import MP3_BITRATE_KBPS, MP3_SAMPLE_RATE, VOICE_PACK_NAMES
+
+
+# The files the vacuum plays (see docs/voice_pack_format.md)
+PACK_FILES = (
+    'A0000', 'A0001', 'A0002', 'A0003', 'A0010', 'A0011', 'A0012', 'A0013', 'A0014', 'A0020',
+    'A0021', 'A0022', 'A0023', 'A0024', 'A0025', 'A0030', 'A0031', 'A0032', 'A0033', 'A0034',
+    'A0040', 'A0041', 'A0044', 'A0045', 'A0070', 'A0071', 'A0073', 'A0074', 'A0075', 'A0076',
+    'A0077', 'A0078', 'A0079', 'A0080', 'A0081', 'A0082', 'A0084', 'A0085', 'A0086', 'A0087',
+    'A0088', 'A0091', 'A1010', 'A1013', 'A2010', 'A2013', 'A2110', 'A2112', 'A2210', 'A2213',
+    'A2300', 'A2301', 'A2310', 'A2311', 'A3010', 'A3013', 'A3100', 'A3101', 'A4010', 'A4011',
+    'A4012', 'A4111', 'A4130', 'A5014', 'A5015', 'A5110', 'A5112', 'A6113', 'A6114', 'A6300',
+    'A6301', 'A6310', 'A6311', 'A7000', 'A7001', 'A7002', 'A7010', 'A7020', 'A7021', 'A7031',
+    'A7032', 'A7033', 'A7034', 'A7050', 'A7051', 'A7052',
+)
+
+# Prompts longer than this are reported as a warning
+MAX_PROMPT_SECONDS = 30.0
+
+
+# ---------------------------------------------------------------------------
+# MP3 frame headers
+# ---------------------------------------------------------------------------
+
+_VERSIONS = {0b11: '1', 0b10: '2', 0b00: '2.5'}          # 0b01 is reserved
+_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}                     # 0b00 is reserved
+_BITRATES_L3 = {
+    '1': (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    '2': (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    '1': (44100, 48000, 32000),
+    '2': (22050, 24000, 16000),
+    '2.5': (11025, 12000, 8000),
+}
+_CHANNEL_MODES = ('stereo', 'joint stereo', 'dual channel', 'mono')
+_HEADER = struct.Struct('>I')
+
+
+class Mp3Scan(NamedTuple):
+    frames: int              # audio frames (a leading Info/Xing/VBRI tag frame is not counted)
+    duration: float          # seconds
+    versions: set            # MPEG versions seen, e.g. {'2'}
+    sample_rates: set
+    channel_modes: set
+    bitrates: set            # kbps
+    tag: str | None          # 'Info', 'Xing' or 'VBRI' if the first frame is a tag frame
+    junk: int                # bytes between frames that are not part of any frame
+    truncated: bool          # last frame runs past the end of the data
+    error: str | None        # parsing stopped early (e.g. not Layer III)
+
+
+def _id3v2_size(data) -> int:
+    """Length of a leading ID3v2 tag (header, body and footer), or 0."""
+    if len(data) < 10 or bytes(data[:3]) != b'ID3':
+        return 0
+    size = 0
+    for b in data[6:10]:
+        size = (size << 7) | (b & 0x7F)  # syncsafe integer
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def scan_mp3(data) -> Mp3Scan:
+    """
+    Walk the MPEG audio frames of `data` (bytes or memoryview) by their
+    headers, without decoding any audio.
+    """
+    mv = memoryview(data)
+    end = len(mv)
+    if end >= 128 and bytes(mv[end - 128:end - 125]) == b'TAG':
+        end -= 128  # ID3v1 tag
+    pos = _id3v2_size(mv)
+    frames = samples = junk = 0
+    versions, rates, modes, bitrates = set(), set(), set(), set()
+    tag = error = None
+    truncated = False
+    rate = 0
+    first = True
+    while pos + 4 <= end:
+        h = _HEADER.unpack_from(mv, pos)[0]
+        version = _VERSIONS.get((h >> 19) & 3)
+        layer = _LAYERS.get((h >> 17) & 3)
+        br_index = (h >> 12) & 0xF
+        sr_index = (h >> 10) & 3
+        if (h & 0xFFE00000) != 0xFFE00000 or version is None or layer is None \
+                or br_index in (0, 15) or sr_index == 3:
+            # Lost sync: skip to the next 0xFF byte
+            nxt = bytes(mv[pos + 1:end]).find(b'\xff')
+            skip = end - pos if nxt < 0 else nxt + 1
+            junk += skip
+            pos += skip
+            continue
+        if layer != 3:
+            error = f'MPEG-{version} Layer {"I" * layer} frame at offset {pos} (Layer III required)'
+            break
+
+        kbps = _BITRATES_L3['1' if version == '1' else '2'][br_index]
+        rate = _SAMPLE_RATES[version][sr_index]
+        mode = (h >> 6) & 3
+        per_frame = 1152 if version == '1' else 576
+        size = (144 if version == '1' else 72) * kbps * 1000 // rate + ((h >> 9) & 1)
+        if pos + size > end:
+            truncated = True
+            break
+
+        if first:
+            first = False
+            side_info = (17 if mode == 3 else 32) if version == '1' else (9 if mode == 3 else 17)
+            offset = pos + 4 + (0 if h & 0x10000 else 2) + side_info
+            marker = bytes(mv[offset:offset + 4])
+            if marker in (b'Info', b'Xing'):
+                tag = marker.decode()
+            elif bytes(mv[pos + 36:pos + 40]) == b'VBRI':
+                tag = 'VBRI'
+            if tag:
+                pos += size
+                continue  # tag frames carry no audio and often a different bitrate
+
+        frames += 1
+        samples += per_frame
+        versions.add(version)
+        rates.add(rate)
+        modes.add(_CHANNEL_MODES[mode])
+        bitrates.add(kbps)
+        pos += size
+
+    return Mp3Scan(frames, samples / rate if rate else 0.0, versions, rates, modes, bitrates,
+                   tag, junk, truncated, error)
+
+
+def check_mp3(scan: Mp3Scan) -> tuple[list[str], list[str]]:
+    """(errors, warnings) for one scanned file against the format the vacuum plays."""
+    errors, warnings = [], []
+    if scan.error:
+        errors.append(scan.error)
+    if not scan.frames:
+        errors.append('no MPEG audio frames')
+        return errors, warnings
+    if scan.versions != {'2'}:
+        errors.append(f'MPEG version {"/".join(sorted(scan.versions))} (MPEG-2 required)')
+    if scan.sample_rates != {MP3_SAMPLE_RATE}:
+        errors.append(f'sample rate {"/".join(map(str, sorted(scan.sample_rates)))} Hz '
+                      f'({MP3_SAMPLE_RATE} required)')
+    if scan.channel_modes != {'mono'}:
+        errors.append(f'channel mode {"/".join(sorted(scan.channel_modes))} (mono required)')
+    if len(scan.bitrates) > 1 or scan.tag in ('Xing', 'VBRI'):
+        errors.append(f'variable bitrate {min(scan.bitrates)}-{max(scan.bitrates)} kbps'
+                      f'{f" ({scan.tag} header)" if scan.tag in ("Xing", "VBRI") else ""} '
+                      f'({MP3_BITRATE_KBPS} kbps CBR required)')
+    elif scan.bitrates != {MP3_BITRATE_KBPS}:
+        errors.append(f'bitrate {next(iter(scan.bitrates))} kbps ({MP3_BITRATE_KBPS} required)')
+    if scan.duration > MAX_PROMPT_SECONDS:
+        warnings.append(f'{scan.duration:.1f}s long')
+    if scan.junk:
+        warnings.append(f'{scan.junk} bytes of non-audio data between frames')
+    if scan.truncated:
+        warnings.append('last frame is truncated')
+    return errors, warnings
+
+
+# ---------------------------------------------------------------------------
+# Pack
+# ---------------------------------------------------------------------------
+
+_CONFIG_LINE_RE = re.compile(r'^\s*(\w+)\s*:\s*(.*?)\s*$')
+
+
+class PackReport(NamedTuple):
+    path: str
+    voice_name: str | None
+    pack_id: int | None
+    version: int | None
+    files: dict              # code -> {'bytes', 'frames', 'seconds', 'errors', 'warnings'}
+    errors: list[str]
+    warnings: list[str]
+    seconds: float           # time taken to validate
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not any(f['errors'] for f in self.files.values())
+
+    def to_dict(self) -> dict:
+        d = self._asdict()
+        d['ok'] = self.ok
+        return d
+
+
+def parse_config(text: str) -> dict[str, str]:
+    """The `key: value` lines of config.yaml (the vacuum's format is flat)."""
+    config = {}
+    for line in text.splitlines():
+        m = _CONFIG_LINE_RE.match(line)
+        if m and not line.lstrip().startswith('#'):
+            config[m.group(1)] = m.group(2)
+    return config
+
+
+def _entry_data(buf: memoryview, info: zipfile.ZipInfo, zf: zipfile.ZipFile):
+    """An entry's contents: a view into `buf` for stored entries, else decompressed bytes."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return zf.read(info)
+    offset = info.header_offset
+    if bytes(buf[offset:offset + 4]) != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f'bad local header for {info.filename}')
+    name_len, extra_len = struct.unpack_from('<HH', buf, offset + 26)
+    start = offset + 30 + name_len + extra_len
+    data = buf[start:start + info.file_size]
+    if len(data) != info.file_size:
+        raise zipfile.BadZipFile(f'{info.filename} runs past the end of the file')
+    if zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f'CRC mismatch in {info.filename}')
+    return data
+
+
+def validate_pack(path: str, pack_id: int | None = None, version: int | None = None,
+                  files: tuple[str, ...] = PACK_FILES) -> PackReport:
+    """
+    Validate the voice pack ZIP at `path`. `pack_id` and `version`, if given,
+    must match its config.yaml. `files` lists the codes that must be present.
+    """
+    t0 = time.perf_counter()
+    errors, warnings, results = [], [], {}
+    voice_name = found_id = found_version = None
+
+    def report():
+        return PackReport(path, voice_name, found_id, found_version, results, errors, warnings,
+                          time.perf_counter() - t0)
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    buf = memoryview(data)
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(data))  # BytesIO shares `data` rather than copying it
+    except zipfile.BadZipFile as e:
+        errors.append(f'not a ZIP file: {e}')
+        return report()
+
+    with zf:
+        infos = [i for i in zf.infolist() if not i.is_dir()]
+        tops = {i.filename.split('/', 1)[0] for i in infos}
+        if len(tops) != 1 or any('/' not in i.filename for i in infos):
+            errors.append(f'expected a single <voice_name>/ folder at the top, '
+                          f'found {", ".join(sorted(tops)) or "nothing"}')
+            return report()
+        voice_name = tops.pop()
+
+        names = {i.filename: i for i in infos}
+        config_info = names.pop(f'{voice_name}/config.yaml', None)
+        if config_info is None:
+            errors.append(f'{voice_name}/config.yaml is missing')
+        else:
+            config = parse_config(zf.read(config_info).decode('utf-8', 'replace'))
+            for key in ('id', 'version'):
+                value = config.get(key)
+                if value is None:
+                    errors.append(f'config.yaml has no {key}')
+                elif not value.isdigit():
+                    errors.append(f'config.yaml {key} is not an integer: {value!r}')
+            found_id = int(config['id']) if config.get('id', '').isdigit() else None
+            found_version = int(config['version']) if config.get('version', '').isdigit() else None
+            if found_id is not None:
+                if found_id not in VOICE_PACK_NAMES:
+                    warnings.append(f'id {found_id} is not a known voice pack id '
+                                    f'({", ".join(map(str, VOICE_PACK_NAMES))}); '
+                                    f'the vacuum rejects ids it does not know')
+                elif VOICE_PACK_NAMES[found_id] != voice_name:
+                    errors.append(f'folder {voice_name}/ does not match id {found_id} '
+                                  f'({VOICE_PACK_NAMES[found_id]}/)')
+            if pack_id is not None and found_id not in (None, pack_id):
+                errors.append(f'config.yaml id is {found_id}, expected {pack_id}')
+            if version is not None and found_version not in (None, version):
+                errors.append(f'config.yaml version is {found_version}, expected {version}')
+
+        prefix = f'{voice_name}/main/'
+        for name, info in sorted(names.items()):
+            code, ext = os.path.splitext(name[len(prefix):])
+            if not name.startswith(prefix) or '/' in code or ext != '.mp3':
+                warnings.append(f'unexpected file {name}')
+                continue
+            entry = {'bytes': info.file_size, 'frames': 0, 'seconds': 0.0,
+                     'errors': [], 'warnings': []}
+            results[code] = entry
+            if info.compress_type != zipfile.ZIP_STORED:
+                entry['warnings'].append('compressed in the ZIP (stock packs store MP3s)')
+            try:
+                data = _entry_data(buf, info, zf)
+            except (zipfile.BadZipFile, zlib.error) as e:
+                entry['errors'].append(str(e))
+                continue
+            scan = scan_mp3(data)
+            entry['frames'] = scan.frames
+            entry['seconds'] = round(scan.duration, 3)
+            entry['errors'], more = check_mp3(scan)
+            entry['warnings'] += more
+
+    missing = sorted(set(files) - set(results))
+    extra = sorted(set(results) - set(files))
+    if missing:
+        errors.append(f'{len(missing)} of {len(files)} files missing: {", ".join(missing)}')
+    if extra:
+        warnings.append(f'{len(extra)} files the vacuum does not play: {", ".join(extra)}')
+    return report()
+
+
+def print_report(report: PackReport, verbose: bool = False) -> None:
+    audio = sum(f['seconds'] for f in report.files.values())
+    status = 'OK' if report.ok else 'FAILED'
+    print(f'{report.path}: {status}  ({report.voice_name or "?"}, id {report.pack_id}, '
+          f'version {report.version}, {len(report.files)} MP3s, {audio:.1f}s of audio, '
+          f'validated in {report.seconds * 1000:.1f} ms)')
+    for msg in report.errors:
+        print(f'  ERROR: {msg}')
+    for code, f in sorted(report.files.items()):
+        for msg in f['errors']:
+            print(f'  ERROR: {code}.mp3: {msg}')
+    for msg in report.warnings:
+        print(f'  warning: {msg}')
+    for code, f in sorted(report.files.items()):
+        for msg in f['warnings']:
+            print(f'  warning: {code}.mp3: {msg}')
+    if verbose:
+        for code, f in sorted(report.files.items()):
+            print(f'    {code}.mp3  {f["bytes"]:>7} bytes  {f["frames"]:>5} frames  {f["seconds"]:>6.2f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Validate Eufy L50 voice pack ZIPs without extracting them.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument('zips', nargs='+', metavar='ZIP', help='Voice pack ZIP(s) to validate')
+    parser.add_argument('--pack-id', type=int, help='Expected id in config.yaml')
+    parser.add_argument('--pack-version', type=int, help='Expected version in config.yaml')
+    parser.add_argument('--verbose', '-v', action='store_true', help='List every MP3')
+    parser.add_argument('--json', metavar='OUT_JSON', help='Also write the reports as JSON')
+    args = parser.parse_args()
+
+    reports = []
+    for path in args.zips:
+        if not os.path.isfile(path):
+            sys.exit(f"ERROR: not found: {path}")
+        report = validate_pack(path, args.pack_id, args.pack_version)
+        print_report(report, args.verbose)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([r.to_dict() for r in reports], f, indent=2)
+        print(f'Wrote {args.json}')
+    if not all(r.ok for r in reports):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()